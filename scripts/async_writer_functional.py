@@ -0,0 +1,70 @@
+# นำเข้า threading สำหรับ semaphore ที่จำกัดจำนวนงานค้าง
+import threading
+# นำเข้า queue สำหรับส่งข้อความผลลัพธ์กลับไปยัง thread หลัก
+import queue
+# นำเข้า thread pool สำหรับเข้ารหัสและเขียนไฟล์เบื้องหลัง
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncSampleWriter:
+    """
+    ขั้นตอนเขียนไฟล์แบบ asynchronous: ส่งงานเข้ารหัสภาพและเขียนไฟล์ไปทำบน thread pool
+    เพื่อให้การสร้างภาพถัดไปทำไปพร้อมกับ I/O ของภาพก่อนหน้า
+
+    - write_fn: ฟังก์ชันที่เขียนหนึ่ง sample และคืนค่าข้อความ log (เช่น "✅ ..." หรือ "❌ ...")
+    - threads: จำนวน thread ที่เขียนไฟล์ (0 = เขียนทันทีใน thread ที่เรียก submit)
+    - max_pending: จำนวนงานค้างสูงสุด ถ้าเต็ม submit จะรอจนกว่าจะมีงานเสร็จ (back-pressure)
+
+    ข้อความ log ถูกเก็บไว้ให้ thread หลักดึงด้วย drain()/close() เพราะ log_callback
+    ของ Streamlit ต้องถูกเรียกจาก thread หลักเท่านั้น
+    """
+
+    def __init__(self, write_fn, threads=2, max_pending=8):
+        self._write_fn = write_fn
+        self._messages = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+
+    def _run(self, args):
+        # เขียนหนึ่ง sample แล้วเก็บข้อความผลลัพธ์ (รวมถึง error) ไว้ให้ thread หลัก
+        try:
+            self._messages.put(self._write_fn(*args))
+        except Exception as e:
+            self._messages.put(f"❌ Error while writing: {e}\n")
+        finally:
+            self._slots.release()
+
+    def submit(self, *args):
+        """
+        ส่งงานเขียนหนึ่ง sample (รอถ้างานค้างเต็ม max_pending)
+        """
+        self._slots.acquire()
+        if self._executor is None:
+            self._run(args)
+        else:
+            self._executor.submit(self._run, args)
+
+    def drain(self):
+        """
+        ดึงข้อความของงานที่เขียนเสร็จแล้วทั้งหมด (ไม่รอ)
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self._messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self):
+        """
+        รอให้งานที่ค้างเขียนเสร็จทั้งหมด ปิด thread pool แล้วคืนค่าข้อความที่เหลือ
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        return self.drain()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,210 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า json สำหรับไฟล์ index ของภาพพื้นหลัง
+import json
+# นำเข้า OpenCV library สำหรับอ่านภาพพื้นหลัง
+import cv2
+# นำเข้า NumPy library สำหรับการคำนวณทางคณิตศาสตร์
+import numpy as np
+# นำเข้า water mask และพารามิเตอร์ของ mask
+from water_mask_functional import get_water_mask, water_mask_key, water_mask_params_hash, MASK_SCALE
+# นำเข้าการตรวจตำแหน่งวางด้วย integral image และช่วง scale ของฟีเจอร์
+from placement_functional import SCALE_RANGE
+
+# ชื่อไฟล์ index ในโฟลเดอร์ backgrounds: ชื่อไฟล์ -> สัดส่วนน้ำ + ขนาดสี่เหลี่ยมน้ำล้วนที่วางฟีเจอร์ได้
+BACKGROUND_INDEX_NAME = ".background_index.json"
+
+# อัตราส่วนระหว่างความสูงที่ติดกันที่ตรวจหาสี่เหลี่ยมน้ำล้วน (ยิ่งใกล้ 1 ยิ่งละเอียดแต่คำนวณนานขึ้น)
+WATER_RECT_HEIGHT_RATIO = 1.06
+
+def longest_row_run(rows):
+    """
+    ความยาวของช่วง True ที่ต่อเนื่องยาวที่สุดในแถวใดแถวหนึ่งของ boolean array 2 มิติ
+    """
+    padded = np.zeros((rows.shape[0], rows.shape[1] + 2), np.int8)
+    padded[:, 1:-1] = rows
+    # จุดเริ่ม (+1) และจุดจบ (-1) ของทุกช่วงเรียงตามแถวแล้วตามคอลัมน์ จึงจับคู่กันได้ตามลำดับ
+    edges = np.diff(padded, axis=1)
+    starts, ends = np.nonzero(edges == 1)[1], np.nonzero(edges == -1)[1]
+    return int((ends - starts).max()) if len(starts) else 0
+
+def water_rectangles(water_mask):
+    """
+    ขนาดของสี่เหลี่ยมที่เป็นน้ำทั้งหมด (หน่วยช่องของ mask) สำหรับตรวจว่าฟีเจอร์ขนาดหนึ่งวางได้แน่นอน
+    คืนค่า list ของ [height, width]: ที่ความสูง height มีสี่เหลี่ยมน้ำล้วนกว้างที่สุด width
+    (ตรวจความสูงแบบเรขาคณิต ดู WATER_RECT_HEIGHT_RATIO) ฟีเจอร์ที่ขนาดในช่อง mask ไม่เกินคู่ใดคู่หนึ่ง
+    มีตำแหน่งที่ผ่านเงื่อนไขของ sample_water_position เสมอ (น้ำ 100% และมุมซ้ายบนอยู่บนน้ำ)
+    และขนาดที่เล็กลงก็ยังวางได้ จึงใช้กับฟีเจอร์ทุกสัดส่วน (เช่นฟีเจอร์ยาวบนน้ำที่เป็นแนวแคบ)
+    คืนค่า list ว่างถ้าไม่มีน้ำเลย
+    """
+    water = water_mask > 0
+    # runs[y, x] = จำนวนพิกเซลน้ำที่ต่อเนื่องในแนวตั้งจนถึงแถว y
+    runs = np.zeros(water.shape, np.int32)
+    runs[0] = water[0]
+    for y in range(1, water.shape[0]):
+        runs[y] = (runs[y - 1] + 1) * water[y]
+    rectangles = []
+    height = 1
+    while height <= water.shape[0]:
+        # สี่เหลี่ยมน้ำล้วนสูง height = ช่วงในแถวเดียวกันที่ทุกคอลัมน์มีน้ำต่อเนื่องขึ้นไปอย่างน้อย height
+        width = longest_row_run(runs >= height)
+        if width == 0:
+            break
+        rectangles.append([height, width])
+        if height == water.shape[0]:
+            break
+        # ความสูงถัดไป (ตรวจความสูงเต็ม mask เสมอ ไม่ให้ข้ามไปเพราะอัตราส่วน)
+        height = min(max(height + 1, int(height * WATER_RECT_HEIGHT_RATIO)), water.shape[0])
+    # เก็บเฉพาะคู่ที่ไม่ถูกคู่ที่สูงกว่าครอบ (ความกว้างลดลงเมื่อสูงขึ้น คู่ที่กว้างเท่าคู่ถัดไปจึงไม่จำเป็น)
+    return [rect for rect, taller in zip(rectangles, rectangles[1:] + [[0, 0]]) if taller[1] < rect[1]]
+
+def compute_background_entry(bg_path, mask_cache_dir=None, mask_scale=MASK_SCALE):
+    """
+    คำนวณข้อมูลความเหมาะสมของภาพพื้นหลังหนึ่งภาพจาก water mask (ใช้ mask จาก cache ถ้ามี)
+    - image_size / mask_size: [width, height] ของภาพและของ mask
+    - water_fraction: สัดส่วนพิกเซลน้ำ (0-1)
+    - water_rects: ขนาดสี่เหลี่ยมน้ำล้วน [height, width] (หน่วยช่องของ mask ดู water_rectangles)
+    คืนค่า dict หรือ None ถ้าอ่านภาพไม่ได้
+    """
+    background = cv2.imread(bg_path)
+    if background is None:
+        return None
+    water_mask = get_water_mask(bg_path, background, cache_dir=mask_cache_dir, scale=mask_scale)
+    return {
+        "image_size": [background.shape[1], background.shape[0]],
+        "mask_size": [water_mask.shape[1], water_mask.shape[0]],
+        "water_fraction": round(float(np.count_nonzero(water_mask)) / water_mask.size, 4),
+        "water_rects": water_rectangles(water_mask),
+        "mask_key": water_mask_key(bg_path, scale=mask_scale),
+    }
+
+def load_background_index(backgrounds_path, mask_scale=MASK_SCALE):
+    """
+    โหลด index ของโฟลเดอร์ backgrounds: dict ของ ชื่อไฟล์ -> entry
+    เฉพาะ entry ที่ไฟล์ไม่เปลี่ยน (ขนาด/เวลาแก้ไข) และคำนวณจาก mask พารามิเตอร์เดียวกัน
+    คืนค่า dict ว่างถ้ายังไม่มีหรือไฟล์เสียหาย
+    """
+    try:
+        with open(os.path.join(backgrounds_path, BACKGROUND_INDEX_NAME), "r", encoding="utf-8") as f:
+            backgrounds = json.load(f).get("backgrounds", {})
+    except (OSError, ValueError):
+        return {}
+    params_hash = water_mask_params_hash(scale=mask_scale)
+    index = {}
+    for name, entry in backgrounds.items():
+        try:
+            stat = os.stat(os.path.join(backgrounds_path, name))
+        except OSError:
+            continue
+        # entry รุ่นเก่าที่ไม่มี water_rects ถูกคำนวณใหม่
+        if ([stat.st_size, stat.st_mtime_ns] == entry.get("stat") and entry.get("mask_key", "").endswith(params_hash)
+                and "water_rects" in entry):
+            index[name] = entry
+    return index
+
+def update_background_index(backgrounds_path, mask_cache_dir=None, mask_scale=MASK_SCALE, log_callback=None):
+    """
+    สร้างหรืออัปเดต index ของภาพพื้นหลัง (.background_index.json ในโฟลเดอร์ backgrounds) แบบ incremental
+    คำนวณใหม่เฉพาะภาพใหม่ ภาพที่เปลี่ยน หรือเมื่อพารามิเตอร์ของ mask เปลี่ยน และลบ entry ของภาพที่ถูกลบ
+    คืนค่า dict ของ ชื่อไฟล์ -> entry
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg + "\n")
+        else: print(msg)
+
+    index = load_background_index(backgrounds_path, mask_scale)
+    updated = 0
+    names = [f for f in sorted(os.listdir(backgrounds_path)) if f.endswith(".jpg")]
+    for name in names:
+        if name in index:
+            continue
+        bg_path = os.path.join(backgrounds_path, name)
+        entry = compute_background_entry(bg_path, mask_cache_dir, mask_scale)
+        if entry is None:
+            log(f"⚠️ ข้ามภาพพื้นหลังที่อ่านไม่ได้: {name}")
+            continue
+        stat = os.stat(bg_path)
+        entry["stat"] = [stat.st_size, stat.st_mtime_ns]
+        index[name] = entry
+        updated += 1
+    index = {name: index[name] for name in names if name in index}
+
+    # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+    index_path = os.path.join(backgrounds_path, BACKGROUND_INDEX_NAME)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"backgrounds": index}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temp_path, index_path)
+    if updated:
+        log(f"🗂️ อัปเดต background index: {updated} ภาพ (ทั้งหมด {len(index)})")
+    return index
+
+def max_feature_scale(entry, feature_width, feature_height):
+    """
+    scale ใหญ่สุดของฟีเจอร์ขนาด feature_width x feature_height ที่ยังวางบนพื้นหลังนี้ได้แน่นอน
+    (ขนาดหลังแปลงเป็นช่องของ mask ต้องไม่เกินสี่เหลี่ยมน้ำล้วนคู่ใดคู่หนึ่งใน water_rects และไม่เกินขนาดภาพ)
+    ทุก scale ที่เล็กกว่านี้ก็วางได้ คืนค่า 0 ถ้าไม่มีน้ำเลย
+    """
+    image_width, image_height = entry["image_size"]
+    cell_x = image_width / entry["mask_size"][0]
+    cell_y = image_height / entry["mask_size"][1]
+    best = 0.0
+    for height, width in entry["water_rects"]:
+        # sample_water_position ปัดขนาดฟีเจอร์เป็นจำนวนช่องของ mask (round) จึงรับได้ถึง width + 0.5 ช่อง
+        # (ลบหนึ่งพิกเซลเผื่อการปัดขนาดของ scaled_size)
+        limit_x = min((width + 0.5) * cell_x - 1, image_width)
+        limit_y = min((height + 0.5) * cell_y - 1, image_height)
+        best = max(best, min(limit_x / feature_width, limit_y / feature_height))
+    return best
+
+def build_placement_plan(backgrounds, feature_sizes, background_index, weight_by_area=False, scale_range=SCALE_RANGE,
+                         scale_margin=0.0):
+    """
+    เตรียมตารางชุด (พื้นหลัง, ฟีเจอร์) ที่วางได้จริงสำหรับ sample_placement
+    - backgrounds: list ของ path ภาพพื้นหลัง, feature_sizes: list ของ (width, height) ของฟีเจอร์ที่จะ render
+    - background_index: dict จาก load_background_index (พื้นหลังที่ไม่มีใน index ถือว่าวางได้ทุกฟีเจอร์)
+    - weight_by_area: สุ่มพื้นหลังตามพื้นที่น้ำ (พิกเซล) แทนการสุ่มเท่ากันทุกภาพ
+    - scale_margin: ลด scale ใหญ่สุดลงเท่านี้ (เช่นครึ่งหนึ่งของ grid ของ sprite bank ซึ่งปัด scale ขึ้นได้)
+    ทุก scale ในช่วงที่ได้จากตารางวางบนพื้นหลังที่มีใน index ได้เสมอ ภาพแรกของทุก index จึงวางได้ในครั้งแรก
+    คืนค่า dict ของ NumPy array หรือ None ถ้าไม่มีชุดไหนวางได้เลย
+    """
+    sizes = np.asarray(feature_sizes, np.float64).reshape(-1, 2)
+    max_scales = np.full((len(backgrounds), len(sizes)), scale_range[1], np.float64)
+    weights = np.full(len(backgrounds), np.nan)
+    for b, bg_path in enumerate(backgrounds):
+        entry = background_index.get(os.path.basename(bg_path))
+        if entry is None:
+            continue
+        max_scales[b] = [max_feature_scale(entry, width, height) - scale_margin for width, height in sizes]
+        weights[b] = entry["water_fraction"] * entry["image_size"][0] * entry["image_size"][1]
+    # พื้นหลังที่ยังไม่มีใน index ใช้น้ำหนักเฉลี่ยของภาพอื่น
+    weights[np.isnan(weights)] = np.nanmean(weights) if not np.isnan(weights).all() else 1.0
+    feasible = max_scales >= scale_range[0]
+    usable = feasible.any(axis=1) & (weights > 0)
+    if not usable.any():
+        return None
+    weights = (weights if weight_by_area else np.ones(len(backgrounds))) * usable
+    return {
+        "feasible": feasible,
+        "max_scales": np.minimum(max_scales, scale_range[1]),
+        "probabilities": weights / weights.sum(),
+        "scale_range": scale_range,
+    }
+
+def sample_feature_for_background(plan, b, rng):
+    """
+    สุ่ม (index ของฟีเจอร์, ช่วง scale) จากฟีเจอร์ที่วางบนพื้นหลังลำดับที่ b ได้
+    (ใช้กับวัตถุชิ้นถัดไปในภาพเดียวกันที่พื้นหลังถูกเลือกไว้แล้ว)
+    """
+    candidates = np.flatnonzero(plan["feasible"][b])
+    f = int(candidates[rng.integers(len(candidates))])
+    return f, (plan["scale_range"][0], float(plan["max_scales"][b, f]))
+
+def sample_placement(plan, rng):
+    """
+    สุ่ม (index ของพื้นหลัง, index ของฟีเจอร์, ช่วง scale) จากชุดที่วางได้ใน plan
+    ช่วง scale ถูกตัดให้ไม่เกิน scale ใหญ่สุดที่วางบนพื้นหลังนั้นได้
+    """
+    b = int(rng.choice(len(plan["probabilities"]), p=plan["probabilities"]))
+    return (b, *sample_feature_for_background(plan, b, rng))
@@ -0,0 +1,203 @@
+import os
+import time
+import tempfile
+import tracemalloc
+import cv2
+import numpy as np
+from generate_synthetic_functional import overlay_feature, get_true_bbox_from_alpha
+from water_mask_functional import detect_water_area
+from placement_functional import sample_water_position, compute_water_integral, render_feature, rendered_bbox, MIN_WATER_COVERAGE
+from feature_index_functional import rotation_safe_crop
+from matting_functional import matting_cutout, MATTING_TIERS
+from image_cache_functional import load_image, clear_image_cache
+from prefetch_functional import prefetch_iter, get_prefetch_stats, reset_prefetch_stats
+from PIL import Image
+
+def overlay_feature_loop(background, feature, x, y):
+    """
+    overlay_feature แบบเดิม (วนลูปทีละพิกเซล + hard cut ที่ alpha > 0) ใช้เป็นฐานเปรียบเทียบ
+    """
+    fg_height, fg_width, _ = feature.shape
+    overlay = background.copy()
+    for i in range(fg_height):
+        for j in range(fg_width):
+            if feature[i, j, 3] > 0:
+                overlay[y + i, x + j] = feature[i, j, :3]
+    return overlay
+
+def make_test_images(bg_size=(3000, 4000), fg_size=(600, 600)):
+    """
+    สร้างภาพพื้นหลังและฟีเจอร์ (วงรีโปร่งใสขอบนุ่ม) แบบสุ่มสำหรับใช้ทดสอบความเร็ว
+    """
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (bg_size[0], bg_size[1], 3), dtype=np.uint8)
+    feature = rng.integers(0, 256, (fg_size[0], fg_size[1], 4), dtype=np.uint8)
+    alpha = np.zeros(fg_size, np.uint8)
+    cv2.ellipse(alpha, (fg_size[1] // 2, fg_size[0] // 2), (fg_size[1] // 3, fg_size[0] // 4), 30, 0, 360, 255, -1)
+    feature[:, :, 3] = cv2.GaussianBlur(alpha, (15, 15), 0)
+    return background, feature
+
+def time_call(func, repeats):
+    """
+    จับเวลาเฉลี่ยต่อครั้ง (วินาที) ของ func
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats
+
+def benchmark_overlay(bg_size=(3000, 4000), fg_size=(600, 600), repeats=20):
+    """
+    เปรียบเทียบเวลา composite ต่อภาพ ระหว่างลูปแบบเดิมกับ overlay_feature แบบ vectorized
+    """
+    background, feature = make_test_images(bg_size, fg_size)
+    x, y = bg_size[1] // 3, bg_size[0] // 3
+
+    loop_time = time_call(lambda: overlay_feature_loop(background, feature, x, y), 1)
+    copy_time = time_call(lambda: overlay_feature(background, feature, x, y), repeats)
+    work = background.copy()
+    in_place_time = time_call(lambda: overlay_feature(work, feature, x, y, in_place=True), repeats)
+
+    print(f"overlay {fg_size[1]}x{fg_size[0]} บนพื้นหลัง {bg_size[1]}x{bg_size[0]}")
+    print(f"  ลูปแบบเดิม        : {loop_time * 1000:9.2f} ms")
+    print(f"  vectorized (copy) : {copy_time * 1000:9.2f} ms  (เร็วขึ้น {loop_time / copy_time:.0f}x)")
+    print(f"  vectorized (in-place): {in_place_time * 1000:6.2f} ms  (เร็วขึ้น {loop_time / in_place_time:.0f}x)")
+
+def make_water_background(bg_size=(3000, 4000)):
+    """
+    สร้างภาพพื้นหลังทดสอบ: พื้นสว่าง (ไม่ใช่น้ำ) มีบริเวณน้ำสีเข้มเป็นวงรีหลายวง + noise
+    """
+    rng = np.random.default_rng(1)
+    background = np.full((bg_size[0], bg_size[1], 3), 245, np.uint8)
+    for _ in range(12):
+        center = (int(rng.integers(bg_size[1])), int(rng.integers(bg_size[0])))
+        axes = (int(rng.integers(bg_size[1] // 10, bg_size[1] // 4)), int(rng.integers(bg_size[0] // 10, bg_size[0] // 4)))
+        cv2.ellipse(background, center, axes, float(rng.uniform(0, 180)), 0, 360, (70, 60, 20), -1)
+    noise = rng.integers(-8, 9, background.shape)
+    return np.clip(background.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+def benchmark_water_mask(bg_size=(3000, 4000), fg_size=(300, 300), scales=(1.0, 0.5, 0.25, 0.125), samples=200):
+    """
+    เปรียบเทียบเวลาคำนวณ water mask ที่ความละเอียดต่างๆ และความคลาดเคลื่อนของตำแหน่งวาง:
+    วัดสัดส่วนน้ำใต้ฟีเจอร์บน mask เต็มความละเอียด ณ ตำแหน่งที่สุ่มจาก mask ความละเอียดต่ำ
+    """
+    background = make_water_background(bg_size)
+    full_mask = detect_water_area(background)
+    full_integral = compute_water_integral(full_mask)
+    width, height = fg_size[1], fg_size[0]
+    full_time = time_call(lambda: detect_water_area(background), 3)
+    rng = np.random.default_rng(0)
+
+    print(f"water mask บนพื้นหลัง {bg_size[1]}x{bg_size[0]} ฟีเจอร์ {width}x{height}")
+    for scale in scales:
+        mask_time = time_call(lambda: detect_water_area(background, scale=scale), 3)
+        mask = detect_water_area(background, scale=scale)
+        integral = compute_water_integral(mask)
+        coverages = []
+        for _ in range(samples):
+            position = sample_water_position(mask, width, height, integral, rng=rng, image_size=(bg_size[1], bg_size[0]))
+            if position is None:
+                break
+            x, y = position
+            water = full_integral[y + height, x + width] - full_integral[y, x + width] - full_integral[y + height, x] + full_integral[y, x]
+            coverages.append(water / (width * height))
+        coverages = np.array(coverages)
+        below = np.mean(coverages < MIN_WATER_COVERAGE) * 100 if len(coverages) else float("nan")
+        print(f"  scale {scale:<5}: {mask_time * 1000:8.2f} ms  (เร็วขึ้น {full_time / mask_time:5.1f}x)"
+              f"  น้ำใต้ฟีเจอร์ต่ำสุด {coverages.min() if len(coverages) else float('nan'):.3f}"
+              f"  ต่ำกว่าเกณฑ์ {below:.1f}%")
+
+def make_matting_images(size=(1500, 2000)):
+    """
+    สร้างภาพทดสอบสำหรับ matting: ภาพ noise + mask วงรีขอบนุ่ม (แทน mask จากโมเดล)
+    """
+    rng = np.random.default_rng(2)
+    image = rng.integers(0, 256, (size[0], size[1], 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (9, 9), 0)
+    mask = np.zeros(size, np.uint8)
+    cv2.ellipse(mask, (size[1] // 2, size[0] // 2), (size[1] // 3, size[0] // 3), 20, 0, 360, 255, -1)
+    mask = cv2.GaussianBlur(mask, (31, 31), 0)
+    return Image.fromarray(image), Image.fromarray(mask)
+
+def benchmark_matting(size=(1500, 2000), tiers=MATTING_TIERS):
+    """
+    เปรียบเทียบเวลาและหน่วยความจำสูงสุด (tracemalloc) ของ alpha matting แต่ละระดับ
+    และความต่างของ alpha เทียบกับระดับ "full"
+    """
+    # เรียกครั้งแรกบนภาพเล็กเพื่อให้ numba ของ pymatting compile ก่อนจับเวลา
+    warm_image, warm_mask = make_matting_images((120, 160))
+    for tier in tiers:
+        matting_cutout(warm_image, warm_mask, tier)
+
+    image, mask = make_matting_images(size)
+    results = {}
+    print(f"alpha matting บนภาพ {size[1]}x{size[0]}")
+    for tier in tiers:
+        tracemalloc.start()
+        start = time.perf_counter()
+        cutout = matting_cutout(image, mask, tier)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[tier] = np.asarray(cutout)[:, :, 3].astype(np.int16)
+        print(f"  {tier:<10}: {elapsed:8.2f} s  หน่วยความจำสูงสุด {peak / (1 << 20):8.1f} MB")
+    if "full" in results:
+        for tier, alpha in results.items():
+            print(f"  {tier:<10}: alpha ต่างจาก full เฉลี่ย {np.abs(alpha - results['full']).mean():.3f}")
+
+def benchmark_feature_index(canvas_size=(3000, 4000), object_size=(600, 600), samples=50):
+    """
+    เปรียบเทียบเวลา resize/หมุน + หา bounding box ต่อภาพ ระหว่างฟีเจอร์เต็ม canvas ที่สแกน alpha
+    กับภาพที่ crop ไว้ใน feature index ที่คำนวณ bbox จาก hull
+    """
+    _, sprite = make_test_images((16, 16), object_size)
+    feature = np.zeros((canvas_size[0], canvas_size[1], 4), np.uint8)
+    y, x = canvas_size[0] // 3, canvas_size[1] // 3
+    feature[y:y + object_size[0], x:x + object_size[1]] = sprite
+    coords = cv2.findNonZero(feature[:, :, 3])
+    crop, origin = rotation_safe_crop(feature, cv2.boundingRect(coords))
+    hull = cv2.convexHull(coords).reshape(-1, 2) - origin
+    rng = np.random.default_rng(0)
+    params = [(rng.uniform(0.4, 0.8), rng.uniform(0, 360)) for _ in range(samples)]
+
+    full_time = time_call(lambda: [get_true_bbox_from_alpha(render_feature(feature, s, a)) for s, a in params], 1) / samples
+    crop_time = time_call(lambda: [(render_feature(crop, s, a), rendered_bbox(hull, crop.shape, s, a)) for s, a in params], 1) / samples
+    print(f"ฟีเจอร์ {object_size[1]}x{object_size[0]} บน canvas {canvas_size[1]}x{canvas_size[0]} (crop {crop.shape[1]}x{crop.shape[0]})")
+    print(f"  canvas เต็ม + สแกน alpha : {full_time * 1000:8.2f} ms")
+    print(f"  crop + bbox จาก hull     : {crop_time * 1000:8.2f} ms  (เร็วขึ้น {full_time / crop_time:.1f}x)")
+
+def benchmark_prefetch(bg_size=(3000, 4000), num_images=12, depth=4, threads=2):
+    """
+    เปรียบเทียบเวลารวมของลูป ถอดรหัส JPEG + งานประมวลผลต่อภาพ (แทนการวางฟีเจอร์/overlay)
+    ระหว่างถอดรหัสในลูปตามลำดับ กับโหลดล่วงหน้าด้วย prefetch_iter และแสดงเวลาที่ลูปต้องรอ (stall)
+    """
+    background, _ = make_test_images(bg_size, (16, 16))
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, f"background_{i:03d}.jpg") for i in range(num_images)]
+        for path in paths:
+            cv2.imwrite(path, background)
+
+        def process(path):
+            # งานต่อภาพหลังถอดรหัส (ใช้ CPU ใกล้เคียงการ overlay + หา bbox)
+            cv2.GaussianBlur(load_image(path), (0, 0), 2)
+
+        clear_image_cache()
+        serial_time = time_call(lambda: [process(path) for path in paths], 1)
+        clear_image_cache()
+        reset_prefetch_stats()
+        prefetch_time = time_call(lambda: [process(path) for path in prefetch_iter(paths, load_image, depth, threads)], 1)
+        stats = get_prefetch_stats()
+    print(f"ถอดรหัส + ประมวลผลภาพ {bg_size[1]}x{bg_size[0]} จำนวน {num_images} ภาพ")
+    print(f"  ตามลำดับ                       : {serial_time:8.2f} s")
+    print(f"  prefetch (depth={depth}, threads={threads}) : {prefetch_time:8.2f} s  "
+          f"(รอ {stats['stalls']} ครั้ง {stats['stall_seconds']:.2f} s)")
+
+if __name__ == "__main__":
+    benchmark_overlay()
+    benchmark_water_mask()
+    benchmark_matting()
+    benchmark_feature_index()
+    benchmark_prefetch()
+
+# python benchmark_functional.py
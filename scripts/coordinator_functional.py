@@ -0,0 +1,333 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า json สำหรับข้อความระหว่าง coordinator กับ worker (หนึ่งบรรทัดต่อข้อความ)
+import json
+# นำเข้า socket สำหรับเชื่อมต่อ coordinator จาก worker
+import socket
+# นำเข้า socketserver สำหรับ TCP server ของ coordinator
+import socketserver
+# นำเข้า threading สำหรับ lock ของสถานะงานและ thread ต่ออายุ lease
+import threading
+# นำเข้า time สำหรับเวลาหมดอายุของ lease และการวัด throughput
+import time
+# นำเข้า deque สำหรับคิวชุดงานที่ยังไม่ถูกแจก
+from collections import deque
+# นำเข้าชื่อไฟล์ของภาพตามลำดับรวม
+from distributed_functional import sample_key
+
+# จำนวนภาพต่อชุดงานที่แจกให้ worker ครั้งละชุด
+COORDINATOR_CHUNK_SIZE = 32
+# เวลา (วินาที) ที่ lease หมดอายุถ้า worker ไม่ต่ออายุ (worker ที่ตายแล้วจะถูกนำชุดงานไปแจกใหม่)
+LEASE_TIMEOUT = 60.0
+# ช่วงเวลา (วินาที) ระหว่างรายงาน throughput ของ coordinator
+REPORT_INTERVAL = 10.0
+# เวลา (วินาที) ที่ worker รอก่อนของานใหม่เมื่อทุกชุดถูกแจกแล้วแต่ยังไม่เสร็จ
+WAIT_INTERVAL = 1.0
+# เวลา (วินาที) ที่ coordinator ยังเปิดรับหลังงานเสร็จ เพื่อบอก worker ที่รออยู่ว่างานจบแล้ว
+COORDINATOR_LINGER = 5.0
+# จำนวนครั้งที่ worker ลองเชื่อมต่อใหม่เมื่อ coordinator ไม่ตอบ
+CONNECT_RETRIES = 5
+# จำนวนครั้งสูงสุดที่แจกภาพที่สร้างไม่สำเร็จซ้ำ (ภาพที่ยังไม่สำเร็จหลังจากนี้ถูกบันทึกเป็น gaps)
+CHUNK_ATTEMPTS = 3
+
+def parse_address(address):
+    """
+    แปลง "host:port" หรือ (host, port) เป็น tuple (host, port)
+    """
+    if isinstance(address, str):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address[0], int(address[1])
+
+class GenerationCoordinator:
+    """
+    สถานะงานของ coordinator: แบ่งลำดับภาพ 1..num_images เป็นชุดละ chunk_size แล้วแจกให้ worker ตามที่ขอ
+    - lease: ชุดงานที่แจกไปแล้วมีเวลาหมดอายุ worker ต้องต่ออายุ (heartbeat) ระหว่างทำงาน
+      lease ที่หมดอายุ (worker ตาย/ค้าง) จะกลับเข้าคิวไปแจกให้ worker อื่น
+      ภาพแต่ละลำดับใช้ seed ของตัวเอง worker อื่นจึงสร้างชุดนั้นได้เหมือนเดิมทุกบิต
+    - fingerprint: worker แรกกำหนด fingerprint ของการรัน worker ที่ใช้ seed/input/พารามิเตอร์ต่างไปจะถูกปฏิเสธ
+    - ภาพในชุดที่ worker แจ้งว่าเขียนไม่สำเร็จจะเป็นชุดงานใหม่ที่แจกซ้ำได้ไม่เกิน CHUNK_ATTEMPTS ครั้ง
+    ทุกเมธอดปลอดภัยเมื่อเรียกจากหลาย thread
+    """
+
+    def __init__(self, num_images, chunk_size=COORDINATOR_CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT):
+        self.num_images = num_images
+        self.lease_timeout = lease_timeout
+        # chunk_id -> list ของลำดับภาพ (ชุดที่แจกซ้ำต่อท้ายด้วย id ใหม่)
+        self.chunks = [list(range(start, min(start + chunk_size, num_images + 1)))
+                       for start in range(1, num_images + 1, chunk_size)]
+        # chunk_id -> ครั้งที่แจกภาพชุดนี้ (ชุดแรก = 1)
+        self.attempts = [1] * len(self.chunks)
+        self.pending = deque(range(len(self.chunks)))
+        # chunk_id -> (worker, เวลาหมดอายุ)
+        self.leases = {}
+        # chunk_id -> (worker ที่ทำเสร็จ, ลำดับภาพที่เขียนสำเร็จ)
+        self.completed = {}
+        # worker -> จำนวนภาพที่สร้างสำเร็จ
+        self.worker_images = {}
+        # ลำดับภาพที่แจกซ้ำครบ CHUNK_ATTEMPTS ครั้งแล้วยังไม่สำเร็จ
+        self.failed = set()
+        self.fingerprint = None
+        self.reassigned = 0
+        self.images_written = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def _reclaim_expired(self, now):
+        # นำชุดงานที่ lease หมดอายุกลับเข้าคิว (ต้นคิว เพื่อให้ถูกแจกก่อน)
+        for chunk_id, (worker, deadline) in list(self.leases.items()):
+            if deadline < now:
+                del self.leases[chunk_id]
+                self.pending.appendleft(chunk_id)
+                self.reassigned += 1
+
+    def lease(self, worker, fingerprint=None):
+        """
+        แจกชุดงานถัดไปให้ worker
+        คืนค่า {"chunk": id, "indices": [ลำดับภาพ, ...]} หรือ {"wait": วินาที} ถ้าทุกชุดถูกแจกแล้ว
+        {"done": True} ถ้างานเสร็จหมดแล้ว หรือ {"error": ข้อความ} ถ้า fingerprint ไม่ตรง
+        """
+        with self._lock:
+            if fingerprint is not None:
+                if self.fingerprint is None:
+                    self.fingerprint = fingerprint
+                elif fingerprint != self.fingerprint:
+                    return {"error": "fingerprint ไม่ตรงกับการรันนี้ (seed/input/พารามิเตอร์ต่างกัน)"}
+            if len(self.completed) == len(self.chunks):
+                return {"done": True}
+            now = time.monotonic()
+            self._reclaim_expired(now)
+            while self.pending:
+                chunk_id = self.pending.popleft()
+                # ชุดที่ worker เดิมส่งผลมาทีหลังแม้ lease หมดอายุไปแล้ว ไม่ต้องแจกซ้ำ
+                if chunk_id in self.completed:
+                    continue
+                self.leases[chunk_id] = (worker, now + self.lease_timeout)
+                return {"chunk": chunk_id, "indices": self.chunks[chunk_id], "lease_timeout": self.lease_timeout}
+            return {"wait": WAIT_INTERVAL}
+
+    def heartbeat(self, worker, chunk_id):
+        """
+        ต่ออายุ lease ของชุดงาน คืนค่า False ถ้า lease ไม่ใช่ของ worker นี้แล้ว (หมดอายุและถูกแจกใหม่)
+        """
+        with self._lock:
+            lease = self.leases.get(chunk_id)
+            if lease is None or lease[0] != worker:
+                return False
+            self.leases[chunk_id] = (worker, time.monotonic() + self.lease_timeout)
+            return True
+
+    def complete(self, worker, chunk_id, indices):
+        """
+        บันทึกว่า worker ทำชุดงานเสร็จแล้ว (indices = ลำดับภาพในชุดที่เขียนสำเร็จ)
+        ภาพที่เหลือในชุดถูกแจกใหม่เป็นชุดงานใหม่ (ไม่เกิน CHUNK_ATTEMPTS ครั้ง)
+        ชุดที่เคยเสร็จแล้ว (เช่นสองเครื่องทำซ้ำกันหลัง lease หมดอายุ) ใช้ผลของเครื่องแรก
+        """
+        with self._lock:
+            lease = self.leases.get(chunk_id)
+            if lease is not None and lease[0] == worker:
+                del self.leases[chunk_id]
+            if chunk_id in self.completed:
+                return False
+            written = set(indices)
+            indices = [i for i in self.chunks[chunk_id] if i in written]
+            self.completed[chunk_id] = (worker, indices)
+            self.worker_images[worker] = self.worker_images.get(worker, 0) + len(indices)
+            self.images_written += len(indices)
+            missing = [i for i in self.chunks[chunk_id] if i not in written]
+            if missing and self.attempts[chunk_id] < CHUNK_ATTEMPTS:
+                # แจกภาพที่ยังไม่สำเร็จใหม่ก่อนชุดอื่น
+                self.chunks.append(missing)
+                self.attempts.append(self.attempts[chunk_id] + 1)
+                self.pending.appendleft(len(self.chunks) - 1)
+            else:
+                self.failed.update(missing)
+            if len(self.completed) == len(self.chunks):
+                self._finished.set()
+            return True
+
+    def status(self):
+        """
+        สถานะรวมของงาน: จำนวนภาพที่เสร็จ, throughput (ภาพ/วินาที) รวมและต่อ worker, lease ที่ค้าง
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            return {
+                "num_images": self.num_images,
+                "images_written": self.images_written,
+                "chunks_done": len(self.completed),
+                "chunks_total": len(self.chunks),
+                "active_leases": len(self.leases),
+                "reassigned": self.reassigned,
+                "elapsed": elapsed,
+                "throughput": self.images_written / elapsed,
+                "workers": {worker: images / elapsed for worker, images in self.worker_images.items()},
+            }
+
+    def wait_finished(self, timeout=None):
+        """
+        รอจนทุกชุดงานเสร็จ คืนค่า True ถ้าเสร็จแล้ว
+        """
+        return self._finished.wait(timeout)
+
+    def manifest(self):
+        """
+        manifest รวมในรูปแบบเดียวกับ merge_shard_manifests (samples: ชื่อภาพ -> worker ที่สร้าง)
+        gaps คือลำดับภาพที่ยังไม่มี worker ไหนเขียนสำเร็จ
+        """
+        with self._lock:
+            owners = {}
+            for worker, indices in self.completed.values():
+                owners.update({i: worker for i in indices})
+            return {
+                "fingerprint": self.fingerprint,
+                "num_images": self.num_images,
+                "completed": len(owners),
+                "gaps": [i for i in range(1, self.num_images + 1) if i not in owners],
+                "samples": {sample_key(i): owners[i] for i in sorted(owners)},
+            }
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    # รับข้อความ JSON ทีละบรรทัดแล้วตอบกลับหนึ่งบรรทัด
+    def handle(self):
+        coordinator = self.server.coordinator
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "lease":
+                    response = coordinator.lease(request["worker"], request.get("fingerprint"))
+                elif op == "heartbeat":
+                    response = {"ok": coordinator.heartbeat(request["worker"], request["chunk"])}
+                elif op == "complete":
+                    response = {"ok": coordinator.complete(request["worker"], request["chunk"], request.get("indices", []))}
+                elif op == "status":
+                    response = coordinator.status()
+                else:
+                    response = {"error": f"ไม่รู้จักคำสั่ง: {op}"}
+            except (ValueError, KeyError) as e:
+                response = {"error": f"ข้อความไม่ถูกต้อง: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_coordinator(num_images, address=("127.0.0.1", 0), chunk_size=COORDINATOR_CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT):
+    """
+    เปิด coordinator บน thread เบื้องหลัง (เช่นทดสอบกับหลาย worker บนเครื่องเดียว)
+    คืนค่า (server, coordinator) โดย server.server_address คือที่อยู่จริง (port 0 = ให้ระบบเลือก)
+    ปิดด้วย server.shutdown() และ server.server_close()
+    """
+    server = _CoordinatorServer(parse_address(address), _CoordinatorHandler)
+    server.coordinator = GenerationCoordinator(num_images, chunk_size, lease_timeout)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.coordinator
+
+def run_coordinator(num_images, address, chunk_size=COORDINATOR_CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT,
+                    report_interval=REPORT_INTERVAL, manifest_path=None, log_callback=None):
+    """
+    รัน coordinator จนทุกชุดงานเสร็จ: รายงาน throughput ทุก report_interval วินาที
+    และบันทึก manifest รวม (ถ้ากำหนด manifest_path) คืนค่าสถานะสุดท้าย (ดู GenerationCoordinator.status)
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg + "\n")
+        else: print(msg)
+
+    server, coordinator = start_coordinator(num_images, address, chunk_size, lease_timeout)
+    host, port = server.server_address[:2]
+    log(f"🛰️ coordinator: {host}:{port} ({len(coordinator.chunks)} ชุด ชุดละ {chunk_size} ภาพ)")
+    try:
+        while not coordinator.wait_finished(report_interval):
+            log(format_status(coordinator.status()))
+        # เปิดรับต่ออีกครู่ให้ worker ที่รองานอยู่ได้รับคำตอบว่างานเสร็จแล้ว
+        time.sleep(COORDINATOR_LINGER)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    status = coordinator.status()
+    log(format_status(status))
+    if manifest_path is not None:
+        # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(coordinator.manifest(), f)
+        os.replace(temp_path, manifest_path)
+    return status
+
+def format_status(status):
+    """
+    ข้อความรายงาน throughput หนึ่งบรรทัดจาก status
+    """
+    workers = ", ".join(f"{worker} {rate:.1f}" for worker, rate in sorted(status["workers"].items()))
+    return (f"📈 {status['images_written']}/{status['num_images']} ภาพ "
+            f"({status['chunks_done']}/{status['chunks_total']} ชุด) {status['throughput']:.1f} ภาพ/วินาที, "
+            f"lease ค้าง {status['active_leases']}, แจกใหม่ {status['reassigned']}"
+            + (f" | {workers}" if workers else ""))
+
+class CoordinatorClient:
+    """
+    ฝั่ง worker: ขอชุดงาน ต่ออายุ lease และแจ้งผลกับ coordinator (เชื่อมต่อใหม่ทุกข้อความ)
+    """
+
+    def __init__(self, address, worker=None, fingerprint=None):
+        self.address = parse_address(address)
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.fingerprint = fingerprint
+
+    def request(self, message):
+        """
+        ส่งหนึ่งข้อความแล้วรอคำตอบ (ลองใหม่สูงสุด CONNECT_RETRIES ครั้งถ้าเชื่อมต่อไม่ได้)
+        """
+        for attempt in range(CONNECT_RETRIES):
+            try:
+                with socket.create_connection(self.address, timeout=30) as conn:
+                    conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+                    with conn.makefile("rb") as reader:
+                        return json.loads(reader.readline())
+            except (OSError, ValueError):
+                if attempt == CONNECT_RETRIES - 1:
+                    raise
+                time.sleep(WAIT_INTERVAL * (attempt + 1))
+
+    def iter_chunks(self):
+        """
+        yield (chunk_id, list ของลำดับภาพ) จนงานหมด ระหว่างที่ผู้เรียกทำชุดงาน จะต่ออายุ lease อยู่เบื้องหลัง
+        ผู้เรียกต้องเรียก complete() เมื่อเขียนภาพของชุดนั้นเสร็จ (ภาพที่ไม่อยู่ใน indices จะถูกแจกใหม่)
+        """
+        while True:
+            response = self.request({"op": "lease", "worker": self.worker, "fingerprint": self.fingerprint})
+            if "error" in response:
+                raise RuntimeError(f"coordinator ปฏิเสธ: {response['error']}")
+            if response.get("done"):
+                return
+            if "wait" in response:
+                time.sleep(response["wait"])
+                continue
+            chunk_id = response["chunk"]
+            stop_heartbeat = threading.Event()
+            interval = response.get("lease_timeout", LEASE_TIMEOUT) / 3
+            heartbeat = threading.Thread(target=self._heartbeat, args=(chunk_id, stop_heartbeat, interval), daemon=True)
+            heartbeat.start()
+            try:
+                yield chunk_id, response["indices"]
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+
+    def _heartbeat(self, chunk_id, stop, interval):
+        # ต่ออายุ lease ทุกหนึ่งในสามของเวลาหมดอายุจนกว่าชุดงานจะเสร็จ
+        while not stop.wait(interval):
+            try:
+                self.request({"op": "heartbeat", "worker": self.worker, "chunk": chunk_id})
+            except OSError:
+                pass
+
+    def complete(self, chunk_id, indices):
+        """
+        แจ้ง coordinator ว่าเขียนชุดงานเสร็จแล้ว (indices = ลำดับภาพที่เขียนสำเร็จ)
+        """
+        return self.request({"op": "complete", "worker": self.worker, "chunk": chunk_id, "indices": list(indices)})
@@ -0,0 +1,141 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า json สำหรับไฟล์ manifest ของแต่ละ node
+import json
+# นำเข้า hashlib สำหรับ fingerprint ของพารามิเตอร์การรัน
+import hashlib
+# นำเข้า glob สำหรับค้นหา manifest ของทุก node
+import glob
+
+# รูปแบบชื่อ manifest ของ node ที่ shard_index จาก num_shards (เขียนไว้ในโฟลเดอร์ output ของ node นั้น)
+SHARD_MANIFEST_PATTERN = "manifest-{shard_index:05d}-of-{num_shards:05d}.json"
+# ชื่อ manifest รวมที่ได้จาก merge_shard_manifests
+MERGED_MANIFEST_NAME = "manifest.json"
+
+def shard_indices(num_images, shard_index=0, num_shards=1):
+    """
+    ลำดับภาพ (1..num_images) ของ node ที่ shard_index จาก num_shards แบบเว้นช่วง
+    (node 0 ได้ 1, 1 + num_shards, ...) ทุก node ได้จำนวนภาพต่างกันไม่เกินหนึ่ง และไม่มีภาพซ้ำกัน
+    คำนวณจากพารามิเตอร์อย่างเดียว จึงไม่ต้องมีตัวกลางแจกงาน
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index ต้องอยู่ในช่วง 0..{num_shards - 1} (ได้ {shard_index})")
+    return range(1 + shard_index, num_images + 1, num_shards)
+
+def sample_key(index):
+    """
+    ชื่อไฟล์ (ไม่มีนามสกุล) ของภาพลำดับที่ index ใช้ลำดับรวมของทั้งงาน จึงไม่ซ้ำกันระหว่าง node
+    """
+    return f"synthetic_image_{index:03d}"
+
+def run_fingerprint(seed, backgrounds, features, options):
+    """
+    fingerprint ของการรัน: seed, ชื่อไฟล์ input และพารามิเตอร์ของตัวสร้างภาพ
+    ทุก node ของงานเดียวกันต้องได้ค่าเดียวกัน (merge_shard_manifests ใช้ตรวจว่ารันด้วยค่าเดียวกัน)
+    ไม่นับจำนวนภาพ เพราะภาพลำดับที่ i ได้ผลเดิมไม่ว่าจะสร้างทั้งหมดกี่ภาพ (ทำต่อด้วยจำนวนภาพที่เพิ่มขึ้นได้)
+    """
+    payload = {
+        "seed": seed,
+        "backgrounds": [os.path.basename(path) for path in backgrounds],
+        "features": [os.path.basename(path) for path in features],
+        "options": options,
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+def write_shard_manifest(output_path, shard_index, num_shards, fingerprint, seed, num_images, completed):
+    """
+    บันทึก manifest ของ node นี้ (แบบ atomic): ลำดับภาพที่ได้รับมอบหมายและลำดับที่สร้างสำเร็จ
+    completed: iterable ของลำดับภาพที่มีไฟล์ครบแล้ว
+    คืนค่า path ของ manifest
+    """
+    manifest = {
+        "fingerprint": fingerprint,
+        "seed": seed,
+        "num_images": num_images,
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "completed": sorted(completed),
+    }
+    manifest_path = os.path.join(output_path, SHARD_MANIFEST_PATTERN.format(shard_index=shard_index, num_shards=num_shards))
+    # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, manifest_path)
+    return manifest_path
+
+def merge_shard_manifests(manifest_paths, output_manifest_path=None, log_callback=None):
+    """
+    รวม manifest ของทุก node เป็น manifest เดียว และตรวจความครบถ้วนของงาน
+    - manifest_paths: list ของ path หรือโฟลเดอร์ที่มี manifest-*.json (เช่นโฟลเดอร์ที่รวมผลของทุก node แล้ว)
+    - ตรวจว่าทุก manifest มาจากการรันเดียวกัน (fingerprint ตรงกัน) และมี manifest ครบทุก shard
+    - gaps: ลำดับภาพที่ไม่มี node ไหนสร้างสำเร็จ, duplicates: ลำดับภาพที่มีมากกว่าหนึ่ง node
+    บันทึก manifest รวม (ถ้ากำหนด output_manifest_path) และคืนค่า dict ของผลการตรวจ
+    manifest จากการรันต่างกันจะ raise ValueError
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg + "\n")
+        else: print(msg)
+
+    if isinstance(manifest_paths, str):
+        manifest_paths = [manifest_paths]
+    paths = []
+    for path in manifest_paths:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "manifest-*-of-*.json"))))
+        else:
+            paths.append(path)
+    if not paths:
+        raise ValueError("ไม่พบ manifest ของ shard")
+
+    manifests = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            manifests.append(json.load(f))
+    first = manifests[0]
+    for path, manifest in zip(paths, manifests):
+        if (manifest["fingerprint"] != first["fingerprint"] or manifest["num_shards"] != first["num_shards"]
+                or manifest["num_images"] != first["num_images"]):
+            raise ValueError(f"manifest มาจากการรันคนละชุด (seed/input/พารามิเตอร์ต่างกัน): {path}")
+
+    # นับว่าแต่ละลำดับภาพถูกสร้างโดยกี่ node
+    owners = {}
+    shards_seen = set()
+    for manifest in manifests:
+        shards_seen.add(manifest["shard_index"])
+        for index in manifest["completed"]:
+            owners.setdefault(index, []).append(manifest["shard_index"])
+    num_images, num_shards = first["num_images"], first["num_shards"]
+    gaps = [index for index in range(1, num_images + 1) if index not in owners]
+    duplicates = sorted(index for index, shards in owners.items() if len(shards) > 1)
+    missing_shards = sorted(set(range(num_shards)) - shards_seen)
+
+    report = {
+        "fingerprint": first["fingerprint"],
+        "seed": first["seed"],
+        "num_images": num_images,
+        "num_shards": num_shards,
+        "completed": len(owners),
+        "missing_shards": missing_shards,
+        "gaps": gaps,
+        "duplicates": duplicates,
+    }
+    if output_manifest_path is not None:
+        merged = dict(report, samples={sample_key(index): owners[index][0] for index in sorted(owners)})
+        # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+        temp_path = f"{output_manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f)
+        os.replace(temp_path, output_manifest_path)
+
+    if missing_shards:
+        log(f"⚠️ ไม่มี manifest ของ shard: {missing_shards}")
+    if gaps:
+        log(f"⚠️ ภาพที่ขาดหาย {len(gaps)} ภาพ: {gaps[:20]}{' ...' if len(gaps) > 20 else ''}")
+    if duplicates:
+        log(f"⚠️ ภาพที่ซ้ำกันระหว่าง node {len(duplicates)} ภาพ: {duplicates[:20]}{' ...' if len(duplicates) > 20 else ''}")
+    if not (missing_shards or gaps or duplicates):
+        log(f"✅ รวม manifest ครบ {len(owners)} ภาพ จาก {num_shards} shard")
+    return report
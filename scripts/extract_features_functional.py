@@ -1,25 +1,212 @@
 # นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
 import os
+# นำเข้า io สำหรับเข้ารหัส PNG ในหน่วยความจำ
+import io
+# นำเข้า json สำหรับไฟล์ manifest ของการแยกฟีเจอร์
+import json
+# นำเข้า hashlib สำหรับสร้าง hash ของพารามิเตอร์
+import hashlib
+# นำเข้า multiprocessing สำหรับเลือกวิธีสร้าง worker process
+import multiprocessing
+# นำเข้า process pool สำหรับลบพื้นหลังหลายภาพพร้อมกัน
+from concurrent.futures import ProcessPoolExecutor
+# นำเข้า partial สำหรับผูกพารามิเตอร์ของ worker
+from functools import partial
 # นำเข้า rembg library สำหรับลบพื้นหลังภาพด้วย AI model
 from rembg import remove  # ใช้ลบพื้นหลังภาพด้วยโมเดล ONNX
+# นำเข้า OpenCV library สำหรับหา connected component ของ alpha
+import cv2
+# นำเข้า NumPy library สำหรับจัดการ array ของ alpha
+import numpy as np
 # นำเข้า PIL library สำหรับจัดการและปรับแต่งภาพ
-from PIL import Image, ImageFilter  # ใช้จัดการและ post-process รูปภาพ
+from PIL import Image, ImageFilter, ImageOps  # ใช้จัดการและ post-process รูปภาพ
+# นำเข้า session ของ rembg ที่สร้างครั้งเดียวแล้วใช้ซ้ำ
+from rembg_session_functional import get_rembg_session, REMBG_MODEL, INTRA_OP_THREADS, INTER_OP_THREADS
+# นำเข้า alpha matting แบบเลือกระดับคุณภาพได้
+from matting_functional import matting_cutout, MATTING_TIER, FOREGROUND_THRESHOLD, BACKGROUND_THRESHOLD, ERODE_SIZE
+# นำเข้าฟังก์ชันคำนวณ hash ของไฟล์
+from water_mask_functional import file_content_hash
+# นำเข้าการสร้าง index ของฟีเจอร์
+from feature_index_functional import update_feature_index
 
-def post_process_image(image_path):
+# รัศมีของ Gaussian Blur ใน post-processing
+POST_BLUR_RADIUS = 2
+# ระยะขอบรอบ bounding box ของ alpha ที่ blur + sharpen ส่งผลถึง (พิกเซล)
+POST_PROCESS_MARGIN = 3 * POST_BLUR_RADIUS + 1
+
+# พื้นที่ขั้นต่ำ (พิกเซล) ของวัตถุที่แยกเป็นฟีเจอร์ของตัวเองเมื่อเปิด split_components
+MIN_COMPONENT_AREA = 2500
+# ค่า alpha ขั้นต่ำที่นับว่าเป็นส่วนของวัตถุตอนหา connected component
+COMPONENT_ALPHA_THRESHOLD = 10
+
+# ชื่อไฟล์ manifest ในโฟลเดอร์ features: ภาพต้นฉบับ -> hash + พารามิเตอร์ + ไฟล์ฟีเจอร์ที่ได้
+EXTRACT_MANIFEST_NAME = ".extract_manifest.json"
+
+def extraction_params_hash(model_name, model_path, matting, split_components=False, min_component_area=MIN_COMPONENT_AREA):
+    """
+    hash ของพารามิเตอร์ที่มีผลต่อภาพฟีเจอร์ ถ้าเปลี่ยนค่าใดภาพเดิมจะถูกประมวลผลใหม่
+    """
+    params = {
+        "model_name": model_name,
+        "model_path": model_path,
+        "matting": matting,
+        "thresholds": [FOREGROUND_THRESHOLD, BACKGROUND_THRESHOLD, ERODE_SIZE],
+        "post_blur_radius": POST_BLUR_RADIUS,
+    }
+    # ใส่พารามิเตอร์การแยกวัตถุเฉพาะเมื่อเปิดใช้ hash ของ manifest เดิมจึงยังใช้ได้
+    if split_components:
+        params["split_components"] = [min_component_area, COMPONENT_ALPHA_THRESHOLD]
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def load_extract_manifest(output_folder):
+    """
+    โหลด manifest ของโฟลเดอร์ features: dict ของ ชื่อไฟล์ต้นฉบับ -> {"hash", "params", "features"}
+    ("features" คือรายชื่อไฟล์ฟีเจอร์ที่ได้จากภาพนั้น) คืนค่า dict ว่างถ้ายังไม่มีหรือไฟล์เสียหาย
+    """
+    path = os.path.join(output_folder, EXTRACT_MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            sources = json.load(f).get("sources", {})
+    except (OSError, ValueError):
+        return {}
+    # manifest รุ่นเดิมเก็บฟีเจอร์เดียวต่อภาพใน "feature"
+    for entry in sources.values():
+        if "feature" in entry:
+            entry["features"] = [entry.pop("feature")]
+    return sources
+
+def save_extract_manifest(output_folder, sources):
+    """
+    บันทึก manifest แบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+    """
+    path = os.path.join(output_folder, EXTRACT_MANIFEST_NAME)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"sources": sources}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+def feature_number(feature_filename, prefix):
+    """
+    ดึงเลขลำดับจากชื่อไฟล์ฟีเจอร์ เช่น feature_012.png -> 12 (None ถ้าไม่ตรงรูปแบบ)
+    """
+    stem = os.path.splitext(feature_filename)[0]
+    number = stem[len(prefix) + 1:]
+    return int(number) if stem.startswith(prefix + "_") and number.isdigit() else None
+
+def post_process_image(image):
     """
     ทำ Post-processing เช่น blur และ sharpen บนภาพ เพื่อให้ภาพดูนุ่มนวลขึ้น
     ใช้ GaussianBlur และ SHARPEN จาก PIL
+    image เป็น path ของไฟล์หรือ PIL Image ก็ได้
+    ประมวลผลเฉพาะบริเวณ bounding box ของ alpha (ขยายขอบตามระยะที่ filter ส่งผลถึง)
+    แทนการ filter ทั้งภาพที่ส่วนใหญ่โปร่งใส
     """
-    # เปิดภาพจาก path ที่กำหนดและแปลงเป็นรูปแบบ RGBA (มี alpha channel)
-    image = Image.open(image_path).convert("RGBA")  # เปิดภาพและแปลงเป็น RGBA
+    # เปิดภาพ (ถ้าส่ง path มา) และแปลงเป็นรูปแบบ RGBA (มี alpha channel)
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image = image.convert("RGBA")
+    # หา bounding box ของส่วนที่มองเห็น (alpha > 0) ถ้าโปร่งใสทั้งภาพไม่ต้องทำอะไร
+    bbox = image.getchannel("A").getbbox()
+    if bbox is None:
+        return image
+
+    # บริเวณที่ผลลัพธ์เปลี่ยน = bbox + margin และต้องใช้พิกเซลรอบๆ อีก margin เป็นบริบทของ filter
+    margin = POST_PROCESS_MARGIN
+    width, height = image.size
+    inner = (max(bbox[0] - margin, 0), max(bbox[1] - margin, 0),
+             min(bbox[2] + margin, width), min(bbox[3] + margin, height))
+    outer = (max(inner[0] - margin, 0), max(inner[1] - margin, 0),
+             min(inner[2] + margin, width), min(inner[3] + margin, height))
+    crop = image.crop(outer)
     # ใช้ Gaussian Blur เพื่อเบลอภาพเล็กน้อย (radius=2 = ความเบลอระดับต่ำ)
-    image = image.filter(ImageFilter.GaussianBlur(radius=2))  # เบลอเล็กน้อย
+    crop = crop.filter(ImageFilter.GaussianBlur(radius=POST_BLUR_RADIUS))  # เบลอเล็กน้อย
     # ใช้ SHARPEN filter เพื่อทำให้ภาพชัดขึ้นอีกครั้งหลังเบลอ
-    image = image.filter(ImageFilter.SHARPEN)  # ทำให้ภาพชัดขึ้นอีกครั้ง
+    crop = crop.filter(ImageFilter.SHARPEN)  # ทำให้ภาพชัดขึ้นอีกครั้ง
+    # วางเฉพาะบริเวณ inner กลับลงภาพเดิม (ขอบ outer ได้รับผลจากขอบของ crop จึงไม่ใช้)
+    image.paste(crop.crop((inner[0] - outer[0], inner[1] - outer[1], inner[2] - outer[0], inner[3] - outer[1])), inner[:2])
     # ส่งคืนภาพที่ผ่าน post-processing แล้ว
     return image
 
-def extract_features(input_folder, output_folder, prefix="feature", log_callback=None):
+def split_alpha_components(image, min_area=MIN_COMPONENT_AREA, alpha_threshold=COMPONENT_ALPHA_THRESHOLD):
+    """
+    แยกภาพ RGBA ที่ลบพื้นหลังแล้วเป็นวัตถุละภาพด้วย connected component ของ alpha
+    คืนค่า list ของภาพ RGBA ที่ crop รอบวัตถุ (เฉพาะวัตถุที่มีพื้นที่ >= min_area พิกเซล)
+    เรียงจากบนลงล่าง ซ้ายไปขวา เพื่อให้ลำดับชื่อไฟล์คงที่
+    crop เผื่อขอบไว้ POST_PROCESS_MARGIN ให้ post-process และขอบนุ่มของ alpha ไม่ถูกตัด
+    """
+    alpha = np.asarray(image.getchannel("A"))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats((alpha > alpha_threshold).view(np.uint8), connectivity=8)
+    height, width = alpha.shape
+    margin = POST_PROCESS_MARGIN
+    components = []
+    # label 0 คือพื้นหลัง
+    for label in sorted(range(1, count), key=lambda k: (stats[k, cv2.CC_STAT_TOP], stats[k, cv2.CC_STAT_LEFT])):
+        if stats[label, cv2.CC_STAT_AREA] < min_area:
+            continue
+        x, y = stats[label, cv2.CC_STAT_LEFT], stats[label, cv2.CC_STAT_TOP]
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        x1 = min(x + stats[label, cv2.CC_STAT_WIDTH] + margin, width)
+        y1 = min(y + stats[label, cv2.CC_STAT_HEIGHT] + margin, height)
+        crop = np.array(image.crop((x0, y0, x1, y1)))
+        # ลบวัตถุอื่นที่อยู่ใน crop เดียวกัน (ขอบนุ่มที่ alpha ต่ำกว่า threshold ยังอยู่)
+        crop_labels = labels[y0:y1, x0:x1]
+        crop[(crop_labels != 0) & (crop_labels != label), 3] = 0
+        components.append(Image.fromarray(crop, "RGBA"))
+    return components
+
+def init_extract_worker(model_name, model_path, intra_op_threads, inter_op_threads):
+    """
+    initializer ของ worker process: โหลดโมเดลของ rembg ครั้งเดียวต่อ worker
+    """
+    get_rembg_session(model_name, model_path, intra_op_threads, inter_op_threads)
+
+def extract_single_feature(input_path, model_name=REMBG_MODEL, model_path=None,
+                           intra_op_threads=INTRA_OP_THREADS, inter_op_threads=INTER_OP_THREADS, matting=MATTING_TIER,
+                           split_components=False, min_component_area=MIN_COMPONENT_AREA):
+    """
+    ลบพื้นหลังและทำ post-process ภาพหนึ่งภาพ (ใช้ได้ทั้งใน process หลักและใน worker)
+    ทุกขั้นตอนส่งภาพต่อกันในหน่วยความจำ: อ่านไฟล์ → mask จาก rembg → alpha matting → post-process → เข้ารหัส PNG
+    matting คือระดับคุณภาพของ alpha matting (ดู MATTING_TIERS)
+    split_components=True จะแยกวัตถุแต่ละชิ้นในภาพ (พื้นที่ >= min_component_area) เป็นฟีเจอร์ละไฟล์ที่ crop พอดีวัตถุ
+    คืนค่า (list ของข้อมูล PNG ของฟีเจอร์, None) หรือ (None, ข้อความ error) เพื่อให้ภาพที่ผิดพลาดไม่หยุดทั้งชุด
+    การตั้งชื่อ feature_###.png ทำใน process หลักตามลำดับไฟล์ ผลลัพธ์จึงเหมือนกันทุกจำนวน worker
+    """
+    # ใช้ session ที่โหลดไว้แล้วของ process นี้
+    session = get_rembg_session(model_name, model_path, intra_op_threads, inter_op_threads)
+    try:
+        # 🔍 หา mask ของวัตถุด้วย rembg (ส่ง PIL Image เข้าไปจะได้ PIL Image กลับมา ไม่ต้องเข้ารหัส PNG กลาง)
+        with Image.open(input_path) as input_image:
+            # หมุนภาพตาม EXIF ก่อน เพื่อให้ภาพตรงกับ mask ที่ rembg คืนมา
+            input_image = ImageOps.exif_transpose(input_image)
+            mask = remove(
+                input_image,  # ภาพ input
+                session=session,  # ใช้ session ที่โหลดโมเดลไว้แล้ว
+                only_mask=True,  # ขอเฉพาะ mask แล้วทำ alpha matting เองตามระดับที่เลือก
+            )
+            # ✂️ ตัดพื้นหลังด้วย alpha matting ตามระดับคุณภาพ
+            cutout = matting_cutout(input_image, mask, matting)
+
+        # 🧩 แยกวัตถุแต่ละชิ้นเป็นภาพของตัวเอง (inference ครั้งเดียวต่อภาพ)
+        images = split_alpha_components(cutout, min_component_area) if split_components else [cutout]
+
+        # ✨ ทำ post-processing แล้วเข้ารหัสเป็น PNG ในหน่วยความจำ
+        png_list = []
+        for image in images:
+            processed_image = post_process_image(image)
+            if split_components:
+                # crop ให้พอดีส่วนที่มองเห็นหลัง post-process
+                processed_image = processed_image.crop(processed_image.getchannel("A").getbbox())
+            buffer = io.BytesIO()
+            processed_image.save(buffer, format="PNG")
+            png_list.append(buffer.getvalue())
+        return png_list, None
+    except Exception as e:
+        return None, str(e)
+
+def extract_features(input_folder, output_folder, prefix="feature", log_callback=None,
+                     model_name=REMBG_MODEL, model_path=None,
+                     intra_op_threads=INTRA_OP_THREADS, inter_op_threads=INTER_OP_THREADS, workers=1,
+                     matting=MATTING_TIER, incremental=True, split_components=False, min_component_area=MIN_COMPONENT_AREA):
     """
     ลบพื้นหลังจาก raw images และบันทึกภาพ feature ที่ post-processed แล้ว
     โดยตั้งชื่อเป็น feature_001.png, feature_002.png, ...
@@ -30,6 +217,19 @@ def extract_features(input_folder, output_folder, prefix="feature", log_callback
     - prefix (str): คำนำหน้าสำหรับชื่อไฟล์ที่บันทึกผลลัพธ์
     - log_callback (function, optional): ฟังก์ชันสำหรับรับข้อความ log แบบเรียลไทม์ เช่น ในแอป Streamlit
       หากไม่ส่งเข้ามา จะใช้ print() แสดง log แทน
+    - model_name (str): โมเดลของ rembg (ค่าเริ่มต้น "u2net") หรือ "u2net_custom" คู่กับ model_path
+    - model_path (str, optional): path ของไฟล์ .onnx สำหรับโมเดลแบบ custom
+    - intra_op_threads, inter_op_threads (int): จำนวน thread ของ onnxruntime (0 = ค่าเริ่มต้น)
+    - workers (int): จำนวน process ที่ลบพื้นหลังพร้อมกัน แต่ละ process มี session ของตัวเอง
+      (1 = ทำใน process เดียว) ลำดับและเลขของ feature_###.png เหมือนเดิมไม่ว่า workers จะเป็นเท่าไร
+    - matting (str): ระดับคุณภาพของ alpha matting "none" / "downscaled" / "band" / "full" (ค่าเริ่มต้น)
+      "downscaled" เร็วที่สุดที่ยังมีขอบนุ่ม เหมาะกับการรันจำนวนมาก ส่วน "full" ได้ผลเหมือน rembg เดิม
+    - incremental (bool): ใช้ manifest (.extract_manifest.json ใน output_folder) เพื่อประมวลผลเฉพาะภาพใหม่
+      หรือภาพที่เปลี่ยน (hash ของไฟล์หรือพารามิเตอร์ต่างจากเดิม) ฟีเจอร์เดิมคงชื่อเดิม ภาพใหม่ได้เลขต่อท้าย
+      และฟีเจอร์ของภาพต้นฉบับที่ถูกลบจะถูกลบออก (False = ประมวลผลใหม่ทั้งหมดและเริ่มเลข 001)
+    - split_components (bool): แยกวัตถุที่ไม่ติดกันในภาพเดียวเป็นฟีเจอร์หลายไฟล์ที่ crop พอดีวัตถุ
+      (ลบพื้นหลังครั้งเดียวต่อภาพ ไม่ใช่ครั้งเดียวต่อวัตถุ) ภาพหนึ่งจึงอาจได้ 0 ถึงหลายฟีเจอร์
+    - min_component_area (int): พื้นที่ขั้นต่ำ (พิกเซล) ของวัตถุที่บันทึกเป็นฟีเจอร์ วัตถุที่เล็กกว่าถูกตัดทิ้ง
     """
     def log(msg):
         # ฟังก์ชันย่อยไว้ใช้ log โดยจะเลือกใช้ print หรือส่งไป UI
@@ -46,59 +246,113 @@ def extract_features(input_folder, output_folder, prefix="feature", log_callback
         # ถ้าไม่มี ให้สร้างโฟลเดอร์ใหม่
         os.makedirs(output_folder)
 
-    count = 1  # ตัวนับชื่อไฟล์ เริ่มต้นที่ 1
-    # วนลูปผ่านไฟล์ทั้งหมดในโฟลเดอร์ input_folder โดยเรียงลำดับตามชื่อไฟล์
-    for filename in sorted(os.listdir(input_folder)):
-        # ตรวจสอบเฉพาะไฟล์ที่มีนามสกุล .jpg (ไม่สนใจตัวพิมพ์ใหญ่-เล็ก)
-        if filename.lower().endswith(".jpg"):  # ตรวจเฉพาะไฟล์ .jpg
-            # สร้าง path เต็มของไฟล์ input
-            input_path = os.path.join(input_folder, filename)
-            # สร้างชื่อไฟล์ output ในรูปแบบ prefix_001.png
-            output_filename = f"{prefix}_{count:03d}.png"  # เช่น feature_001.png
-            # สร้าง path เต็มของไฟล์ output
-            output_path = os.path.join(output_folder, output_filename)
-            # สร้าง path ของไฟล์ชั่วคราว (ใช้ระหว่างการประมวลผล)
-            temp_output_path = os.path.join(output_folder, f"temp_{output_filename}")
-
-            try:
-                # 🔍 ลบพื้นหลังจากภาพต้นฉบับด้วย rembg
-                # เปิดไฟล์ input ในโหมด binary read
-                with open(input_path, "rb") as input_file:
-                    # อ่านข้อมูลทั้งหมดจากไฟล์ input
-                    input_data = input_file.read()
-                    # ใช้ rembg.remove() เพื่อลบพื้นหลัง
-                    output_data = remove(
-                        input_data,  # ข้อมูลภาพ input
-                        alpha_matting=True,  # เปิดใช้ alpha matting เพื่อผลลัพธ์ที่ดีขึ้น
-                        alpha_matting_foreground_threshold=240,  # กำหนด threshold สำหรับแยก foreground
-                    )
-
-                # 💾 บันทึกภาพชั่วคราวที่ลบพื้นหลังแล้ว
-                # เปิดไฟล์ชั่วคราวในโหมด binary write
-                with open(temp_output_path, "wb") as temp_output_file:
-                    # เขียนข้อมูลภาพที่ลบพื้นหลังแล้วลงไฟล์ชั่วคราว
-                    temp_output_file.write(output_data)
-
-                # ✨ ทำ post-processing แล้วบันทึกผลลัพธ์สุดท้าย
-                # เรียกใช้ฟังก์ชัน post_process_image() เพื่อปรับแต่งภาพ
-                processed_image = post_process_image(temp_output_path)
+    # รายการไฟล์ .jpg (ไม่สนใจตัวพิมพ์ใหญ่-เล็ก) เรียงตามชื่อไฟล์
+    filenames = [f for f in sorted(os.listdir(input_folder)) if f.lower().endswith(".jpg")]
+
+    # 📒 เทียบกับ manifest: ข้ามภาพที่ hash และพารามิเตอร์เหมือนเดิม และยังมีไฟล์ฟีเจอร์อยู่
+    manifest = load_extract_manifest(output_folder) if incremental else {}
+    params_hash = extraction_params_hash(model_name, model_path, matting, split_components, min_component_area)
+    hashes = {f: file_content_hash(os.path.join(input_folder, f)) for f in filenames}
+
+    # ภาพต้นฉบับที่ถูกลบไปแล้ว: เก็บไว้ก่อนเผื่อเป็นไฟล์เดิมที่เปลี่ยนชื่อ (hash เดียวกัน)
+    orphans = {name: entry for name, entry in manifest.items() if name not in hashes}
+    orphans_by_hash = {(entry["hash"], entry["params"]): name for name, entry in orphans.items()}
+    sources = {}
+    pending = []
+    for filename in filenames:
+        entry = manifest.get(filename)
+        renamed_from = orphans_by_hash.get((hashes[filename], params_hash))
+        if entry is None and renamed_from is not None:
+            # ไฟล์เดิมที่เปลี่ยนชื่อ ใช้ฟีเจอร์เดิมต่อ
+            entry = orphans.pop(renamed_from)
+        if (entry is not None and entry["hash"] == hashes[filename] and entry["params"] == params_hash
+                and all(os.path.exists(os.path.join(output_folder, f)) for f in entry["features"])):
+            sources[filename] = entry
+            continue
+        # ภาพใหม่หรือเปลี่ยนแปลง: ใช้ชื่อฟีเจอร์เดิมถ้ามี (ID คงที่) ไม่เช่นนั้นตั้งชื่อใหม่ตอนทำสำเร็จ
+        pending.append((filename, entry["features"] if entry is not None else []))
+        if entry is not None:
+            # เก็บ entry เดิม (hash เก่า) ไว้จนกว่าจะทำสำเร็จ ถ้าล้มเหลวรอบหน้าจะลองใหม่ด้วยชื่อเดิม
+            sources[filename] = entry
+
+    # 🧹 ลบฟีเจอร์ที่ภาพต้นฉบับถูกลบไปแล้ว
+    for name, entry in orphans.items():
+        for feature in entry["features"]:
+            feature_path = os.path.join(output_folder, feature)
+            if os.path.exists(feature_path):
+                os.remove(feature_path)
+            log(f"🧹 Removed: {feature} (ไม่พบ {name})")
+
+    skipped = len(filenames) - len(pending)
+    if skipped:
+        log(f"⏭️ ข้ามภาพที่ประมวลผลแล้ว {skipped} ภาพ")
+    # เลขของฟีเจอร์ใหม่ต่อจากเลขที่ใช้อยู่ (ฟีเจอร์เดิมไม่ถูกเปลี่ยนชื่อ)
+    used_numbers = [feature_number(f, prefix) for entry in sources.values() for f in entry["features"]]
+    used_numbers += [feature_number(f, prefix) for _, features in pending for f in features]
+    count = max([n for n in used_numbers if n is not None], default=0) + 1
+    input_paths = [os.path.join(input_folder, f) for f, _ in pending]
+
+    # หลาย worker ใช้ CPU ร่วมกัน จึงแบ่ง thread ของ onnxruntime ให้แต่ละ worker ถ้าไม่ได้กำหนดเอง
+    if workers > 1 and not intra_op_threads:
+        intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    session_args = (model_name, model_path, intra_op_threads, inter_op_threads)
+    extract = partial(extract_single_feature, model_name=model_name, model_path=model_path,
+                      intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads, matting=matting,
+                      split_components=split_components, min_component_area=min_component_area)
+
+    if workers <= 1:
+        # โหลดโมเดลครั้งเดียวแล้วใช้ซ้ำทุกภาพ (และทุกครั้งที่เรียกฟังก์ชันนี้ใน process เดียวกัน)
+        init_extract_worker(*session_args)
+        results = map(extract, input_paths)
+        executor = None
+    else:
+        # แต่ละ worker โหลดโมเดลของตัวเองครั้งเดียวตอนเริ่ม
+        # ใช้ spawn เพราะ thread pool ของ onnxruntime/numba (pymatting) ไม่ปลอดภัยเมื่อ fork
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_extract_worker, initargs=session_args,
+                                       mp_context=multiprocessing.get_context("spawn"))
+        # executor.map คืนผลตามลำดับ input เสมอ
+        results = executor.map(extract, input_paths)
+
+    try:
+        # รับผลตามลำดับไฟล์ แล้วตั้งชื่อ output ตามลำดับภาพที่สำเร็จ
+        for (filename, old_features), (png_list, error) in zip(pending, results):
+            if error is not None:
+                # ❌ log เมื่อเกิดข้อผิดพลาด แล้วทำภาพถัดไปต่อ
+                log(f"❌ Error processing {filename}: {error}")
+                continue
+            output_filenames = []
+            for i, png_data in enumerate(png_list):
+                if i < len(old_features):
+                    # ใช้ชื่อฟีเจอร์เดิมของภาพนี้ก่อน
+                    output_filename = old_features[i]
+                else:
+                    # สร้างชื่อไฟล์ output ในรูปแบบ prefix_001.png
+                    output_filename = f"{prefix}_{count:03d}.png"  # เช่น feature_001.png
+                    # เพิ่มตัวนับเพื่อไปยังไฟล์ถัดไป
+                    count += 1
                 # บันทึกภาพที่ผ่าน post-processing แล้วลงไฟล์ output
-                processed_image.save(output_path)
-
-                # 🔄 ลบภาพชั่วคราวออก
-                # ลบไฟล์ชั่วคราวเพื่อประหยัดพื้นที่
-                os.remove(temp_output_path)
-
-                # ✅ log ว่าทำสำเร็จ
-                # แสดงข้อความว่าประมวลผลไฟล์ไหนสำเร็จ
-                log(f"✅ Processed: {filename} → {output_filename}")
-                # เพิ่มตัวนับเพื่อไปยังไฟล์ถัดไป
-                count += 1
-
-            except Exception as e:
-                # ❌ log เมื่อเกิดข้อผิดพลาด
-                # ถ้าเกิดข้อผิดพลาด ให้แสดงข้อความ error
-                log(f"❌ Error processing {filename}: {e}")
+                with open(os.path.join(output_folder, output_filename), "wb") as output_file:
+                    output_file.write(png_data)
+                output_filenames.append(output_filename)
+            # ภาพที่เปลี่ยนแล้วได้วัตถุน้อยกว่าเดิม: ลบฟีเจอร์เดิมที่เกินมา
+            for feature in old_features[len(png_list):]:
+                feature_path = os.path.join(output_folder, feature)
+                if os.path.exists(feature_path):
+                    os.remove(feature_path)
+            sources[filename] = {"hash": hashes[filename], "params": params_hash, "features": output_filenames}
+            if not output_filenames:
+                log(f"⚠️ No component ≥ {min_component_area} px: {filename}")
+                continue
+            # ✅ log ว่าทำสำเร็จ
+            log(f"✅ Processed: {filename} → {', '.join(output_filenames)}")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        # บันทึก manifest แม้ถูกหยุดกลางคัน เพื่อให้รอบถัดไปทำต่อจากภาพที่สำเร็จแล้ว
+        save_extract_manifest(output_folder, sources)
+
+    # 🗂️ อัปเดต index ของฟีเจอร์ (bbox, สีเด่น, ภาพที่ crop ไว้) ให้ขั้นตอนสร้างภาพใช้ได้ทันที
+    update_feature_index(output_folder, log_callback=log_callback)
 
 # หากเรียกใช้งานแบบสคริปต์ จะรันตรงนี้ (เช่น python extract_features_functional.py)
 # ตรวจสอบว่าไฟล์นี้ถูกเรียกใช้งานโดยตรงหรือไม่
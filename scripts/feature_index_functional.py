@@ -0,0 +1,207 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า json สำหรับไฟล์ index ของฟีเจอร์
+import json
+# นำเข้า math สำหรับคำนวณเส้นทแยงมุมของ crop
+import math
+# นำเข้า OpenCV library สำหรับประมวลผลภาพ
+import cv2
+# นำเข้า NumPy library สำหรับการคำนวณทางคณิตศาสตร์
+import numpy as np
+# นำเข้าฟังก์ชันคำนวณ hash ของไฟล์
+from water_mask_functional import file_content_hash
+
+# ชื่อไฟล์ index ในโฟลเดอร์ features: ชื่อไฟล์ฟีเจอร์ -> ขนาด, bbox, alpha coverage, สีเด่น, hull
+FEATURE_INDEX_NAME = ".feature_index.json"
+# ชื่อโฟลเดอร์เก็บภาพฟีเจอร์ที่ crop ไว้แล้ว (สร้างไว้ในโฟลเดอร์ features)
+FEATURE_CROP_DIRNAME = ".crops"
+# ไฟล์กำหนด class id ของฟีเจอร์ในโฟลเดอร์ features: {"ชื่อไฟล์ฟีเจอร์.png": class_id}
+FEATURE_CLASSES_NAME = "classes.json"
+# จำนวนระดับสีต่อช่องที่ใช้หา dominant color (8 = 512 กลุ่มสี)
+COLOR_LEVELS = 8
+# ค่า alpha ขั้นต่ำของพิกเซลที่นับตอนหา dominant color
+COLOR_ALPHA_THRESHOLD = 128
+
+def dominant_color(feature):
+    """
+    หาสีเด่นของฟีเจอร์ (BGRA) จากพิกเซลที่ alpha >= COLOR_ALPHA_THRESHOLD
+    ปัดสีเป็น COLOR_LEVELS ระดับต่อช่อง แล้วคืนค่าเฉลี่ยของกลุ่มที่มีพิกเซลมากที่สุดเป็น [r, g, b]
+    (None ถ้าไม่มีพิกเซลที่มองเห็น)
+    """
+    pixels = feature[feature[:, :, 3] >= COLOR_ALPHA_THRESHOLD][:, :3]
+    if len(pixels) == 0:
+        return None
+    levels = (pixels.astype(np.int32) * COLOR_LEVELS) >> 8
+    bins = (levels[:, 0] * COLOR_LEVELS + levels[:, 1]) * COLOR_LEVELS + levels[:, 2]
+    top = bins == np.bincount(bins).argmax()
+    blue, green, red = pixels[top].mean(axis=0).round().astype(int).tolist()
+    return [red, green, blue]
+
+def crop_side(bbox):
+    """
+    ความยาวด้านของ crop แบบหมุนได้ (ดู rotation_safe_crop) ของ bbox [x, y, w, h]
+    """
+    return int(math.ceil(math.hypot(bbox[2], bbox[3]))) + 2
+
+def feature_canvas_size(entry):
+    """
+    ขนาด (width, height) ของภาพที่ตัวสร้างภาพ resize/หมุนจริงสำหรับฟีเจอร์ใน index
+    (ขนาด crop ถ้ามี ไม่เช่นนั้นขนาดภาพเต็ม)
+    """
+    if "crop" in entry:
+        side = crop_side(entry["bbox"])
+        return side, side
+    return entry["width"], entry["height"]
+
+def rotation_safe_crop(feature, bbox):
+    """
+    ตัดฟีเจอร์เป็นสี่เหลี่ยมจัตุรัสรอบจุดกึ่งกลางของ bbox ด้านยาวเท่าเส้นทแยงมุมของ bbox
+    หมุนรอบจุดกึ่งกลางได้ทุกมุมโดยวัตถุไม่ถูกตัด (ส่วนที่เกินภาพเดิมเติมเป็นพิกเซลโปร่งใส)
+    คืนค่า (crop, (origin_x, origin_y)) โดย origin คือมุมซ้ายบนของ crop ในพิกัดของภาพเดิม
+    """
+    x, y, w, h = bbox
+    side = crop_side(bbox)
+    origin_x = x + w // 2 - side // 2
+    origin_y = y + h // 2 - side // 2
+    crop = np.zeros((side, side, 4), np.uint8)
+    # ส่วนที่ซ้อนกันระหว่าง crop กับภาพเดิม
+    src_x0, src_y0 = max(origin_x, 0), max(origin_y, 0)
+    src_x1 = min(origin_x + side, feature.shape[1])
+    src_y1 = min(origin_y + side, feature.shape[0])
+    crop[src_y0 - origin_y:src_y1 - origin_y, src_x0 - origin_x:src_x1 - origin_x] = feature[src_y0:src_y1, src_x0:src_x1]
+    return crop, (origin_x, origin_y)
+
+def compute_feature_entry(feature_path, crop_dir=None):
+    """
+    คำนวณ metadata ของฟีเจอร์หนึ่งภาพจาก alpha channel
+    - width/height: ขนาดภาพ, bbox: [x, y, w, h] ของส่วนที่ alpha > 0
+    - coverage: ผลรวม alpha / พื้นที่ bbox (0-1), dominant_color: [r, g, b]
+    - hull: convex hull ของพิกเซลที่มองเห็น (พิกัดภาพเดิม) ใช้ตัดภาพหลัง scale/หมุนให้เหลือเฉพาะรอบวัตถุ
+    ถ้ากำหนด crop_dir จะบันทึกภาพที่ crop แล้ว (ดู rotation_safe_crop) และเก็บ "crop", "crop_origin"
+    คืนค่า dict หรือ None ถ้าไม่ใช่ภาพ RGBA
+    """
+    feature = cv2.imread(feature_path, cv2.IMREAD_UNCHANGED)
+    if feature is None or feature.ndim != 3 or feature.shape[2] != 4:
+        return None
+    height, width = feature.shape[:2]
+    coords = cv2.findNonZero(feature[:, :, 3])
+    if coords is None:
+        # ฟีเจอร์โปร่งใสทั้งภาพ ใช้ขนาดภาพทั้งหมดเหมือน get_true_bbox_from_alpha
+        bbox = [0, 0, width, height]
+        hull = [[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]]
+    else:
+        bbox = list(cv2.boundingRect(coords))
+        hull = cv2.convexHull(coords).reshape(-1, 2).tolist()
+    x, y, w, h = bbox
+    entry = {
+        "width": width,
+        "height": height,
+        "bbox": bbox,
+        "coverage": round(float(feature[y:y + h, x:x + w, 3].sum()) / (255.0 * w * h), 4),
+        "dominant_color": dominant_color(feature),
+        "hull": hull,
+    }
+    if crop_dir is not None:
+        crop, origin = rotation_safe_crop(feature, bbox)
+        os.makedirs(crop_dir, exist_ok=True)
+        crop_name = os.path.basename(feature_path)
+        # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+        temp_path = os.path.join(crop_dir, f"{crop_name}.{os.getpid()}.tmp.png")
+        cv2.imwrite(temp_path, crop)
+        os.replace(temp_path, os.path.join(crop_dir, crop_name))
+        entry.update(crop=crop_name, crop_origin=list(origin))
+    return entry
+
+def load_feature_index(features_path):
+    """
+    โหลด index ของโฟลเดอร์ features: dict ของ ชื่อไฟล์ฟีเจอร์ -> entry
+    เฉพาะ entry ที่ขนาดไฟล์และเวลาแก้ไขตรงกับไฟล์ปัจจุบัน (ฟีเจอร์ที่เปลี่ยนหลังสร้าง index จะไม่ถูกใช้)
+    คืนค่า dict ว่างถ้ายังไม่มีหรือไฟล์เสียหาย
+    """
+    try:
+        with open(os.path.join(features_path, FEATURE_INDEX_NAME), "r", encoding="utf-8") as f:
+            features = json.load(f).get("features", {})
+    except (OSError, ValueError):
+        return {}
+    index = {}
+    for name, entry in features.items():
+        try:
+            stat = os.stat(os.path.join(features_path, name))
+        except OSError:
+            continue
+        if [stat.st_size, stat.st_mtime_ns] == entry.get("stat"):
+            index[name] = entry
+    return index
+
+def load_feature_classes(features_path):
+    """
+    โหลด class id ของฟีเจอร์จาก features_path/classes.json: dict ของ ชื่อไฟล์ฟีเจอร์ -> class id
+    คืนค่า dict ว่างถ้าไม่มีไฟล์ (ทุกฟีเจอร์เป็น class 0)
+    """
+    try:
+        with open(os.path.join(features_path, FEATURE_CLASSES_NAME), "r", encoding="utf-8") as f:
+            return {name: int(class_id) for name, class_id in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+def update_feature_index(features_path, write_crops=True, log_callback=None):
+    """
+    สร้างหรืออัปเดต index ของฟีเจอร์ (.feature_index.json ในโฟลเดอร์ features) แบบ incremental
+    คำนวณใหม่เฉพาะฟีเจอร์ใหม่หรือที่เปลี่ยน (hash ของไฟล์ต่างจากเดิม) และลบ entry ของฟีเจอร์ที่ถูกลบ
+    write_crops=True จะเก็บภาพที่ crop ไว้แล้วใน .crops ให้ตัวสร้างภาพโหลดแทนภาพเต็ม
+    คืนค่า dict ของ ชื่อไฟล์ฟีเจอร์ -> entry
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg + "\n")
+        else: print(msg)
+
+    index_path = os.path.join(features_path, FEATURE_INDEX_NAME)
+    crop_dir = os.path.join(features_path, FEATURE_CROP_DIRNAME)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            old_index = json.load(f).get("features", {})
+    except (OSError, ValueError):
+        old_index = {}
+
+    index = {}
+    updated = 0
+    for name in sorted(os.listdir(features_path)):
+        if not name.endswith(".png"):
+            continue
+        feature_path = os.path.join(features_path, name)
+        stat = os.stat(feature_path)
+        stat_key = [stat.st_size, stat.st_mtime_ns]
+        entry = old_index.get(name)
+        # ตรวจ hash เฉพาะเมื่อขนาด/เวลาแก้ไขเปลี่ยน (เช่นไฟล์ถูก copy มาใหม่แต่เนื้อหาเดิม)
+        unchanged = entry is not None and (entry.get("stat") == stat_key or entry.get("hash") == file_content_hash(feature_path))
+        has_crop = entry is not None and os.path.exists(os.path.join(crop_dir, entry.get("crop", name)))
+        if unchanged and (has_crop or not write_crops):
+            entry["stat"] = stat_key
+            if not write_crops:
+                entry.pop("crop", None)
+                entry.pop("crop_origin", None)
+            index[name] = entry
+            continue
+        entry = compute_feature_entry(feature_path, crop_dir if write_crops else None)
+        if entry is None:
+            log(f"⚠️ ข้ามฟีเจอร์ที่ไม่มี alpha channel: {name}")
+            continue
+        entry.update(hash=file_content_hash(feature_path), stat=stat_key)
+        index[name] = entry
+        updated += 1
+
+    # ลบ crop ของฟีเจอร์ที่ไม่อยู่ใน index แล้ว
+    for name in set(old_index) - set(index):
+        crop_path = os.path.join(crop_dir, old_index[name].get("crop", name))
+        if os.path.exists(crop_path):
+            os.remove(crop_path)
+
+    # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"features": index}, f, ensure_ascii=False, sort_keys=True)
+    os.replace(temp_path, index_path)
+    if updated:
+        log(f"🗂️ อัปเดต feature index: {updated} ฟีเจอร์ (ทั้งหมด {len(index)})")
+    return index
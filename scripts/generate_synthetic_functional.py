@@ -6,107 +6,163 @@ import cv2
 import numpy as np
 # นำเข้า library สำหรับสุ่มค่า
 import random
+# นำเข้า itertools สำหรับลำดับภาพแบบไม่สิ้นสุด
+import itertools
+# นำเข้า multiprocessing สำหรับเลือกวิธีสร้าง worker process
+import multiprocessing
+# นำเข้า process pool สำหรับสร้างภาพแบบขนาน
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# นำเข้า partial สำหรับผูกปลายทางการเขียนไฟล์
+from functools import partial
+# นำเข้า OrderedDict สำหรับ LRU cache ของภาพที่ render จากตารางพารามิเตอร์
+from collections import OrderedDict
+# นำเข้า threading สำหรับ lock ของ cache เมื่ออ่านจากหลาย thread
+import threading
+# นำเข้าฟังก์ชันตรวจจับพื้นที่น้ำและ cache ของ water mask
+from water_mask_functional import get_water_mask, MASK_CACHE_DIRNAME, MASK_SCALE
+# นำเข้า cache ของภาพที่ถอดรหัสแล้ว
+from image_cache_functional import load_image, set_image_cache_budget, get_image_cache_stats, reset_image_cache_stats, IMAGE_CACHE_BUDGET
+# นำเข้าตัวสุ่มตำแหน่งวางฟีเจอร์ที่ใช้ integral image
+from placement_functional import (
+    sample_water_position, compute_water_integral, render_feature, rendered_bbox, scaled_size, rescale_placement,
+    SCALE_RANGE, ANGLE_RANGE,
+)
+# นำเข้าตัวเขียน shard (tar) สำหรับโหมด output_format="shards"
+from shard_functional import ShardWriter, recover_shards, remove_shards, SHARD_MAX_BYTES
+# นำเข้าขั้นตอนเขียนไฟล์แบบ asynchronous
+from async_writer_functional import AsyncSampleWriter
+# นำเข้า sprite bank ของฟีเจอร์ที่ pre-render ไว้แล้ว
+from sprite_bank_functional import (
+    build_sprite_bank, load_sprite_bank, nearest_sprite_entry, sprite_pixels,
+    SPRITE_BANK_DIRNAME, SPRITE_SCALE_STEP, SPRITE_ANGLE_STEP,
+)
+# นำเข้า index ของฟีเจอร์ (bbox, hull และภาพที่ crop ไว้แล้ว)
+from feature_index_functional import (
+    load_feature_index, update_feature_index, load_feature_classes, feature_canvas_size, FEATURE_CROP_DIRNAME,
+)
+# นำเข้า index ของภาพพื้นหลังและการสุ่มชุด (พื้นหลัง, ฟีเจอร์, scale) ที่วางได้
+from background_index_functional import (
+    load_background_index, update_background_index, build_placement_plan, sample_placement, sample_feature_for_background,
+)
+# นำเข้า PIL สำหรับอ่านขนาดภาพฟีเจอร์จาก header
+from PIL import Image
+# นำเข้าการแบ่งงานให้หลายเครื่อง (ชื่อไฟล์ตามลำดับรวม และ manifest ของแต่ละ node)
+from distributed_functional import shard_indices, sample_key, run_fingerprint, write_shard_manifest
+# นำเข้า run manifest สำหรับทำต่อจากการรันที่ถูกขัดจังหวะ
+from run_manifest_functional import RunManifest, load_run_manifest, run_manifest_name, verify_file_record
+# นำเข้าฝั่ง worker ของ coordinator ที่แจกชุดงานแบบ dynamic
+from coordinator_functional import CoordinatorClient
+# นำเข้าการโหลดภาพล่วงหน้าบน thread เบื้องหลัง
+from prefetch_functional import prefetch_iter, get_prefetch_stats, reset_prefetch_stats, PREFETCH_DEPTH, PREFETCH_THREADS
+# นำเข้าตารางพารามิเตอร์ของโหมด virtual (render ภาพตามต้องการแทนการเก็บ JPEG)
+from virtual_dataset_functional import placement_tables, write_virtual_dataset, load_virtual_dataset, virtual_dataset_name
 
-def detect_water_area(image):
+# จำนวนครั้งสูงสุดที่สุ่มชุดใหม่เมื่อวางฟีเจอร์ไม่ได้ (เมื่อใช้ background index)
+MAX_PLACEMENT_ATTEMPTS = 8
+# IoU สูงสุดที่ยอมให้ bounding box ของวัตถุในภาพเดียวกันทับกัน
+MAX_OBJECT_IOU = 0.1
+# จำนวนภาพที่ VirtualDataset เก็บไว้ใน cache หลัง render
+RENDER_CACHE_SIZE = 64
+
+def render_placement(feature, scale, angle, x, y, sprite_bank=None, hull=None):
     """
-    ตรวจจับพื้นที่น้ำในภาพโดยใช้สี HSV และฟิลเตอร์ทาง Morphological
-    คืนค่าเป็น mask (พื้นที่ที่ถือว่าเป็นน้ำ)
+    ปรับขนาด/หมุนฟีเจอร์ตาม scale และมุม สำหรับวางที่ตำแหน่ง (x, y) ของ canvas
+    คืนค่า (ฟีเจอร์ที่ render แล้ว, x, y) โดย x, y ถูกเลื่อนตาม bbox เมื่อใช้ sprite bank หรือ hull
+    (ใช้ร่วมกันระหว่าง place_feature_on_water และการ render ภาพจากพารามิเตอร์ที่บันทึกไว้)
     """
-    # กำหนดขอบล่างของสี HSV ที่ถือว่าเป็นน้ำ (สีดำเข้มถึงน้ำเงินเข้ม)
-    LOWER_BOUND = np.array([0, 0, 0])  # สีดำเข้มถึงน้ำเงินเข้ม (ค่าทดลองจากภาพจริง)
-    # กำหนดขอบบนของสี HSV ที่ถือว่าเป็นน้ำ
-    UPPER_BOUND = np.array([110, 255, 220])
-
-    # แปลงภาพจาก BGR เป็น HSV color space
-    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    # สร้าง mask โดยหาพิกเซลที่อยู่ในช่วงสีที่กำหนด
-    mask = cv2.inRange(hsv_image, LOWER_BOUND, UPPER_BOUND)
+    if sprite_bank is not None:
+        # ใช้ sprite ที่ตัดตาม bounding box แล้ว จึงเลื่อนตำแหน่งวางตาม bbox ภายใน canvas
+        entry = nearest_sprite_entry(sprite_bank, scale, angle)
+        return sprite_pixels(sprite_bank, entry), x + int(entry["bbox_x"]), y + int(entry["bbox_y"])
 
-    # ใช้ Morphological Filter เพื่อขจัด noise
-    # สร้าง kernel ขนาด 5x5 สำหรับ morphological operations
-    kernel = np.ones((5, 5), np.uint8)
-    # ใช้ MORPH_CLOSE เพื่อปิดช่องว่างเล็กๆ ในพื้นที่น้ำ
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    # ใช้ MORPH_OPEN เพื่อลบ noise เล็กๆ ออกจากพื้นที่น้ำ
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    # ปรับขนาดและหมุนฟีเจอร์ตาม scale และมุมที่สุ่มได้
+    rotated_feature = render_feature(feature, scale, angle)
+    if hull is not None:
+        # ตัดตาม bounding box ของวัตถุที่คำนวณจาก hull
+        bx, by, bw, bh = rendered_bbox(hull, feature.shape, scale, angle)
+        return rotated_feature[by:by + bh, bx:bx + bw], x + bx, y + by
 
-    # ส่งคืน mask ที่แสดงพื้นที่น้ำ
-    return mask
+    # ส่งคืนฟีเจอร์ที่หมุนแล้วและตำแหน่ง x, y
+    return rotated_feature, x, y
 
-def place_feature_on_water(background, feature, water_mask):
+def place_feature_on_water(background, feature, water_mask, water_integral=None, rng=None, sprite_bank=None,
+                           hull=None, scale_range=SCALE_RANGE, params=None):
     """
     วางภาพฟีเจอร์ลงบนพื้นหลัง โดยสุ่มตำแหน่งที่อยู่ในพื้นที่น้ำเท่านั้น
     คืนค่าภาพฟีเจอร์ที่วางแล้ว + ตำแหน่ง x, y
+    water_integral (optional) คือ integral image ของ mask ที่คำนวณไว้แล้ว (ดู compute_water_integral)
+    rng (optional) คือ np.random.Generator ที่ใช้สุ่ม ถ้าไม่ส่งมาจะใช้ random state ส่วนกลาง
+    sprite_bank (optional) คือ bank จาก load_sprite_bank ถ้าส่งมาจะใช้ sprite ที่ pre-render ไว้
+    (scale/มุมปัดเข้าหา grid) แทนการ resize/หมุนพิกเซล และไม่ต้องใช้ feature
+    hull (optional) คือ convex hull ของวัตถุในพิกัดของ feature (จาก feature index) ถ้าส่งมาจะคืนฟีเจอร์
+    ที่ตัดตามกล่องที่คำนวณจาก hull แล้ว (เลื่อน x, y ตาม) ภาพที่ต้องสแกน alpha หา label จึงเล็กลง
+    scale_range คือช่วงของ scale ที่สุ่ม (ค่าเริ่มต้น SCALE_RANGE)
+    params (optional) คือ dict ที่จะถูกเติมค่า scale, angle, x, y (ตำแหน่ง canvas) ที่สุ่มได้
+    สำหรับ render ภาพเดิมซ้ำด้วย render_placement
     """
-    # เก็บขนาดของภาพพื้นหลัง (height, width, channels)
-    bg_height, bg_width, _ = background.shape
-    # เก็บขนาดของภาพฟีเจอร์ (height, width, channels)
-    fg_height, fg_width, _ = feature.shape
+    # ใช้ random state ส่วนกลางของ NumPy ถ้าไม่ได้ส่ง generator มา
+    uniform = rng.uniform if rng is not None else np.random.uniform
 
     # สุ่ม scale ของฟีเจอร์ (ขนาด 40-80% ของขนาดเดิม)
-    scale = np.random.uniform(0.4, 0.8)
-    # คำนวณความกว้างใหม่ของฟีเจอร์
-    new_fg_width = int(fg_width * scale)
-    # คำนวณความสูงใหม่ของฟีเจอร์
-    new_fg_height = int(fg_height * scale)
-    # ปรับขนาดฟีเจอร์ตาม scale ที่สุ่มได้
-    feature_resized = cv2.resize(feature, (new_fg_width, new_fg_height), interpolation=cv2.INTER_AREA)
-
-    # หาพิกัดของพื้นที่น้ำใน mask
-    # np.where(water_mask > 0) หาพิกัดที่ mask > 0 (มีน้ำ)
-    # np.column_stack จัดเรียงพิกัดเป็น array ของ [y, x]
-    water_coords = np.column_stack(np.where(water_mask > 0))
-    # ถ้าไม่มีพื้นที่น้ำเลย ให้ return None
-    if len(water_coords) == 0:
-        return None, None, None
+    scale = uniform(*scale_range)
+    # คำนวณขนาดใหม่ของฟีเจอร์ (ถ้าใช้ sprite bank จะใช้ขนาดของ scale บน grid ที่ใกล้ที่สุด)
+    if sprite_bank is not None:
+        entry = nearest_sprite_entry(sprite_bank, scale, 0)
+        new_fg_width, new_fg_height = int(entry["width"]), int(entry["height"])
+    else:
+        new_fg_width, new_fg_height = scaled_size(feature.shape, scale)
 
-    # สุ่มพิกัดวางจนกว่าจะเจอที่เหมาะสม
-    attempts = 0  # ตัวนับจำนวนครั้งที่ลอง
-    while attempts < 10000:  # ลองสูงสุด 10,000 ครั้ง
-        # สุ่มพิกัดจากพื้นที่น้ำ
-        y, x = random.choice(water_coords)
-        # ตรวจสอบว่าฟีเจอร์ไม่เกินขอบเขตของภาพพื้นหลัง
-        if (x + new_fg_width <= bg_width and y + new_fg_height <= bg_height):
-            # หาพื้นที่ใน mask ที่จะวางฟีเจอร์
-            region = water_mask[y:y + new_fg_height, x:x + new_fg_width]
-            # ตรวจสอบว่าพื้นที่น้ำในบริเวณนั้นมากกว่า 50% หรือไม่
-            if np.count_nonzero(region) / (new_fg_width * new_fg_height) >= 0.5:
-                break  # ถ้าเหมาะสม ให้ออกจากลูป
-        attempts += 1  # เพิ่มตัวนับ
-
-    # ถ้าลองเกิน 10,000 ครั้งแล้วยังไม่เจอตำแหน่งที่เหมาะสม
-    if attempts >= 10000:
+    # สุ่มตำแหน่งจากทุกตำแหน่งที่มีน้ำใต้ฟีเจอร์ >= 50% (ตรวจทั้งภาพในครั้งเดียวด้วย integral image)
+    # mask อาจมีความละเอียดต่ำกว่าภาพ จึงส่งขนาดภาพจริงไปเพื่อแปลงพิกัดกลับ
+    position = sample_water_position(water_mask, new_fg_width, new_fg_height, water_integral, rng=rng,
+                                     image_size=(background.shape[1], background.shape[0]))
+    # ถ้าไม่มีตำแหน่งที่เหมาะสมเลย ให้ return None ทันที
+    if position is None:
         return None, None, None
+    x, y = position
 
-    # สุ่มหมุนฟีเจอร์
     # สุ่มมุมการหมุน 0-360 องศา
-    angle = np.random.uniform(0, 360)
-    # สร้าง transformation matrix สำหรับหมุน
-    # จุดศูนย์กลางการหมุนคือกลางภาพฟีเจอร์
-    M = cv2.getRotationMatrix2D((new_fg_width // 2, new_fg_height // 2), angle, 1)
-    # หมุนฟีเจอร์ตามมุมที่สุ่มได้
-    # borderMode=cv2.BORDER_CONSTANT ใช้สีดำสำหรับพื้นที่ที่เกินขอบเขต
-    # borderValue=(0, 0, 0, 0) กำหนดสีขอบเป็นโปร่งใส
-    rotated_feature = cv2.warpAffine(feature_resized, M, (new_fg_width, new_fg_height), borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
+    angle = uniform(*ANGLE_RANGE)
+    if params is not None:
+        params.update(scale=float(scale), angle=float(angle), x=int(x), y=int(y))
+    return render_placement(feature, scale, angle, x, y, sprite_bank, hull)
 
-    # ส่งคืนฟีเจอร์ที่หมุนแล้วและตำแหน่ง x, y
-    return rotated_feature, x, y
+def overlay_feature(background, feature, x, y, in_place=False):
+    """
+    วางฟีเจอร์ลงบนภาพพื้นหลังด้วย alpha blending แบบ vectorized
+    ทำงานเฉพาะ slice ของบริเวณที่วาง (ROI) และตัดส่วนที่เกินขอบภาพออกให้อัตโนมัติ
+    ถ้า in_place=True จะเขียนทับ background โดยตรงโดยไม่ copy ทั้งภาพ
+    """
+    # เลือกว่าจะเขียนทับภาพเดิมหรือสร้างสำเนาใหม่
+    overlay = background if in_place else background.copy()
+    # เก็บขนาดของภาพพื้นหลังและฟีเจอร์
+    bg_height, bg_width = overlay.shape[:2]
+    fg_height, fg_width = feature.shape[:2]
+
+    # ตัดพิกัดให้อยู่ในขอบเขตของภาพพื้นหลัง
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + fg_width, bg_width), min(y + fg_height, bg_height)
+    # ถ้าฟีเจอร์อยู่นอกภาพทั้งหมด ไม่ต้องทำอะไร
+    if x0 >= x1 or y0 >= y1:
+        return overlay
 
-def overlay_feature(background, feature, x, y):
-    """
-    วางฟีเจอร์ลงบนภาพพื้นหลัง โดยใช้ alpha channel
-    """
-    # เก็บขนาดของฟีเจอร์
-    fg_height, fg_width, _ = feature.shape
-    # สร้างสำเนาของภาพพื้นหลัง
-    overlay = background.copy()
-    # วนลูปผ่านทุกพิกเซลของฟีเจอร์
-    for i in range(fg_height):
-        for j in range(fg_width):
-            # ตรวจสอบว่า alpha channel > 0 (มีเนื้อหา)
-            if feature[i, j, 3] > 0:
-                # วางสี RGB ของฟีเจอร์ลงบนภาพพื้นหลัง
-                overlay[y + i, x + j] = feature[i, j, :3]
+    # slice เฉพาะส่วนของฟีเจอร์และพื้นหลังที่ซ้อนกัน (เป็น view ไม่ใช่สำเนา)
+    fg = feature[y0 - y:y1 - y, x0 - x:x1 - x]
+    roi = overlay[y0:y1, x0:x1]
+
+    # ถ้าฟีเจอร์ไม่มี alpha channel ให้วางทับตรงๆ
+    if fg.shape[2] == 3:
+        roi[:] = fg
+        return overlay
+
+    # alpha blending ด้วยเลขจำนวนเต็ม: (fg * a + bg * (255 - a)) / 255 แบบปัดเศษ
+    alpha = fg[:, :, 3:4]
+    blended = fg[:, :, :3].astype(np.uint16) * alpha
+    blended += roi.astype(np.uint16) * (255 - alpha)
+    blended += 127
+    blended //= 255
+    # เขียนผลลัพธ์กลับลงใน ROI ของภาพพื้นหลัง
+    roi[:] = blended
     # ส่งคืนภาพที่วางฟีเจอร์แล้ว
     return overlay
 
@@ -127,9 +183,10 @@ def get_true_bbox_from_alpha(feature_image):
     # ส่งคืนตำแหน่งและขนาดของ bounding box
     return x, y, w, h
 
-def save_annotation(annotation_path, x, y, width, height, angle, bg_width, bg_height):
+def yolo_annotation_line(class_id, x, y, width, height, bg_width, bg_height):
     """
-    สร้าง annotation ไฟล์ในรูปแบบ YOLO (normalized)
+    สร้าง annotation หนึ่งบรรทัดในรูปแบบ YOLO (normalized)
+    รูปแบบ: class x_center y_center width height
     """
     # คำนวณจุดศูนย์กลางของ bounding box (normalized)
     x_center = (x + width / 2) / bg_width
@@ -137,91 +194,927 @@ def save_annotation(annotation_path, x, y, width, height, angle, bg_width, bg_he
     # คำนวณความกว้างและความสูง (normalized)
     norm_width = width / bg_width
     norm_height = height / bg_height
+    return f"{class_id} {x_center} {y_center} {norm_width} {norm_height}\n"
 
+def save_annotation(annotation_path, x, y, width, height, angle, bg_width, bg_height):
+    """
+    สร้าง annotation ไฟล์ในรูปแบบ YOLO (normalized)
+    """
     # เขียนไฟล์ annotation ในรูปแบบ YOLO
     with open(annotation_path, 'w') as f:
-        # รูปแบบ: class x_center y_center width height
-        f.write(f"0 {x_center} {y_center} {norm_width} {norm_height}\n")
+        f.write(yolo_annotation_line(0, x, y, width, height, bg_width, bg_height))
 
-def generate_synthetic_dataset(backgrounds_path, features_path, output_path, annotations_path, num_images, log_callback=None):
+def save_annotations(annotation_path, boxes, bg_width, bg_height):
     """
-    สร้างภาพ Synthetic โดยการสุ่มนำฟีเจอร์ไปวางบนพื้นที่น้ำของภาพพื้นหลัง
-    และบันทึก annotation ประกอบ (แบบ YOLO format)
+    สร้างไฟล์ annotation แบบ YOLO หนึ่งบรรทัดต่อวัตถุ
+    boxes: list ของ (class_id, x, y, width, height) หน่วยพิกเซล
+    """
+    with open(annotation_path, 'w') as f:
+        f.writelines(yolo_annotation_line(class_id, x, y, w, h, bg_width, bg_height) for class_id, x, y, w, h in boxes)
+
+def derive_seed(base_seed, index):
+    """
+    สร้าง seed ของภาพลำดับที่ index จาก base seed
+    ค่าที่ได้ขึ้นกับ (base_seed, index) เท่านั้น ไม่ขึ้นกับลำดับการประมวลผลหรือจำนวน worker
+    """
+    return int(np.random.SeedSequence([base_seed, index]).generate_state(1)[0])
+
+def sample_object_count(objects_per_image, rng):
+    """
+    สุ่มจำนวนวัตถุในภาพจาก objects_per_image
+    - int: จำนวนคงที่ (ไม่ใช้ rng จึงได้ภาพเดิมทุกบิตเมื่อเป็น 1)
+    - (min, max): สุ่มเท่ากันทุกค่าในช่วง [min, max]
+    - dict ของ จำนวน -> น้ำหนัก: สุ่มตามน้ำหนัก เช่น {1: 0.5, 2: 0.3, 3: 0.2}
+    """
+    if isinstance(objects_per_image, dict):
+        counts = sorted(objects_per_image)
+        weights = np.array([objects_per_image[k] for k in counts], np.float64)
+        return int(counts[rng.choice(len(counts), p=weights / weights.sum())])
+    if isinstance(objects_per_image, (tuple, list)):
+        return int(rng.integers(objects_per_image[0], objects_per_image[1] + 1))
+    return int(objects_per_image)
+
+def box_iou(box_a, box_b):
+    """
+    IoU ของ bounding box (x, y, width, height) สองกล่อง
+    """
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+def visible_box(objects, j):
+    """
+    bounding box (x, y, width, height) ของส่วนที่มองเห็นของวัตถุลำดับ j หลังถูกวัตถุที่วางทีหลังบัง
+    objects: list ของ dict ที่มี "sprite" (RGBA), "x", "y", "box" ตามลำดับที่วาง
+    alpha ที่มองเห็น = alpha ของวัตถุ x (1 - alpha ของวัตถุที่วางทับ) เหมือนผลของ overlay_feature
+    คืนค่า box เดิมถ้าไม่มีวัตถุใดทับ หรือ None ถ้าถูกบังทั้งหมด
+    """
+    sprite, x, y = objects[j]["sprite"], objects[j]["x"], objects[j]["y"]
+    height, width = sprite.shape[:2]
+    visible = None
+    for later in objects[j + 1:]:
+        later_sprite, lx, ly = later["sprite"], later["x"], later["y"]
+        x0, y0 = max(x, lx), max(y, ly)
+        x1, y1 = min(x + width, lx + later_sprite.shape[1]), min(y + height, ly + later_sprite.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            continue
+        if visible is None:
+            visible = sprite[:, :, 3].astype(np.float32)
+        visible[y0 - y:y1 - y, x0 - x:x1 - x] *= 1 - later_sprite[y0 - ly:y1 - ly, x0 - lx:x1 - lx, 3] / 255.0
+    if visible is None:
+        return objects[j]["box"]
+    # พิกเซลที่ alpha หลังปัดเป็น uint8 ยังมากกว่า 0
+    coords = cv2.findNonZero((visible >= 0.5).view(np.uint8))
+    if coords is None:
+        return None
+    rel_x, rel_y, rel_w, rel_h = cv2.boundingRect(coords)
+    return x + rel_x, y + rel_y, rel_w, rel_h
+
+def load_render_feature(feature_path, feature_index=None, sprite_bank_dir=None,
+                        sprite_scale_step=SPRITE_SCALE_STEP, sprite_angle_step=SPRITE_ANGLE_STEP):
+    """
+    โหลดฟีเจอร์สำหรับ render: คืนค่า (feature, sprite_bank, hull)
+    - sprite_bank_dir: โหลด sprite bank แทนภาพ (feature เป็น None)
+    - feature_index: ฟีเจอร์ที่มีใน index ใช้ภาพที่ crop ไว้ (ถ้ามี) และ hull สำหรับคำนวณ bbox
+    """
+    if sprite_bank_dir:
+        return None, load_sprite_bank(feature_path, sprite_bank_dir, sprite_scale_step, sprite_angle_step), None
+    entry = feature_index.get(os.path.basename(feature_path)) if feature_index else None
+    if entry is not None and "crop" in entry:
+        # ภาพที่ crop รอบวัตถุไว้แล้ว (เล็กกว่าภาพเต็ม จึง resize/หมุนเร็วกว่า) ปรับ hull เป็นพิกัดของ crop
+        crop_path = os.path.join(os.path.dirname(feature_path), FEATURE_CROP_DIRNAME, entry["crop"])
+        feature = load_image(crop_path, cv2.IMREAD_UNCHANGED)
+        if feature is not None:
+            return feature, None, np.asarray(entry["hull"]) - entry["crop_origin"]
+    feature = load_image(feature_path, cv2.IMREAD_UNCHANGED)
+    return feature, None, np.asarray(entry["hull"]) if entry is not None else None
+
+def sample_assets(rng, backgrounds, features, placement_plan=None):
+    """
+    สุ่มภาพพื้นหลังและฟีเจอร์ของวัตถุชิ้นแรก คืนค่า (b, bg_path, feature_path, scale_range)
+    b คือลำดับของพื้นหลังใน placement_plan (None ถ้าไม่ใช้ plan)
+    """
+    if placement_plan is not None:
+        b, f, scale_range = sample_placement(placement_plan, rng)
+        return b, backgrounds[b], features[f], scale_range
+    bg_path = backgrounds[rng.integers(len(backgrounds))]
+    feature_path = features[rng.integers(len(features))]
+    return None, bg_path, feature_path, SCALE_RANGE
+
+def predict_assets(seed, backgrounds, features, objects_per_image=1, placement_plan=None):
+    """
+    ทำนาย (bg_path, feature_path) ที่ compose_synthetic_image จะสุ่มได้ในครั้งแรกด้วย seed เดียวกัน
+    ใช้ generator แยกของตัวเอง จึงไม่กระทบลำดับการสุ่มของภาพจริง (ใช้โหลดภาพล่วงหน้า)
+    """
+    rng = np.random.default_rng(seed)
+    sample_object_count(objects_per_image, rng)
+    _, bg_path, feature_path, _ = sample_assets(rng, backgrounds, features, placement_plan)
+    return bg_path, feature_path
+
+def place_object(background, water_mask, feature, sprite_bank, hull, rng, scale_range=SCALE_RANGE, water_integral=None):
+    """
+    สุ่มวางฟีเจอร์หนึ่งชิ้นบนพื้นที่น้ำ คืนค่า dict ของ "sprite", "x", "y" และ "box" (x, y, width, height)
+    หรือ None ถ้าไม่มีตำแหน่งที่เหมาะสม
+    water_integral (optional) คือ integral image ของ water_mask ที่คำนวณไว้แล้ว (ใช้ซ้ำทุกวัตถุบนพื้นหลังเดียวกัน)
+    """
+    params = {}
+    placed_feature, x, y = place_feature_on_water(background, feature, water_mask, water_integral, rng=rng,
+                                                  sprite_bank=sprite_bank, hull=hull, scale_range=scale_range,
+                                                  params=params)
+    if placed_feature is None:
+        return None
+    return placed_object(placed_feature, x, y, params)
+
+def placed_object(placed_feature, x, y, params=None):
+    """
+    dict ของวัตถุที่วางแล้ว: "sprite", "x", "y", "box" (x, y, width, height) และ "params" ที่ใช้ render
+    """
+    # หา bounding box จาก alpha ของฟีเจอร์ที่วางแล้ว (x + rel_x = ตำแหน่ง x สุดท้าย)
+    # ฟีเจอร์ที่ตัดตาม hull แล้วเป็นภาพเล็ก จึงสแกน alpha ได้เร็ว (กล่องจาก hull ใหญ่กว่าวัตถุได้หลายพิกเซล)
+    rel_x, rel_y, rel_w, rel_h = get_true_bbox_from_alpha(placed_feature)
+    return {"sprite": placed_feature, "x": x, "y": y, "box": (x + rel_x, y + rel_y, rel_w, rel_h), "params": params}
+
+def compose_synthetic_image(i, seed, backgrounds, features, mask_cache_dir=None, mask_scale=MASK_SCALE,
+                            sprite_bank_dir=None, sprite_scale_step=SPRITE_SCALE_STEP, sprite_angle_step=SPRITE_ANGLE_STEP,
+                            feature_index=None, placement_plan=None, objects_per_image=1, max_iou=MAX_OBJECT_IOU,
+                            feature_classes=None):
+    """
+    สร้างภาพ synthetic ลำดับที่ i ในหน่วยความจำ (ยังไม่เขียนไฟล์) โดยใช้ random generator ของภาพนั้นเอง
+    (seed ได้จาก derive_seed) ผลลัพธ์ของ index เดียวกันจึงเหมือนเดิมทุกบิตไม่ว่าจะรันด้วยกี่ worker
+    mask_scale คือความละเอียดของ water mask เทียบกับภาพพื้นหลัง (ดู water_mask_functional.detect_water_area)
+    ถ้ากำหนด sprite_bank_dir จะใช้ sprite ที่ pre-render ไว้แทนการแปลงพิกเซลของฟีเจอร์
+    feature_index (optional) คือ dict จาก load_feature_index ฟีเจอร์ที่มีใน index จะโหลดภาพที่ crop ไว้แล้ว (ถ้ามี)
+    และตัดภาพที่หมุนแล้วตามกล่องจาก hull ก่อนสแกน alpha หา bounding box
+    placement_plan (optional) คือตารางจาก build_placement_plan จะสุ่มเฉพาะชุด (พื้นหลัง, ฟีเจอร์, scale) ที่วางได้
+    และถ้ายังวางไม่ได้จะสุ่มชุดใหม่ได้สูงสุด MAX_PLACEMENT_ATTEMPTS ครั้ง ทุก index จึงได้ภาพ
+    objects_per_image คือจำนวนวัตถุต่อภาพ (ดู sample_object_count) วัตถุชิ้นถัดไปใช้พื้นหลังเดิม
+    และต้องมี IoU กับวัตถุที่วางแล้วไม่เกิน max_iou (วางไม่ได้ภายใน MAX_PLACEMENT_ATTEMPTS ครั้งจะข้ามวัตถุนั้น)
+    feature_classes (optional) คือ dict ของ ชื่อไฟล์ฟีเจอร์ -> class id (ไม่มีใน dict = class 0)
+
+    คืนค่า (synthetic_image, boxes, metadata)
+    - boxes: list ของ (class_id, x, y, width, height) หน่วยพิกเซล หนึ่งกล่องต่อวัตถุ
+      เป็นกล่องของส่วนที่มองเห็นหลังถูกวัตถุที่วางทีหลังบัง (วัตถุที่ถูกบังทั้งหมดไม่มีกล่อง)
+    - metadata: dict ของ index, seed, path ที่สุ่มได้ และขนาดภาพ
+    ถ้าสร้างไม่สำเร็จ synthetic_image จะเป็น None และ metadata["error"] คือข้อความ log
+    """
+    metadata = {"index": i, "seed": seed}
+    # random generator เฉพาะของภาพนี้
+    rng = np.random.default_rng(seed)
+    object_count = sample_object_count(objects_per_image, rng)
+    render_options = {"feature_index": feature_index, "sprite_bank_dir": sprite_bank_dir,
+                      "sprite_scale_step": sprite_scale_step, "sprite_angle_step": sprite_angle_step}
+
+    # มี placement_plan: สุ่มใหม่จากชุดที่วางได้เมื่อวางไม่สำเร็จ (ด้วย rng เดิม จึงยังได้ผลเดิมทุกครั้ง)
+    attempts = MAX_PLACEMENT_ATTEMPTS if placement_plan is not None else 1
+    for attempt in range(attempts):
+        # สุ่มเลือกภาพพื้นหลังและฟีเจอร์ (และช่วง scale ที่วางบนพื้นหลังนั้นได้)
+        b, bg_path, feature_path, scale_range = sample_assets(rng, backgrounds, features, placement_plan)
+        metadata.update(background=bg_path, feature=feature_path)
+
+        # โหลดภาพพื้นหลัง (ผ่าน cache ได้เป็นภาพอ่านอย่างเดียวที่แชร์กัน)
+        background = load_image(bg_path)
+        # โหลด sprite bank ของฟีเจอร์ หรือโหลดภาพฟีเจอร์พร้อม alpha channel
+        feature, sprite_bank, hull = load_render_feature(feature_path, **render_options)
+
+        # ตรวจสอบว่าโหลดภาพสำเร็จหรือไม่
+        if background is None or (feature is None and sprite_bank is None):
+            metadata["error"] = f"❌ ไม่สามารถโหลดภาพ: {bg_path} หรือ {feature_path}\n"
+            return None, None, metadata
+
+        # ตรวจจับพื้นที่น้ำในภาพพื้นหลัง (ใช้ mask จาก cache ถ้าเคยคำนวณแล้ว)
+        water_mask = get_water_mask(bg_path, background, cache_dir=mask_cache_dir, scale=mask_scale)
+        # คำนวณ integral image ของ mask ครั้งเดียวต่อพื้นหลัง ใช้ร่วมกันทุกการสุ่มตำแหน่งบนพื้นหลังนี้
+        water_integral = compute_water_integral(water_mask)
+        # วางฟีเจอร์บนพื้นที่น้ำ
+        placed = place_object(background, water_mask, feature, sprite_bank, hull, rng, scale_range, water_integral)
+        if placed is not None:
+            break
+
+    # ตรวจสอบว่าวางฟีเจอร์สำเร็จหรือไม่
+    if placed is None:
+        metadata["error"] = f"❌ ไม่พบตำแหน่งน้ำที่เหมาะสมสำหรับ {os.path.basename(bg_path)}\n"
+        return None, None, metadata
+    metadata["attempts"] = attempt + 1
+    placed["feature"] = feature_path
+    objects = [placed]
+
+    # วัตถุชิ้นถัดไปบนพื้นหลังเดิม: ต้องอยู่บนน้ำและทับวัตถุที่วางแล้วไม่เกิน max_iou
+    for _ in range(1, object_count):
+        for _ in range(MAX_PLACEMENT_ATTEMPTS):
+            if placement_plan is not None:
+                f, scale_range = sample_feature_for_background(placement_plan, b, rng)
+                feature_path = features[f]
+            else:
+                feature_path = features[rng.integers(len(features))]
+            feature, sprite_bank, hull = load_render_feature(feature_path, **render_options)
+            if feature is None and sprite_bank is None:
+                continue
+            placed = place_object(background, water_mask, feature, sprite_bank, hull, rng, scale_range, water_integral)
+            if placed is not None and all(box_iou(placed["box"], other["box"]) <= max_iou for other in objects):
+                placed["feature"] = feature_path
+                objects.append(placed)
+                break
+
+    synthetic_image, boxes = composite_objects(background, objects, feature_classes)
+    # พารามิเตอร์ของทุกวัตถุ (render ภาพเดิมซ้ำได้โดยไม่ต้องสุ่มใหม่ ดู virtual_dataset_functional)
+    metadata.update(width=background.shape[1], height=background.shape[0],
+                    features=[placed["feature"] for placed in objects],
+                    placements=[dict(placed["params"], feature=placed["feature"]) for placed in objects])
+    return synthetic_image, boxes, metadata
+
+def composite_objects(background, objects, feature_classes=None):
+    """
+    วางวัตถุทุกชิ้น (จาก placed_object ตามลำดับที่วาง) ลงบนสำเนาของภาพพื้นหลัง
+    คืนค่า (ภาพ, boxes) โดย boxes เป็นกล่องของส่วนที่มองเห็นพร้อม class id (ดู visible_box)
+    """
+    # วางฟีเจอร์ลงบนสำเนาของภาพพื้นหลัง (ภาพใน cache ห้ามแก้ไข) ชิ้นถัดไปเขียนทับสำเนาเดิม
+    synthetic_image = overlay_feature(background, objects[0]["sprite"], objects[0]["x"], objects[0]["y"])
+    for placed in objects[1:]:
+        overlay_feature(synthetic_image, placed["sprite"], placed["x"], placed["y"], in_place=True)
+
+    # กล่องของส่วนที่มองเห็น (วัตถุที่วางทีหลังบังวัตถุที่วางก่อน)
+    boxes = []
+    for j, placed in enumerate(objects):
+        box = visible_box(objects, j)
+        if box is not None:
+            class_id = feature_classes.get(os.path.basename(placed["feature"]), 0) if feature_classes else 0
+            boxes.append((class_id, *box))
+    return synthetic_image, boxes
+
+def save_synthetic_sample(synthetic_image, boxes, metadata, output_path, annotations_path):
+    """
+    เข้ารหัสและบันทึกภาพ synthetic พร้อมไฟล์ annotation (YOLO format)
+    คืนค่าเป็นข้อความ log ของภาพนี้
+    """
+    # สร้างชื่อไฟล์ภาพและ annotation (ตามลำดับรวมของทั้งงาน)
+    key = sample_key(metadata["index"])
+    image_name = f"{key}.jpg"
+    annotation_name = f"{key}.txt"
+
+    # ✅ ตรวจสอบว่าเขียนไฟล์ภาพสำเร็จหรือไม่
+    saved = cv2.imwrite(os.path.join(output_path, image_name), synthetic_image)
+    if not saved:
+        return f"❌ ไม่สามารถบันทึกภาพ: {image_name}\n"
+
+    # บันทึก annotation หนึ่งบรรทัดต่อวัตถุ (ขนาดภาพพื้นหลังใช้ normalize)
+    save_annotations(os.path.join(annotations_path, annotation_name), boxes, metadata["width"], metadata["height"])
+
+    # ข้อความว่าสร้างภาพสำเร็จ
+    return f"✅ สร้างภาพ: {image_name}\n"
+
+def encode_synthetic_sample(synthetic_image, boxes, metadata):
+    """
+    เข้ารหัสภาพเป็น JPEG และสร้าง annotation ในหน่วยความจำ สำหรับเขียนลง shard
+    คืนค่า (key, members) โดย members คือ {"jpg": bytes, "txt": bytes} หรือ (key, None) ถ้าเข้ารหัสไม่ได้
+    """
+    key = sample_key(metadata["index"])
+    encoded, buffer = cv2.imencode(".jpg", synthetic_image)
+    if not encoded:
+        return key, None
+    labels = "".join(
+        yolo_annotation_line(class_id, x, y, w, h, metadata["width"], metadata["height"])
+        for class_id, x, y, w, h in boxes
+    )
+    return key, {"jpg": buffer.tobytes(), "txt": labels.encode("utf-8")}
+
+def save_sample_to_shard(shard_writer, synthetic_image, boxes, metadata):
+    """
+    เข้ารหัสภาพและ annotation แล้วเพิ่มลง shard (tar)
+    คืนค่าเป็นข้อความ log ของภาพนี้
+    """
+    key, members = encode_synthetic_sample(synthetic_image, boxes, metadata)
+    if members is None:
+        return f"❌ ไม่สามารถบันทึกภาพ: {key}.jpg\n"
+    shard_writer.add(key, members)
+    return f"✅ สร้างภาพ: {key}\n"
+
+def save_virtual_sample(synthetic_image, boxes, metadata):
+    """
+    ปลายทางของโหมด virtual: ไม่เข้ารหัสหรือเขียนไฟล์ภาพ พารามิเตอร์ของภาพถูกบันทึกใน run manifest
+    แล้วรวมเป็นตารางเมื่อจบการรัน (ดู generate_synthetic_dataset)
+    คืนค่าเป็นข้อความ log ของภาพนี้
+    """
+    return f"✅ บันทึกพารามิเตอร์: {sample_key(metadata['index'])}\n"
+
+def list_generation_assets(backgrounds_path, features_path):
+    """
+    คืนค่ารายการ path ของภาพพื้นหลัง (.jpg) และภาพฟีเจอร์ (.png) เรียงตามชื่อ
     """
     # สร้างรายการ path ของภาพพื้นหลังทั้งหมด (เฉพาะไฟล์ .jpg)
     backgrounds = [os.path.join(backgrounds_path, f) for f in sorted(os.listdir(backgrounds_path)) if f.endswith('.jpg')]
     # สร้างรายการ path ของภาพฟีเจอร์ทั้งหมด (เฉพาะไฟล์ .png)
     features = [os.path.join(features_path, f) for f in sorted(os.listdir(features_path)) if f.endswith('.png')]
+    return backgrounds, features
+
+def feature_render_sizes(features, feature_index=None, use_sprite_bank=False):
+    """
+    ขนาด (width, height) ของภาพฟีเจอร์ที่ถูก resize/หมุนตอนสร้างภาพ ตามลำดับใน features
+    ใช้ขนาดจาก feature index ถ้ามี (ขนาด crop หรือภาพเต็มถ้าใช้ sprite bank) ไม่เช่นนั้นอ่านจาก header ของไฟล์
+    """
+    sizes = []
+    for feature_path in features:
+        entry = feature_index.get(os.path.basename(feature_path)) if feature_index else None
+        if entry is not None:
+            sizes.append((entry["width"], entry["height"]) if use_sprite_bank else feature_canvas_size(entry))
+            continue
+        with Image.open(feature_path) as image:
+            sizes.append(image.size)
+    return sizes
+
+def resize_sample(synthetic_image, boxes, output_size):
+    """
+    ปรับขนาดภาพเป็น output_size (width, height) และปรับ bounding box ตามสัดส่วน
+    """
+    out_width, out_height = output_size
+    scale_x = out_width / synthetic_image.shape[1]
+    scale_y = out_height / synthetic_image.shape[0]
+    resized = cv2.resize(synthetic_image, (out_width, out_height), interpolation=cv2.INTER_AREA)
+    resized_boxes = [(c, x * scale_x, y * scale_y, w * scale_x, h * scale_y) for c, x, y, w, h in boxes]
+    return resized, resized_boxes
+
+def stack_sample_batch(batch):
+    """
+    รวม sample หลายภาพเป็น batch: (images ขนาด (B, H, W, 3), list ของ boxes, list ของ metadata)
+    ทุกภาพใน batch ต้องมีขนาดเท่ากัน (กำหนด output_size ถ้าภาพพื้นหลังมีหลายขนาด)
+    """
+    shapes = {image.shape for image, _, _ in batch}
+    if len(shapes) > 1:
+        raise ValueError(f"ภาพใน batch มีหลายขนาด {sorted(shapes)} กรุณากำหนด output_size")
+    images = np.stack([image for image, _, _ in batch])
+    return images, [boxes for _, boxes, _ in batch], [metadata for _, _, metadata in batch]
+
+def iter_synthetic_samples(backgrounds_path, features_path, num_images=None, seed=None, indices=None,
+                           batch_size=None, output_size=None, log_callback=None, mask_cache_dir=None, mask_scale=MASK_SCALE,
+                           use_sprite_bank=False, sprite_scale_step=SPRITE_SCALE_STEP, sprite_angle_step=SPRITE_ANGLE_STEP,
+                           use_feature_index=True, use_background_index=True, weight_by_water_area=False,
+                           objects_per_image=1, max_iou=MAX_OBJECT_IOU, feature_classes=None,
+                           prefetch_depth=PREFETCH_DEPTH, prefetch_threads=PREFETCH_THREADS):
+    """
+    สร้างภาพ synthetic แบบ lazy ในหน่วยความจำ สำหรับส่งเข้า training loop โดยตรง
+    (ไม่มีการเข้ารหัส JPEG และไม่เขียนไฟล์) ใช้โค้ดวางฟีเจอร์และ overlay ชุดเดียวกับ generate_synthetic_dataset
+
+    yield (image, boxes, metadata) ทีละภาพ หรือ (images, boxes_list, metadata_list) ถ้ากำหนด batch_size
+    - image: ndarray BGR, boxes: list ของ (class_id, x, y, width, height) หน่วยพิกเซล
+    - num_images: จำนวนภาพ (None = สร้างไปเรื่อยๆ ไม่สิ้นสุด)
+    - indices: ระบุลำดับภาพที่ต้องการเอง (แทน num_images) เช่นเมื่อแบ่งงานให้หลาย worker
+    - seed: base seed ภาพลำดับที่ i ใช้ derive_seed(seed, i) เสมอ
+    - output_size: (width, height) ปรับขนาดภาพและ box หลัง composite (จำเป็นสำหรับ batch ถ้าพื้นหลังมีหลายขนาด)
+    - mask_scale: ความละเอียดของ water mask เทียบกับภาพพื้นหลัง (ดู generate_synthetic_dataset)
+    - use_feature_index: ใช้ index ของฟีเจอร์ (features_path/.feature_index.json) ถ้ามี (ดู update_feature_index)
+    - use_background_index: ใช้ index ของพื้นหลัง (backgrounds_path/.background_index.json) ถ้ามี
+      เพื่อสุ่มเฉพาะชุด (พื้นหลัง, ฟีเจอร์, scale) ที่วางได้ (ดู update_background_index)
+    - weight_by_water_area: สุ่มพื้นหลังตามพื้นที่น้ำ ภาพที่มีน้ำมากถูกเลือกบ่อยกว่า
+    - objects_per_image: จำนวนวัตถุต่อภาพ เป็น int, ช่วง (min, max) หรือ dict ของ จำนวน -> น้ำหนัก
+    - max_iou: IoU สูงสุดระหว่างวัตถุในภาพเดียวกัน
+    - feature_classes: dict ของ ชื่อไฟล์ฟีเจอร์ -> class id (None = อ่านจาก features_path/classes.json ถ้ามี)
+    - prefetch_depth: จำนวนภาพถัดไปที่ถอดรหัสพื้นหลัง/ฟีเจอร์และโหลด water mask ไว้ล่วงหน้าบน thread เบื้องหลัง
+      ระหว่างสร้างภาพปัจจุบัน (0 = ไม่โหลดล่วงหน้า) ผลลัพธ์เหมือนเดิมทุกบิต ดูเวลาที่ต้องรอได้จาก get_prefetch_stats
+    - prefetch_threads: จำนวน thread ที่โหลดล่วงหน้าพร้อมกัน
+    ภาพที่สร้างไม่สำเร็จจะถูกข้ามและแจ้งผ่าน log_callback
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg)
+        else: print(msg)
+
+    backgrounds, features = list_generation_assets(backgrounds_path, features_path)
+    # โฟลเดอร์ cache ของ water mask
+    if mask_cache_dir is None:
+        mask_cache_dir = os.path.join(backgrounds_path, MASK_CACHE_DIRNAME)
+    # กำหนด base seed (บันทึกไว้ใน log เพื่อให้สร้างซ้ำได้)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+        log(f"🎲 seed: {seed}\n")
+    # ลำดับของภาพที่จะสร้าง
+    if indices is None:
+        indices = itertools.count(1) if num_images is None else range(1, num_images + 1)
+
+    # พารามิเตอร์ที่ใช้ร่วมกันทุกภาพ
+    options = {
+        "mask_cache_dir": mask_cache_dir,
+        "mask_scale": mask_scale,
+        "sprite_bank_dir": os.path.join(features_path, SPRITE_BANK_DIRNAME) if use_sprite_bank else None,
+        "sprite_scale_step": sprite_scale_step,
+        "sprite_angle_step": sprite_angle_step,
+        "feature_index": load_feature_index(features_path) if use_feature_index else None,
+        "objects_per_image": objects_per_image,
+        "max_iou": max_iou,
+        "feature_classes": feature_classes if feature_classes is not None else load_feature_classes(features_path),
+    }
+    if use_background_index:
+        sizes = feature_render_sizes(features, options["feature_index"], use_sprite_bank)
+        # sprite bank ปัด scale เข้าหา grid (ขึ้นได้ครึ่งช่อง) จึงเผื่อไว้ไม่ให้ sprite ใหญ่เกินที่วางได้
+        options["placement_plan"] = build_placement_plan(backgrounds, sizes, load_background_index(backgrounds_path, mask_scale),
+                                                         weight_by_water_area,
+                                                         scale_margin=sprite_scale_step / 2 if use_sprite_bank else 0.0)
+        if options["placement_plan"] is None:
+            log("⚠️ ไม่มีพื้นหลังที่วางฟีเจอร์ได้ตาม background index\n")
+
+    def prefetch_assets(i):
+        # โหลดภาพพื้นหลัง ฟีเจอร์ และ water mask ของชุดแรกที่ภาพลำดับ i จะสุ่มได้เข้า cache
+        # (ชุดที่สุ่มใหม่เมื่อวางไม่ได้และวัตถุชิ้นถัดไปขึ้นกับผลการวาง จึงโหลดตอนสร้างภาพตามเดิม)
+        bg_path, feature_path = predict_assets(derive_seed(seed, i), backgrounds, features, objects_per_image,
+                                               options.get("placement_plan"))
+        background = load_image(bg_path)
+        if options["sprite_bank_dir"] is None:
+            load_render_feature(feature_path, options["feature_index"])
+        if background is not None:
+            get_water_mask(bg_path, background, cache_dir=mask_cache_dir, scale=mask_scale)
+
+    batch = []
+    for i in prefetch_iter(indices, prefetch_assets, prefetch_depth, prefetch_threads):
+        try:
+            synthetic_image, boxes, metadata = compose_synthetic_image(
+                i, derive_seed(seed, i), backgrounds, features, **options
+            )
+        except Exception as e:
+            # แสดงข้อความ error หากเกิดข้อผิดพลาด
+            log(f"❌ Error at image {i}: {e}\n")
+            continue
+        if synthetic_image is None:
+            log(metadata["error"])
+            continue
+        if output_size is not None:
+            synthetic_image, boxes = resize_sample(synthetic_image, boxes, output_size)
+            metadata.update(width=output_size[0], height=output_size[1])
+
+        if batch_size is None:
+            yield synthetic_image, boxes, metadata
+            continue
+        batch.append((synthetic_image, boxes, metadata))
+        if len(batch) == batch_size:
+            yield stack_sample_batch(batch)
+            batch = []
+    # batch สุดท้ายที่ยังไม่เต็ม
+    if batch:
+        yield stack_sample_batch(batch)
+
+class VirtualDataset:
+    """
+    อ่านชุดข้อมูลโหมด virtual (output_format="virtual") ที่เก็บเฉพาะตารางพารามิเตอร์ของวัตถุ (ดู virtual_dataset_functional)
+    แล้ว render ภาพตามต้องการด้วยโค้ดวางฟีเจอร์และ overlay ชุดเดียวกับ compose_synthetic_image
+    (resolution=1 ได้ภาพเดียวกับตอนสร้างทุกบิตก่อนเข้ารหัส JPEG)
+    - paths: ไฟล์ตาราง .npz หรือโฟลเดอร์ output (รวมตารางของทุกเครื่อง)
+    - backgrounds_path, features_path: โฟลเดอร์ input ชุดเดียวกับตอนสร้าง ต้องมีไฟล์ครบตามชื่อที่บันทึกไว้
+    - cache_size: จำนวนภาพที่ render แล้วเก็บไว้ใน LRU cache (ภาพใน cache เป็นแบบอ่านอย่างเดียว)
+    ทุกเมธอดปลอดภัยเมื่อเรียกจากหลาย thread
+    """
+
+    def __init__(self, paths, backgrounds_path, features_path, cache_size=RENDER_CACHE_SIZE):
+        self.placements, self.boxes, self.info = load_virtual_dataset(paths)
+        self.backgrounds = [os.path.join(backgrounds_path, name) for name in self.info["backgrounds"]]
+        self.features = [os.path.join(features_path, name) for name in self.info["features"]]
+        missing = [path for path in self.backgrounds + self.features if not os.path.exists(path)]
+        if missing:
+            raise ValueError(f"ไม่พบไฟล์ input ที่ใช้ตอนสร้าง {len(missing)} ไฟล์: {missing[:5]}")
+        # ลำดับภาพทั้งหมดในตาราง (เรียงจากน้อยไปมาก)
+        self.indices = np.unique(self.placements["index"])
+        self.render_options = {
+            "feature_index": load_feature_index(features_path) if self.info["use_feature_index"] else None,
+            "sprite_bank_dir": os.path.join(features_path, SPRITE_BANK_DIRNAME) if self.info["use_sprite_bank"] else None,
+            "sprite_scale_step": self.info["sprite_scale_step"],
+            "sprite_angle_step": self.info["sprite_angle_step"],
+        }
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        # position คือลำดับในตาราง (0..len-1) ไม่ใช่ลำดับภาพ
+        return self.render(int(self.indices[position]))
+
+    @staticmethod
+    def _rows(table, index):
+        # แถวของภาพลำดับที่ index (ตารางเรียงตาม index แล้ว)
+        start, stop = np.searchsorted(table["index"], [index, index + 1])
+        return table[start:stop]
+
+    def labels(self, index):
+        """
+        boxes ของภาพลำดับที่ index จากตาราง (ไม่ต้อง render): list ของ (class_id, x, y, width, height)
+        """
+        return [tuple(int(value) for value in row)[1:] for row in self._rows(self.boxes, index)]
+
+    def render(self, index, resolution=1.0):
+        """
+        render ภาพลำดับที่ index คืนค่า (image, boxes, metadata) เหมือน iter_synthetic_samples
+        resolution คือขนาดเทียบกับภาพพื้นหลังเดิม เช่น 0.5 = ครึ่งหนึ่งต่อด้าน (พื้นหลังถูกย่อ ฟีเจอร์ render ที่ scale ใหม่
+        จากภาพต้นฉบับจึงคมกว่าการย่อภาพที่ composite แล้ว) ถ้าใช้ sprite bank จะ render จากภาพฟีเจอร์เต็มด้วย scale/มุมบน grid
+        """
+        key = (index, resolution)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        rows = self._rows(self.placements, index)
+        if len(rows) == 0:
+            raise KeyError(f"ไม่มีภาพลำดับที่ {index} ในตาราง")
+        bg_path = self.backgrounds[rows[0]["background"]]
+        background = load_image(bg_path)
+        if background is None:
+            raise ValueError(f"ไม่สามารถโหลดภาพ: {bg_path}")
+        if resolution != 1:
+            background = cv2.resize(background, scaled_size(background.shape, resolution), interpolation=cv2.INTER_AREA)
+
+        objects = []
+        for row in rows:
+            feature_path = self.features[row["feature"]]
+            scale, angle, x, y = float(row["scale"]), float(row["angle"]), int(row["x"]), int(row["y"])
+            feature, sprite_bank, hull = load_render_feature(feature_path, **self.render_options)
+            if feature is None and sprite_bank is None:
+                raise ValueError(f"ไม่สามารถโหลดภาพ: {feature_path}")
+            if resolution != 1:
+                if sprite_bank is not None:
+                    # sprite ถูก render ไว้ที่ความละเอียดเดิมเท่านั้น ใช้ scale/มุมของ sprite ที่ใช้ตอนสร้างกับภาพเต็ม
+                    entry = nearest_sprite_entry(sprite_bank, scale, angle)
+                    canvas_size = (int(entry["width"]), int(entry["height"]))
+                    feature = load_image(feature_path, cv2.IMREAD_UNCHANGED)
+                    scale, angle, sprite_bank = float(entry["scale"]), float(entry["angle"]), None
+                else:
+                    canvas_size = scaled_size(feature.shape, scale)
+                scale, x, y = rescale_placement(feature.shape, canvas_size, scale, x, y, resolution)
+            placed_feature, placed_x, placed_y = render_placement(feature, scale, angle, x, y, sprite_bank, hull)
+            objects.append(dict(placed_object(placed_feature, placed_x, placed_y), feature=feature_path))
+
+        synthetic_image, boxes = composite_objects(background, objects, self.info["feature_classes"])
+        synthetic_image.setflags(write=False)
+        metadata = {
+            "index": index,
+            "seed": derive_seed(self.info["seed"], index),
+            "background": bg_path,
+            "features": [placed["feature"] for placed in objects],
+            "width": background.shape[1],
+            "height": background.shape[0],
+            "resolution": resolution,
+        }
+        sample = (synthetic_image, boxes, metadata)
+        with self._lock:
+            self._cache[key] = sample
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return sample
+
+def write_synthetic_chunk(indices, seed, backgrounds_path, features_path, output_path, annotations_path,
+                          encode_only=False, virtual=False, **options):
+    """
+    สร้างและบันทึกภาพ synthetic ตามลำดับใน indices (ใช้ใน worker ของ process pool)
+    ถ้า encode_only=True จะเข้ารหัสในหน่วยความจำและส่งกลับให้ process หลักเขียนลง shard
+    เพราะ tar หนึ่งไฟล์เขียนได้ทีละ process
+    ถ้า virtual=True จะไม่เขียนไฟล์ ส่งกลับเฉพาะพารามิเตอร์ (metadata) ของภาพที่สำเร็จ
+    คืนค่า (รายการข้อความ log, รายการ (key, members) ที่เข้ารหัสแล้ว, รายการ (metadata, boxes) ของภาพที่สำเร็จ)
+    """
+    messages, encoded, written = [], [], []
+    samples = iter_synthetic_samples(backgrounds_path, features_path, seed=seed, indices=indices,
+                                     log_callback=messages.append, **options)
+    for synthetic_image, boxes, metadata in samples:
+        try:
+            if virtual:
+                messages.append(save_virtual_sample(synthetic_image, boxes, metadata))
+                written.append((metadata, boxes))
+                continue
+            if not encode_only:
+                msg = save_synthetic_sample(synthetic_image, boxes, metadata, output_path, annotations_path)
+                messages.append(msg)
+                if msg.startswith("✅"):
+                    written.append((metadata, boxes))
+                continue
+            key, members = encode_synthetic_sample(synthetic_image, boxes, metadata)
+            if members is None:
+                messages.append(f"❌ ไม่สามารถบันทึกภาพ: {key}.jpg\n")
+            else:
+                encoded.append((key, members))
+                written.append((metadata, boxes))
+                messages.append(f"✅ สร้างภาพ: {key}\n")
+        except Exception as e:
+            # ข้อความ error หากเกิดข้อผิดพลาด
+            messages.append(f"❌ Error at image {metadata['index']}: {e}\n")
+    return messages, encoded, written
+
+def sample_files(metadata, output_path, annotations_path, output_format="files"):
+    """
+    ข้อมูลไฟล์ผลลัพธ์ของภาพหนึ่งภาพสำหรับ run manifest (ชื่อและขนาดไฟล์ หรือ key ใน shard)
+    """
+    key = sample_key(metadata["index"])
+    if output_format == "shards":
+        return {"shard_key": key}
+    if output_format == "virtual":
+        # ไม่มีไฟล์ผลลัพธ์ พารามิเตอร์อยู่ใน metadata ของ record
+        return {}
+    return {
+        "image": f"{key}.jpg",
+        "image_size": os.path.getsize(os.path.join(output_path, f"{key}.jpg")),
+        "annotation": f"{key}.txt",
+        "annotation_size": os.path.getsize(os.path.join(annotations_path, f"{key}.txt")),
+    }
+
+def generate_synthetic_dataset(backgrounds_path, features_path, output_path, annotations_path, num_images, log_callback=None,
+                               mask_cache_dir=None, mask_scale=MASK_SCALE, workers=1, seed=None, image_cache_bytes=None,
+                               use_sprite_bank=False, sprite_scale_step=SPRITE_SCALE_STEP, sprite_angle_step=SPRITE_ANGLE_STEP,
+                               use_feature_index=True, use_background_index=True, weight_by_water_area=False,
+                               objects_per_image=1, max_iou=MAX_OBJECT_IOU, feature_classes=None, writer_threads=2, write_queue_size=8, output_format="files", shard_max_bytes=SHARD_MAX_BYTES,
+                               shard_index=0, num_shards=1, coordinator=None, worker_id=None, resume=True,
+                               prefetch_depth=PREFETCH_DEPTH, prefetch_threads=PREFETCH_THREADS):
+    """
+    สร้างภาพ Synthetic โดยการสุ่มนำฟีเจอร์ไปวางบนพื้นที่น้ำของภาพพื้นหลัง
+    และบันทึก annotation ประกอบ (แบบ YOLO format)
+    ภาพถูกสร้างโดย iter_synthetic_samples ฟังก์ชันนี้ทำหน้าที่เขียนผลลัพธ์ลงไฟล์
+
+    - mask_cache_dir (str, optional): โฟลเดอร์เก็บ water mask ที่คำนวณแล้ว
+      ค่าเริ่มต้นคือ backgrounds_path/.water_mask_cache ทำให้รันซ้ำหรือรันต่อไม่ต้องคำนวณ mask ใหม่
+    - mask_scale (float): ความละเอียดของ water mask เทียบกับภาพพื้นหลัง เช่น 0.25 = คำนวณ mask ที่ 1/4 ต่อด้าน
+      (เร็วขึ้นมากกับภาพกล้องขนาดใหญ่) ตำแหน่งวางยังเป็นพิกเซลของภาพเต็ม คลาดไม่เกินหนึ่งช่องของ mask
+    - workers (int): จำนวน process ที่ใช้สร้างภาพพร้อมกัน (1 = ทำงานใน process เดียว)
+    - seed (int, optional): base seed ของการรัน ภาพลำดับที่ i ใช้ seed = derive_seed(seed, i)
+      จึงได้ผลเหมือนเดิมทุกบิตไม่ว่า workers จะเป็นเท่าไร ถ้าไม่กำหนดจะสุ่มจาก random แล้วแสดงใน log
+    - image_cache_bytes (int, optional): งบหน่วยความจำรวม (ไบต์) ของ cache ภาพพื้นหลัง/ฟีเจอร์ที่ถอดรหัสแล้ว
+      (ค่าเริ่มต้นดู IMAGE_CACHE_BUDGET) เมื่อ workers > 1 แต่ละ process ได้งบ image_cache_bytes // workers
+    - use_sprite_bank (bool): ใช้ sprite ที่ pre-render ไว้ทุก scale/มุมบน grid (เก็บใน features_path/.sprite_bank)
+      แทนการ resize/หมุนฟีเจอร์ทุกภาพ
+    - sprite_scale_step, sprite_angle_step: ระยะห่างของ grid ยิ่งเล็กยิ่งหลากหลายแต่ bank ใหญ่และสร้างนานขึ้น
+    - use_feature_index (bool): อัปเดต index ของฟีเจอร์ (bbox, hull, ภาพที่ crop ไว้ใน features_path/.crops)
+      แบบ incremental ก่อนเริ่ม แล้วใช้ภาพที่ crop ไว้และตัดตามกล่องจาก hull ก่อนสแกน alpha แทนการโหลดและสแกนภาพเต็มทุกภาพ
+    - use_background_index (bool): อัปเดต index ของพื้นหลัง (สัดส่วนน้ำ และขนาดฟีเจอร์ใหญ่สุดที่วางได้)
+      แล้วสุ่มเฉพาะชุด (พื้นหลัง, ฟีเจอร์, scale) ที่วางได้ พื้นหลังที่น้ำน้อยจึงไม่ทำให้เสียภาพ
+    - weight_by_water_area (bool): สุ่มพื้นหลังตามพื้นที่น้ำแทนการสุ่มเท่ากันทุกภาพ
+    - objects_per_image: จำนวนวัตถุต่อภาพ เป็น int, ช่วง (min, max) หรือ dict ของ จำนวน -> น้ำหนัก เช่น {1: 0.6, 2: 0.3, 3: 0.1}
+      annotation มีหนึ่งบรรทัดต่อวัตถุที่มองเห็น (วัตถุที่ถูกบังบางส่วนใช้กล่องของส่วนที่มองเห็น)
+    - max_iou (float): IoU สูงสุดที่ยอมให้ bounding box ของวัตถุในภาพเดียวกันทับกัน
+    - feature_classes (dict, optional): ชื่อไฟล์ฟีเจอร์ -> class id ของ YOLO
+      (None = อ่านจาก features_path/classes.json ถ้ามี ฟีเจอร์ที่ไม่ระบุเป็น class 0)
+    - writer_threads (int): จำนวน thread ที่เข้ารหัส JPEG และเขียนไฟล์เบื้องหลังระหว่างสร้างภาพถัดไป
+      (0 = เขียนทันทีแบบเดิม) ใช้เฉพาะโหมด workers=1 เพราะโหมด process pool เขียนขนานกันอยู่แล้ว
+    - write_queue_size (int): จำนวนภาพที่รอเขียนได้สูงสุด ถ้าเต็มจะหยุดสร้างภาพรอจนเขียนทัน
+    - output_format (str): "files" = ภาพ .jpg + annotation .txt แยกไฟล์แบบ YOLO เดิม
+      "shards" = เขียนภาพและ label ของแต่ละ key ลงไฟล์ tar ใน output_path (พร้อม index สำหรับอ่านแบบสุ่ม)
+      แตกกลับเป็นแบบ YOLO ได้ด้วย export_shards_to_yolo เมื่อเริ่มสร้างใหม่ (ไม่ได้ทำต่อ) จะลบ shard เดิมของชื่อเดียวกันก่อน
+      "virtual" = ไม่เก็บภาพ บันทึกเฉพาะตารางพารามิเตอร์ของทุกวัตถุ (virtual_dataset.npz ใน output_path
+      ไม่กี่สิบไบต์ต่อภาพ) แล้ว render ภาพตามต้องการด้วย VirtualDataset (ได้ภาพเดิม หรือ render ที่ความละเอียดอื่น)
+      ยังต้องสุ่มตำแหน่งบน water mask ทุกภาพ แต่ไม่มีการเข้ารหัส JPEG และเขียนไฟล์
+    - shard_max_bytes (int): ขนาดสูงสุดของแต่ละ shard (ไบต์)
+    - shard_index, num_shards (int): แบ่งงานเดียวให้หลายเครื่องโดยไม่ต้องมีตัวกลาง
+      เครื่องที่ shard_index สร้างเฉพาะภาพลำดับ shard_index + 1, shard_index + 1 + num_shards, ... (ดู shard_indices)
+      ชื่อไฟล์ใช้ลำดับรวมของทั้งงานจึงไม่ซ้ำกันระหว่างเครื่อง ทุกเครื่องต้องใช้ seed, input และพารามิเตอร์เดียวกัน
+      (num_shards > 1 ต้องกำหนด seed) เมื่อเสร็จจะบันทึก manifest-<shard>-of-<num_shards>.json ใน output_path
+      (เฉพาะ num_shards > 1 การรันเครื่องเดียวไม่มีไฟล์อื่นปนกับภาพ)
+      รวมและตรวจภาพที่ขาด/ซ้ำด้วย merge_shard_manifests
+    - coordinator (str หรือ (host, port), optional): ขอชุดลำดับภาพจาก coordinator (ดู run_coordinator) ทีละชุดแทนการแบ่งแบบตายตัว
+      เครื่องที่เร็วกว่าจึงได้งานมากกว่า ชุดของ worker ที่ตายจะถูกแจกใหม่และได้ภาพเดิมทุกบิต (ต้องกำหนด seed)
+      worker_id คือชื่อของ worker นี้ (ค่าเริ่มต้น: ชื่อเครื่อง-pid ควรกำหนดเองถ้าต้องการ resume)
+    - resume (bool): ทำต่อจากการรันเดิมที่ถูกขัดจังหวะ ทุกภาพที่เขียนเสร็จถูกบันทึกใน run manifest
+      (ไฟล์ซ่อน .run_manifest.jsonl ใน output_path) เมื่อรันใหม่ด้วยพารามิเตอร์เดิม (seed=None ใช้ seed เดิมจาก manifest)
+      จะตรวจไฟล์ของภาพที่บันทึกไว้ (ภาพ JPEG ครบถึง EOI, annotation ขนาดตรง, shard มี index) แล้วสร้างเฉพาะภาพที่ขาด
+      ถ้าพารามิเตอร์ต่างจากเดิมหรือ resume=False จะเริ่มใหม่ทั้งหมด (จำนวนภาพไม่นับเป็นพารามิเตอร์: เพิ่ม num_images
+      แล้วรันต่อจะสร้างเฉพาะภาพที่เพิ่มขึ้น) ถ้าการรันเดิมเสร็จแล้วและไม่ได้กำหนด seed การรันซ้ำจะไม่มีภาพให้สร้าง
+    - prefetch_depth, prefetch_threads: ถอดรหัสภาพและโหลด water mask ของภาพถัดไปล่วงหน้าบน thread เบื้องหลัง
+      (ดู iter_synthetic_samples, 0 = ไม่โหลดล่วงหน้า) ไม่มีผลต่อภาพที่ได้ จึงต่างกันได้ระหว่างเครื่องและเมื่อทำต่อ
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg)
+        else: print(msg)
 
     # สร้างโฟลเดอร์ output หากยังไม่มี
     os.makedirs(output_path, exist_ok=True)
     # สร้างโฟลเดอร์ annotations หากยังไม่มี
     os.makedirs(annotations_path, exist_ok=True)
 
-    # วนลูปสร้างภาพ synthetic ตามจำนวนที่กำหนด
-    for i in range(1, num_images + 1):
-        try:
-            # สุ่มเลือกภาพพื้นหลังและฟีเจอร์
-            bg_path = random.choice(backgrounds)
-            feature_path = random.choice(features)
-
-            # โหลดภาพพื้นหลัง
-            background = cv2.imread(bg_path)
-            # โหลดภาพฟีเจอร์พร้อม alpha channel
-            feature = cv2.imread(feature_path, cv2.IMREAD_UNCHANGED)
-
-            # ตรวจสอบว่าโหลดภาพสำเร็จหรือไม่
-            if background is None or feature is None:
-                msg = f"❌ ไม่สามารถโหลดภาพ: {bg_path} หรือ {feature_path}\n"
-                if log_callback: log_callback(msg)
-                else: print(msg)
-                continue
+    # ภาพที่ node นี้รับผิดชอบ (ตรวจ shard_index ก่อนเริ่มงาน)
+    indices = shard_indices(num_images, shard_index, num_shards)
+    client = CoordinatorClient(coordinator, worker_id) if coordinator is not None else None
+    # run manifest ของการรันเดิม (ถ้ามี) สำหรับทำต่อ
+    run_manifest_path = os.path.join(output_path, run_manifest_name(shard_index, num_shards, client.worker if client else None))
+    previous_header, previous_records = load_run_manifest(run_manifest_path) if resume else (None, {})
+    # กำหนด base seed ของการรัน (บันทึกไว้ใน log เพื่อให้สร้างซ้ำได้) ถ้าไม่กำหนดและมีการรันเดิม ใช้ seed เดิม
+    seed_source = ""
+    if seed is None and previous_header is not None:
+        seed = previous_header["seed"]
+        seed_source = " (seed เดิมจาก run manifest เพราะ resume=True และไม่ได้กำหนด seed)"
+    if seed is None:
+        if num_shards > 1 or coordinator is not None:
+            raise ValueError("การแบ่งงานหลายเครื่อง (num_shards > 1 หรือ coordinator) ต้องกำหนด seed เดียวกันทุกเครื่อง")
+        seed = random.randrange(2 ** 32)
+    log(f"🎲 seed: {seed}{seed_source}\n")
+    if num_shards > 1:
+        log(f"🧭 shard {shard_index + 1}/{num_shards}: {len(indices)} จาก {num_images} ภาพ\n")
 
-            # ตรวจจับพื้นที่น้ำในภาพพื้นหลัง
-            water_mask = detect_water_area(background)
-            # วางฟีเจอร์บนพื้นที่น้ำ
-            placed_feature, x, y = place_feature_on_water(background, feature, water_mask)
+    # เตรียม sprite bank ของทุกฟีเจอร์ไว้ก่อน เพื่อไม่ให้หลาย worker สร้างซ้ำกัน
+    if use_sprite_bank:
+        sprite_bank_dir = os.path.join(features_path, SPRITE_BANK_DIRNAME)
+        _, features = list_generation_assets(backgrounds_path, features_path)
+        for feature_path in features:
+            if build_sprite_bank(feature_path, sprite_bank_dir, sprite_scale_step, sprite_angle_step) is None:
+                log(f"❌ ไม่สามารถสร้าง sprite bank: {os.path.basename(feature_path)}\n")
+        log(f"🧩 sprite bank พร้อมใช้งาน: {len(features)} ฟีเจอร์\n")
 
-            # ตรวจสอบว่าวางฟีเจอร์สำเร็จหรือไม่
-            if placed_feature is None:
-                msg = f"❌ ไม่พบตำแหน่งน้ำที่เหมาะสมสำหรับ {os.path.basename(bg_path)}\n"
-                if log_callback: log_callback(msg)
-                else: print(msg)
-                continue
+    # อัปเดต index ของฟีเจอร์ไว้ก่อน (คำนวณเฉพาะฟีเจอร์ใหม่หรือที่เปลี่ยน) เพื่อให้ทุก worker อ่าน index เดียวกัน
+    if use_feature_index:
+        update_feature_index(features_path, log_callback=log_callback)
+    # อัปเดต index ของพื้นหลัง (ใช้ water mask จาก cache เดียวกับตอนสร้างภาพ)
+    if use_background_index:
+        update_background_index(backgrounds_path, mask_cache_dir or os.path.join(backgrounds_path, MASK_CACHE_DIRNAME),
+                                mask_scale, log_callback=log_callback)
 
-            # วางฟีเจอร์ลงบนภาพพื้นหลัง
-            synthetic_image = overlay_feature(background, placed_feature, x, y)
-            # สร้างชื่อไฟล์ภาพและ annotation
-            image_name = f"synthetic_image_{i:03d}.jpg"
-            annotation_name = f"synthetic_image_{i:03d}.txt"
-
-            # ✅ ตรวจสอบว่าเขียนไฟล์ภาพสำเร็จหรือไม่
-            saved = cv2.imwrite(os.path.join(output_path, image_name), synthetic_image)
-            if not saved:
-                msg = f"❌ ไม่สามารถบันทึกภาพ: {image_name}\n"
-                if log_callback: log_callback(msg)
-                else: print(msg)
-                continue
+    # พารามิเตอร์ของตัวสร้างภาพที่ใช้ร่วมกันทุกภาพ
+    sample_options = {
+        "mask_cache_dir": mask_cache_dir,
+        "mask_scale": mask_scale,
+        "use_sprite_bank": use_sprite_bank,
+        "sprite_scale_step": sprite_scale_step,
+        "sprite_angle_step": sprite_angle_step,
+        "use_feature_index": use_feature_index,
+        "use_background_index": use_background_index,
+        "weight_by_water_area": weight_by_water_area,
+        "objects_per_image": objects_per_image,
+        "max_iou": max_iou,
+        "feature_classes": feature_classes,
+        "prefetch_depth": prefetch_depth,
+        "prefetch_threads": prefetch_threads,
+    }
 
-            # หา bounding box จากฟีเจอร์ที่วางแล้ว
-            rel_x, rel_y, rel_w, rel_h = get_true_bbox_from_alpha(placed_feature)
-            # บันทึก annotation
-            save_annotation(
-                os.path.join(annotations_path, annotation_name),
-                x + rel_x, y + rel_y, rel_w, rel_h, 0,  # x + rel_x = ตำแหน่ง x สุดท้าย
-                background.shape[1], background.shape[0]  # ขนาดภาพพื้นหลัง
-            )
+    # fingerprint ของการรัน (ทุกเครื่องของงานเดียวกันต้องได้ค่าเดียวกัน) ไม่นับโฟลเดอร์ cache ซึ่งต่างกันได้ในแต่ละเครื่อง
+    backgrounds, features = list_generation_assets(backgrounds_path, features_path)
+    fingerprint_options = {key: value for key, value in sample_options.items()
+                           if key not in ("mask_cache_dir", "prefetch_depth", "prefetch_threads")}
+    fingerprint = run_fingerprint(seed, backgrounds, features, dict(fingerprint_options, output_format=output_format))
+    if client is not None:
+        client.fingerprint = fingerprint
 
-            # แสดงข้อความว่าสร้างภาพสำเร็จ
-            msg = f"✅ สร้างภาพ: {image_name}\n"
-            if log_callback: log_callback(msg)
-            else: print(msg)
+    # ปลายทางของภาพ: shard (tar) หรือไฟล์แยกแบบ YOLO
+    # หลายเครื่อง: ตั้งชื่อไฟล์ tar ตาม shard_index หรือชื่อ worker เพื่อไม่ให้ชนกันเมื่อนำผลมารวมกัน
+    if client is not None:
+        shard_prefix = f"shard-{client.worker}"
+    else:
+        shard_prefix = f"shard-{shard_index:05d}" if num_shards > 1 else "shard"
 
-        except Exception as e:
-            # แสดงข้อความ error หากเกิดข้อผิดพลาด
-            msg = f"❌ Error at image {i}: {e}\n"
-            if log_callback: log_callback(msg)
-            else: print(msg)
+    # ทำต่อ: ใช้เฉพาะภาพที่บันทึกไว้ในการรันเดียวกันและไฟล์ยังครบ
+    resumed, first_shard = set(), 0
+    fresh = previous_header is None or previous_header.get("fingerprint") != fingerprint
+    if previous_header is not None and fresh:
+        log("⚠️ พารามิเตอร์ต่างจากการรันเดิม เริ่มสร้างใหม่ทั้งหมด\n")
+    elif not fresh:
+        # seed ของแต่ละภาพไม่ขึ้นกับจำนวนภาพ การรันเดิมที่มีภาพมากกว่าจึงใช้ได้เฉพาะภาพในช่วงของการรันนี้
+        wanted = set(indices)
+        previous_records = {i: record for i, record in previous_records.items() if i in wanted}
+        if output_format == "virtual":
+            # พารามิเตอร์ของทุกภาพอยู่ใน record เองแล้ว
+            resumed = set(previous_records)
+        elif output_format == "shards":
+            # shard ที่ยังเขียนไม่เสร็จตอนหยุดถูกลบ ภาพในนั้นจะถูกสร้างใหม่
+            shard_keys, first_shard = recover_shards(output_path, shard_prefix)
+            resumed = {i for i, record in previous_records.items() if record["files"].get("shard_key") in shard_keys}
+        else:
+            resumed = {i for i, record in previous_records.items() if verify_file_record(record, output_path, annotations_path)}
+        log(f"⏭️ ทำต่อจากการรันเดิม: ข้าม {len(resumed)} ภาพที่เสร็จแล้ว\n")
+        if client is None and len(resumed) == len(indices):
+            log("ℹ️ ทุกภาพเสร็จแล้วจากการรันเดิม ไม่มีภาพที่ต้องสร้าง (ใช้ resume=False หรือ seed อื่นเพื่อสร้างชุดใหม่)\n")
+    if fresh and output_format == "shards":
+        # เริ่มใหม่: ลบ shard เดิมของ prefix นี้ ไม่เช่นนั้น shard ที่ไม่ถูกเขียนทับจะปนกับภาพชุดใหม่ตอนอ่าน
+        removed = remove_shards(output_path, shard_prefix)
+        if removed:
+            log(f"🧹 ลบ shard ของการรันเดิม {removed} ไฟล์\n")
+    header = {"fingerprint": fingerprint, "seed": seed, "num_images": num_images, "shard_index": shard_index,
+              "num_shards": num_shards, "output_format": output_format}
+    run_manifest = RunManifest(run_manifest_path, header, keep=resumed)
+
+    shard_writer = (ShardWriter(output_path, prefix=shard_prefix, max_shard_bytes=shard_max_bytes, first_shard=first_shard)
+                    if output_format == "shards" else None)
+    if shard_writer is not None:
+        write_fn = partial(save_sample_to_shard, shard_writer)
+    elif output_format == "virtual":
+        write_fn = save_virtual_sample
+    else:
+        write_fn = partial(save_synthetic_sample, output_path=output_path, annotations_path=annotations_path)
+
+    def record_sample(metadata, boxes):
+        # บันทึกภาพที่เขียนเสร็จแล้วลง run manifest พร้อมไฟล์ผลลัพธ์และพารามิเตอร์ที่สุ่มได้
+        run_manifest.record(metadata["index"], sample_files(metadata, output_path, annotations_path, output_format),
+                            metadata, boxes)
+
+    def write_sample(synthetic_image, boxes, metadata):
+        # เขียนภาพแล้วบันทึกลง run manifest เมื่อสำเร็จ (ทำงานบน thread ของ AsyncSampleWriter)
+        msg = write_fn(synthetic_image, boxes, metadata)
+        if msg.startswith("✅"):
+            record_sample(metadata, boxes)
+        return msg
+
+    def render(indices):
+        # สร้างและเขียนภาพตามลำดับใน indices ให้เสร็จทั้งหมดก่อนคืนค่า
+        if executor is None:
+            # เขียนไฟล์ผ่าน thread pool ที่มีคิวจำกัด เพื่อให้การสร้างภาพกับ I/O ทำงานซ้อนกัน
+            writer = AsyncSampleWriter(write_sample, threads=writer_threads, max_pending=write_queue_size)
+            try:
+                # วนลูปสร้างภาพ synthetic ตามลำดับที่ได้รับ
+                samples = iter_synthetic_samples(backgrounds_path, features_path, indices=indices, seed=seed,
+                                                 log_callback=log, **sample_options)
+                for synthetic_image, boxes, metadata in samples:
+                    writer.submit(synthetic_image, boxes, metadata)
+                    # แสดงผลของภาพที่เขียนเสร็จแล้ว
+                    for msg in writer.drain():
+                        log(msg)
+            finally:
+                # รอให้เขียนไฟล์ที่ค้างอยู่เสร็จทั้งหมด ทั้งกรณีปกติและกรณีเกิด error
+                for msg in writer.close():
+                    log(msg)
+            return
+
+        # แบ่ง index ของภาพเป็นชุดเล็กๆ กระจายไปยัง process pool แล้วรายงานผลเมื่อแต่ละชุดเสร็จ
+        chunk_size = max(1, min(16, len(indices) // (workers * 4)))
+        chunks = [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)]
+        futures = [
+            executor.submit(write_synthetic_chunk, chunk, seed, backgrounds_path, features_path,
+                            output_path, annotations_path, encode_only=shard_writer is not None,
+                            virtual=output_format == "virtual", **sample_options)
+            for chunk in chunks
+        ]
+        # โหมดไฟล์แยก: แต่ละ worker เขียนไฟล์เอง รายงานผลตามลำดับที่เสร็จ
+        # โหมด shard: process หลักเขียนลง shard ตามลำดับ index
+        for future in (futures if shard_writer is not None else as_completed(futures)):
+            messages, encoded, written = future.result()
+            for key, members in encoded:
+                shard_writer.add(key, members)
+            for metadata, boxes in written:
+                record_sample(metadata, boxes)
+            for msg in messages:
+                log(msg)
+
+    executor = None
+    try:
+        if workers <= 1:
+            if image_cache_bytes is not None:
+                set_image_cache_budget(image_cache_bytes)
+            # นับ hit/miss และสถิติการโหลดล่วงหน้าของการรันนี้เท่านั้น (cache อยู่ข้ามการรันใน process เดิม เช่น UI)
+            reset_image_cache_stats()
+            reset_prefetch_stats()
+        else:
+            # แต่ละ worker มี cache ภาพของตัวเอง จึงแบ่งงบรวมตามจำนวน worker แล้วกำหนดผ่าน initializer
+            cache_budget = (image_cache_bytes if image_cache_bytes is not None else IMAGE_CACHE_BUDGET) // workers
+            # ใช้ spawn เหมือน extract_features: ถ้า process นี้เคยลบพื้นหลัง (เช่นใน UI) thread pool ของ numba (pymatting)
+            # ที่ค้างอยู่ทำให้ fork ค้างได้
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=set_image_cache_budget, initargs=(cache_budget,),
+                                           mp_context=multiprocessing.get_context("spawn"))
+
+        if client is None:
+            render([i for i in indices if i not in resumed])
+        else:
+            # ขอชุดงานจาก coordinator จนงานหมด แจ้งผลเมื่อเขียนภาพของแต่ละชุดเสร็จแล้ว
+            log(f"🛰️ worker {client.worker} เชื่อมต่อ coordinator {coordinator}\n")
+            for chunk_id, chunk in client.iter_chunks():
+                render([i for i in chunk if i not in resumed])
+                client.complete(chunk_id, [i for i in chunk if i in run_manifest.indices])
+        if executor is None:
+            stats = get_image_cache_stats()
+            log(f"📦 image cache: hit {stats['hits']} / miss {stats['misses']}\n")
+            stats = get_prefetch_stats()
+            if stats["prefetched"]:
+                log(f"⏳ prefetch: โหลดล่วงหน้า {stats['prefetched']} ภาพ ({stats['load_seconds']:.2f} s) "
+                    f"รอโหลด {stats['stalls']} ครั้ง ({stats['stall_seconds']:.2f} s)\n")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if shard_writer is not None:
+            shard_writer.close()
+        run_manifest.close()
+
+    if output_format == "virtual":
+        # รวม record ของทุกภาพที่สำเร็จ (รวมภาพจากการรันเดิมที่ทำต่อ) เป็นตารางพารามิเตอร์
+        _, records = load_run_manifest(run_manifest_path)
+        # ไม่นับ record ของภาพนอกช่วงของการรันนี้ (การรันเดิมที่มีจำนวนภาพมากกว่า)
+        records = {i: record for i, record in records.items() if i in run_manifest.indices}
+        placements, boxes = placement_tables(records, backgrounds, features)
+        info = {
+            "fingerprint": fingerprint,
+            "seed": seed,
+            "num_images": num_images,
+            "backgrounds": [os.path.basename(path) for path in backgrounds],
+            "features": [os.path.basename(path) for path in features],
+            "use_feature_index": use_feature_index,
+            "use_sprite_bank": use_sprite_bank,
+            "sprite_scale_step": sprite_scale_step,
+            "sprite_angle_step": sprite_angle_step,
+            "feature_classes": feature_classes if feature_classes is not None else load_feature_classes(features_path),
+        }
+        table_path = os.path.join(output_path, virtual_dataset_name(shard_index, num_shards, client.worker if client else None))
+        write_virtual_dataset(table_path, placements, boxes, info)
+        log(f"🗃️ บันทึกตารางพารามิเตอร์ {len(records)} ภาพ ({os.path.getsize(table_path)} ไบต์): {table_path}\n")
+
+    # โหมด coordinator: coordinator เป็นผู้บันทึก manifest รวม
+    if client is not None:
+        return
+    # บันทึก manifest ของ node นี้จากไฟล์ที่เขียนเสร็จจริง (ใช้ตรวจภาพที่ขาด/ซ้ำตอนรวมผลของทุกเครื่อง)
+    # (เฉพาะเมื่อแบ่งหลายเครื่อง การรันเครื่องเดียวไม่ต้องรวมผล)
+    completed = [i for i in indices if i in run_manifest.indices]
+    if num_shards > 1:
+        write_shard_manifest(output_path, shard_index, num_shards, fingerprint, seed, num_images, completed)
+    if len(completed) < len(indices):
+        log(f"⚠️ สร้างสำเร็จ {len(completed)} จาก {len(indices)} ภาพ\n")
 
 # หากเรียกใช้งานแบบสคริปต์ จะรันตรงนี้ (เช่น python generate_synthetic_functional.py)
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า threading สำหรับ lock ป้องกันการเข้าถึง cache พร้อมกันหลาย thread
+import threading
+# นำเข้า OrderedDict สำหรับทำ LRU cache
+from collections import OrderedDict
+# นำเข้า OpenCV library สำหรับถอดรหัสภาพ
+import cv2
+# นำเข้า NumPy library สำหรับจัดการ array
+import numpy as np
+
+# งบหน่วยความจำเริ่มต้นของ cache (ไบต์) = 1 GB
+IMAGE_CACHE_BUDGET = 1 << 30
+# ภาพย่อสำหรับแสดงใน UI: ด้านยาวสุด (พิกเซล) และงบหน่วยความจำของ cache ภาพย่อ (ไบต์) = 64 MB
+THUMBNAIL_SIZE = 320
+THUMBNAIL_CACHE_BUDGET = 64 << 20
+
+# LRU cache ของภาพที่ถอดรหัสแล้ว: key -> ndarray (อ่านอย่างเดียว)
+_image_cache = OrderedDict()
+# สถานะของ cache: งบ, จำนวนไบต์ที่ใช้, และตัวนับ hit/miss/eviction
+_cache_state = {"budget": IMAGE_CACHE_BUDGET, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0}
+# cache ภาพย่อของ UI แยกจาก cache ของตัวสร้างภาพ (ภาพเต็มที่เปิดดูใน gallery ไม่ไปไล่ภาพพื้นหลังออก)
+_thumbnail_cache = OrderedDict()
+_thumbnail_state = {"budget": THUMBNAIL_CACHE_BUDGET, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0}
+# lock สำหรับใช้ cache จากหลาย thread
+_cache_lock = threading.Lock()
+
+def _evict_to_budget(cache=_image_cache, state=_cache_state):
+    """
+    ลบภาพที่ไม่ได้ใช้นานที่สุดออกจนกว่าขนาดรวมจะไม่เกินงบ (ต้องถือ lock อยู่)
+    """
+    while cache and state["bytes"] > state["budget"]:
+        _, image = cache.popitem(last=False)
+        state["bytes"] -= image.nbytes
+        state["evictions"] += 1
+
+def _file_key(path, *options):
+    # key ผูกกับขนาดและเวลาแก้ไขของไฟล์ ถ้าไฟล์เปลี่ยน cache เก่าจะไม่ถูกใช้ (None ถ้าไม่มีไฟล์)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, *options)
+
+def _cache_get(cache, state, key):
+    # คืนภาพใน cache และนับ hit/miss (None ถ้าไม่มี)
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            state["hits"] += 1
+            return cache[key]
+        state["misses"] += 1
+        return None
+
+def _cache_put(cache, state, key, image):
+    # ห้ามแก้ไขภาพที่แชร์กันใน cache
+    image.flags.writeable = False
+    with _cache_lock:
+        # ภาพที่ใหญ่กว่างบทั้งหมดจะไม่ถูกเก็บ
+        if image.nbytes <= state["budget"] and key not in cache:
+            cache[key] = image
+            state["bytes"] += image.nbytes
+            _evict_to_budget(cache, state)
+    return image
+
+def _decode(path, flags, rgb):
+    # ถอดรหัสภาพนอก lock (ใช้ np.fromfile + imdecode เพื่อรองรับ path ภาษาไทยบน Windows)
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+    if image is not None and rgb and image.ndim == 3:
+        code = cv2.COLOR_BGRA2RGBA if image.shape[2] == 4 else cv2.COLOR_BGR2RGB
+        image = cv2.cvtColor(image, code)
+    return image
+
+def set_image_cache_budget(max_bytes):
+    """
+    กำหนดงบหน่วยความจำ (ไบต์) ของ cache ภาพ ถ้างบลดลงจะลบภาพเก่าออกทันที
+    """
+    with _cache_lock:
+        _cache_state["budget"] = int(max_bytes)
+        _evict_to_budget()
+
+def load_image(path, flags=cv2.IMREAD_COLOR, rgb=False):
+    """
+    โหลดภาพผ่าน LRU cache ที่จำกัดขนาดเป็นไบต์
+    - flags: flag ของ cv2 เช่น cv2.IMREAD_COLOR หรือ cv2.IMREAD_UNCHANGED
+    - rgb=True: แปลง BGR/BGRA เป็น RGB/RGBA (สำหรับแสดงผลใน Streamlit)
+    คืนค่าเป็น ndarray แบบอ่านอย่างเดียว (ผู้เรียกต้อง copy ก่อนแก้ไข) หรือ None ถ้าอ่านภาพไม่ได้
+    """
+    key = _file_key(path, flags, rgb)
+    if key is None:
+        return None
+    image = _cache_get(_image_cache, _cache_state, key)
+    if image is not None:
+        return image
+    image = _decode(path, flags, rgb)
+    if image is None:
+        return None
+    return _cache_put(_image_cache, _cache_state, key, image)
+
+def load_thumbnail(path, max_side=THUMBNAIL_SIZE):
+    """
+    โหลดภาพย่อ (ด้านยาวไม่เกิน max_side, RGB/RGBA) สำหรับ gallery ใน UI ผ่าน cache ภาพย่อที่แยกจาก load_image
+    ภาพเต็มที่ถอดรหัสไม่ถูกเก็บใน cache ใด จึงไม่กินงบของ cache ที่ตัวสร้างภาพใช้
+    คืนค่าเป็น ndarray แบบอ่านอย่างเดียว หรือ None ถ้าอ่านภาพไม่ได้
+    """
+    key = _file_key(path, max_side)
+    if key is None:
+        return None
+    image = _cache_get(_thumbnail_cache, _thumbnail_state, key)
+    if image is not None:
+        return image
+    image = _decode(path, cv2.IMREAD_UNCHANGED, rgb=True)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    if max(height, width) > max_side:
+        ratio = max_side / max(height, width)
+        size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return _cache_put(_thumbnail_cache, _thumbnail_state, key, image)
+
+def get_image_cache_stats():
+    """
+    คืนค่าสถิติของ cache: hits, misses, evictions, จำนวนภาพ, ไบต์ที่ใช้ และงบ
+    """
+    with _cache_lock:
+        return {
+            "hits": _cache_state["hits"],
+            "misses": _cache_state["misses"],
+            "evictions": _cache_state["evictions"],
+            "entries": len(_image_cache),
+            "bytes": _cache_state["bytes"],
+            "budget": _cache_state["budget"],
+        }
+
+def reset_image_cache_stats():
+    """
+    รีเซ็ตตัวนับ hit/miss/eviction โดยไม่ล้างภาพใน cache (ใช้เริ่มนับใหม่ของแต่ละการรันใน process เดิม)
+    """
+    with _cache_lock:
+        _cache_state.update(hits=0, misses=0, evictions=0)
+
+def clear_image_cache():
+    """
+    ล้างภาพทั้งหมดใน cache (รวม cache ภาพย่อ) และรีเซ็ตตัวนับ
+    """
+    with _cache_lock:
+        _image_cache.clear()
+        _cache_state.update(bytes=0, hits=0, misses=0, evictions=0)
+        _thumbnail_cache.clear()
+        _thumbnail_state.update(bytes=0, hits=0, misses=0, evictions=0)
@@ -0,0 +1,152 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า process pool สำหรับแปลงภาพหลายไฟล์พร้อมกัน
+from concurrent.futures import ProcessPoolExecutor
+# นำเข้า partial สำหรับผูกพารามิเตอร์ของ worker
+from functools import partial
+# นำเข้า PIL library สำหรับอ่าน/เขียนภาพและหมุนภาพตาม EXIF
+from PIL import Image, ImageOps
+
+# เปิดการอ่าน HEIC/HEIF ใน Pillow ถ้าติดตั้ง pillow_heif ไว้ (ไม่บังคับ)
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
+
+# นามสกุลไฟล์ภาพที่ ingest รองรับ
+INGEST_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic", ".heif")
+# ความยาวด้านยาวสูงสุดของภาพหลัง ingest (พิกเซล) ภาพที่ใหญ่กว่านี้จะถูกย่อ
+MAX_LONG_EDGE = 4096
+# คุณภาพ JPEG ของภาพที่บันทึก
+JPEG_QUALITY = 95
+# โฟลเดอร์ย่อยที่เก็บไฟล์ต้นฉบับเมื่อแปลงภาพในโฟลเดอร์เดิม
+ORIGINALS_DIRNAME = "originals"
+
+def _same_file(src_path, dst_path):
+    """
+    src_path และ dst_path เป็นไฟล์เดียวกันหรือไม่ (รวมชื่อที่ต่างกันแค่ตัวพิมพ์บนระบบไฟล์ที่ไม่แยกตัวพิมพ์ เช่น Windows)
+    """
+    return os.path.exists(dst_path) and os.path.samefile(src_path, dst_path)
+
+def normalize_image(src_path, dst_path, max_long_edge=MAX_LONG_EDGE, quality=JPEG_QUALITY, originals_dir=None):
+    """
+    แปลงภาพหนึ่งไฟล์ (HEIC/PNG/JPEG) เป็น JPEG มาตรฐาน: หมุนตาม EXIF, แปลงเป็น RGB
+    และย่อให้ด้านยาวไม่เกิน max_long_edge (ใช้ได้ทั้งใน process หลักและใน worker)
+    - originals_dir: ถ้ากำหนด จะย้ายไฟล์ต้นฉบับไปเก็บไว้ก่อน (ใช้เมื่อแปลงในโฟลเดอร์เดิม)
+      ถ้าเป็น None และ dst_path อยู่ในโฟลเดอร์เดียวกับ src_path ไฟล์ต้นฉบับจะถูกลบ
+    คืนค่าข้อความ log ("✅ ...", "⏭️ ..." หรือ "❌ ...")
+    """
+    filename = os.path.basename(src_path)
+    in_place = os.path.dirname(os.path.abspath(src_path)) == os.path.dirname(os.path.abspath(dst_path))
+    # ตรวจก่อนเขียน (หลังแทนที่แล้ว dst_path จะเป็นไฟล์ใหม่)
+    same_file = _same_file(src_path, dst_path)
+    try:
+        with Image.open(src_path) as image:
+            orientation = image.getexif().get(0x0112, 1)
+            needs_resize = max(image.size) > max_long_edge
+            # ไฟล์ .jpg ที่ไม่ต้องหมุนและไม่ต้องย่อ ไม่ต้องเข้ารหัสใหม่
+            if same_file and orientation == 1 and not needs_resize:
+                return f"⏭️ Skipped (already normalized): {filename}"
+            # หมุนภาพตาม EXIF orientation แล้วแปลงเป็น RGB
+            image = ImageOps.exif_transpose(image).convert("RGB")
+        if needs_resize:
+            # ย่อภาพโดยคงสัดส่วน ให้ด้านยาวเท่ากับ max_long_edge
+            image.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS)
+
+        # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+        temp_path = f"{dst_path}.{os.getpid()}.tmp"
+        image.save(temp_path, "JPEG", quality=quality)
+        if in_place and originals_dir:
+            # เก็บต้นฉบับไว้ในโฟลเดอร์ย่อยก่อนแทนที่
+            os.makedirs(originals_dir, exist_ok=True)
+            os.replace(src_path, os.path.join(originals_dir, filename))
+        os.replace(temp_path, dst_path)
+        if in_place and not originals_dir and not same_file:
+            # ลบต้นฉบับ (เช่น .heic) เมื่อไม่ต้องการเก็บไว้
+            os.remove(src_path)
+        return f"✅ Ingested: {filename} → {os.path.basename(dst_path)} ({image.width}x{image.height})"
+    except Exception as e:
+        return f"❌ Error ingesting {filename}: {e}"
+
+def ingest_images(input_folder, output_folder=None, max_long_edge=MAX_LONG_EDGE, workers=1,
+                  keep_originals=True, quality=JPEG_QUALITY, log_callback=None):
+    """
+    เตรียมภาพก่อนเข้าสู่ขั้นตอนอื่น: อ่าน HEIC/PNG/JPEG, หมุนตาม EXIF, ย่อภาพที่ใหญ่เกิน
+    แล้วบันทึกเป็น .jpg (ขั้นตอนแยกฟีเจอร์และสร้าง dataset อ่านเฉพาะ .jpg)
+
+    Parameters:
+    - input_folder (str): โฟลเดอร์ภาพต้นฉบับ
+    - output_folder (str, optional): โฟลเดอร์ปลายทาง (None = แปลงในโฟลเดอร์เดิม)
+    - max_long_edge (int): ความยาวด้านยาวสูงสุด (พิกเซล) เช่นภาพ 48 MP จะถูกย่อลง
+    - workers (int): จำนวน process ที่แปลงภาพพร้อมกัน
+    - keep_originals (bool): เมื่อแปลงในโฟลเดอร์เดิม จะย้ายต้นฉบับไปไว้ใน originals/ (False = ลบต้นฉบับ)
+      ถ้า output_folder เป็นโฟลเดอร์อื่น ไฟล์ต้นฉบับไม่ถูกแก้ไขเลย
+    - log_callback (function, optional): ฟังก์ชันรับข้อความ log (ไม่ส่งมาจะใช้ print())
+    คืนค่าจำนวนภาพที่แปลงสำเร็จ
+    """
+    def log(msg):
+        # ส่ง log ไปยัง UI ถ้ามี log_callback ไม่เช่นนั้นใช้ print()
+        if log_callback: log_callback(msg + "\n")
+        else: print(msg)
+
+    if output_folder is None:
+        output_folder = input_folder
+    os.makedirs(output_folder, exist_ok=True)
+    in_place = os.path.abspath(output_folder) == os.path.abspath(input_folder)
+    originals_dir = os.path.join(input_folder, ORIGINALS_DIRNAME) if in_place and keep_originals else None
+
+    # จับคู่ไฟล์ต้นฉบับกับไฟล์ปลายทาง (.jpg ชื่อเดิม)
+    jobs = []
+    targets = set()
+    # เรียงให้ไฟล์ .jpg มาก่อนไฟล์ชื่อเดียวกันนามสกุลอื่น (เช่น a.jpg ก่อน a.heic) เพื่อใช้ไฟล์ .jpg เดิม
+    # (เทียบแบบไม่สนตัวพิมพ์ เพราะ a.JPG กับ A.heic เป็นชื่อปลายทางเดียวกันบน Windows)
+    def sort_key(filename):
+        stem, ext = os.path.splitext(filename)
+        return os.path.normcase(stem), ext.lower() != ".jpg"
+    for filename in sorted(os.listdir(input_folder), key=sort_key):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in INGEST_EXTENSIONS:
+            continue
+        if ext.lower() in (".heic", ".heif") and not HEIF_SUPPORTED:
+            log(f"⚠️ Skipped (ต้องติดตั้ง pillow-heif): {filename}")
+            continue
+        src_path = os.path.join(input_folder, filename)
+        # ไฟล์ .jpg เดิมใช้ชื่อเดิม ไฟล์อื่นเปลี่ยนนามสกุลเป็น .jpg
+        dst_path = src_path if in_place and ext.lower() == ".jpg" else os.path.join(output_folder, stem + ".jpg")
+        target = os.path.normcase(os.path.abspath(dst_path))
+        if target in targets:
+            log(f"⚠️ Skipped (duplicate name): {filename}")
+            continue
+        # โฟลเดอร์ปลายทางแยก: ข้ามภาพที่แปลงแล้วและต้นฉบับไม่ได้เปลี่ยน
+        if not in_place and os.path.exists(dst_path) and os.path.getmtime(dst_path) >= os.path.getmtime(src_path):
+            targets.add(target)
+            continue
+        targets.add(target)
+        jobs.append((src_path, dst_path))
+
+    normalize = partial(normalize_image, max_long_edge=max_long_edge, quality=quality, originals_dir=originals_dir)
+    srcs, dsts = [src for src, _ in jobs], [dst for _, dst in jobs]
+    if workers <= 1:
+        messages = map(normalize, srcs, dsts)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # executor.map คืนผลตามลำดับไฟล์
+        messages = executor.map(normalize, srcs, dsts)
+
+    count = 0
+    try:
+        for msg in messages:
+            log(msg)
+            count += msg.startswith("✅")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    log(f"📥 ingest เสร็จ: แปลง {count} ภาพ")
+    return count
+
+# หากเรียกใช้งานแบบสคริปต์ จะรันตรงนี้ (เช่น python ingest_functional.py)
+if __name__ == "__main__":
+    ingest_images(r"C:\\Project\\raw_images", workers=os.cpu_count() or 1)
@@ -1,6 +1,11 @@
+import os
+import argparse
 from create_name_functional import rename_image_files
+from ingest_functional import ingest_images
 from extract_features_functional import extract_features
 from generate_synthetic_functional import generate_synthetic_dataset
+from distributed_functional import merge_shard_manifests, MERGED_MANIFEST_NAME
+from coordinator_functional import run_coordinator
 
 #  กำหนดโฟลเดอร์หลัก
 BACKGROUND_FOLDER = r"C:\\Project\\backgrounds"
@@ -9,23 +14,96 @@ FEATURE_OUTPUT_FOLDER = r"C:\\Project\\features"
 SYNTHETIC_OUTPUT_FOLDER = r"C:\\Project\\synthetic_dataset"
 ANNOTATION_OUTPUT_FOLDER = r"C:\\Project\\annotations"
 
-#  1. เปลี่ยนชื่อไฟล์ให้เป็นฟอร์แมต xxx_###.ext
-rename_image_files(BACKGROUND_FOLDER, prefix="backgrounds")
-rename_image_files(RAW_IMAGES_FOLDER, prefix="raw_image")
-
-#  2. ลบพื้นหลังและสร้างฟีเจอร์จาก raw images
-extract_features(
-    input_folder=RAW_IMAGES_FOLDER,
-    output_folder=FEATURE_OUTPUT_FOLDER
-)
-
-#  3. สร้าง synthetic dataset พร้อม annotation
-generate_synthetic_dataset(
-    backgrounds_path=BACKGROUND_FOLDER,
-    features_path=FEATURE_OUTPUT_FOLDER,
-    output_path=SYNTHETIC_OUTPUT_FOLDER,
-    annotations_path=ANNOTATION_OUTPUT_FOLDER,
-    num_images=200  # ปรับจำนวนตามต้องการ
-)
-
-print("\n เสร็จสมบูรณ์ ")
+#  จำนวน process ของแต่ละขั้นตอน (จำกัดไว้ เพราะทุก process ใช้หน่วยความจำของตัวเอง)
+#  - เตรียมภาพ: ถอดรหัส/ย่อภาพความละเอียดสูงทีละภาพต่อ process
+#  - ลบพื้นหลัง: ทุก process โหลดโมเดล rembg ของตัวเอง (u2net ~170 MB + thread pool ของ onnxruntime)
+#  - สร้างภาพ: ทุก process มี cache ภาพของตัวเอง (งบรวม IMAGE_CACHE_BUDGET ถูกแบ่งตามจำนวน process)
+CPU_COUNT = os.cpu_count() or 1
+INGEST_WORKERS = min(4, CPU_COUNT)
+EXTRACT_WORKERS = min(2, CPU_COUNT)
+GENERATE_WORKERS = min(4, CPU_COUNT)
+#  seed ของการรัน (None = สุ่มใหม่)
+RANDOM_SEED = None
+#  ความยาวด้านยาวสูงสุดของภาพหลังเตรียมภาพ (พิกเซล)
+MAX_LONG_EDGE = 4096
+#  แยกวัตถุหลายชิ้นในภาพ raw เดียวเป็นหลายฟีเจอร์ (ตัดวัตถุที่เล็กกว่า MIN_COMPONENT_AREA พิกเซล)
+SPLIT_COMPONENTS = False
+MIN_COMPONENT_AREA = 2500
+#  จำนวนวัตถุต่อภาพ synthetic (int หรือช่วง (min, max)) และ IoU สูงสุดที่ยอมให้วัตถุทับกัน
+OBJECTS_PER_IMAGE = 1
+MAX_OBJECT_IOU = 0.1
+#  จำนวนภาพทั้งหมดของงาน (เมื่อแบ่งหลายเครื่อง ทุกเครื่องต้องใช้ค่าเดียวกัน)
+NUM_IMAGES = 200
+#  แบ่งงานให้หลายเครื่อง: เครื่องที่ SHARD_INDEX (0..NUM_SHARDS-1) สร้างเฉพาะภาพส่วนของตัวเอง
+#  (ต้องกำหนด seed เดียวกันทุกเครื่อง) เช่น python main.py --shard-index 2 --num-shards 8 --seed 1234
+#  เมื่อรวมผลทุกเครื่องไว้ในโฟลเดอร์เดียวแล้ว ตรวจภาพที่ขาด/ซ้ำด้วย python main.py --merge
+SHARD_INDEX = 0
+NUM_SHARDS = 1
+#  แจกงานแบบ dynamic: เปิด coordinator ด้วย python main.py --serve --coordinator 0.0.0.0:5555 --seed 1234
+#  แล้วรันแต่ละเครื่องด้วย python main.py --coordinator <ip>:5555 --seed 1234 (เครื่องที่เร็วกว่าได้งานมากกว่า)
+COORDINATOR_ADDRESS = None
+#  ทำต่อจากการรันเดิมที่ถูกขัดจังหวะ (ข้ามภาพที่บันทึกใน .run_manifest.jsonl แล้ว) เปิดด้วย --resume
+#  ปิดไว้เป็นค่าเริ่มต้น เพราะการรันคำสั่งเดิมซ้ำโดยไม่กำหนด seed จะใช้ seed เดิมและไม่มีภาพใหม่ให้สร้าง
+RESUME = False
+
+#  ต้องอยู่ใต้ __main__ เพราะ process pool บน Windows จะ import ไฟล์นี้ซ้ำใน worker
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="สร้าง synthetic dataset ตั้งแต่เตรียมภาพจนถึง annotation")
+    parser.add_argument("--shard-index", type=int, default=SHARD_INDEX, help="ลำดับของเครื่องนี้ (0..num_shards-1)")
+    parser.add_argument("--num-shards", type=int, default=NUM_SHARDS, help="จำนวนเครื่องที่แบ่งงานกัน")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED, help="base seed (ต้องกำหนดเมื่อ num_shards > 1)")
+    parser.add_argument("--num-images", type=int, default=NUM_IMAGES, help="จำนวนภาพทั้งหมดของงาน")
+    parser.add_argument("--merge", action="store_true", help="รวม manifest ของทุกเครื่องใน SYNTHETIC_OUTPUT_FOLDER แล้วตรวจภาพที่ขาด/ซ้ำ")
+    parser.add_argument("--coordinator", default=COORDINATOR_ADDRESS, help="host:port ของ coordinator (ขอชุดงานแบบ dynamic)")
+    parser.add_argument("--serve", action="store_true", help="รัน coordinator ที่ --coordinator จนงานเสร็จ")
+    parser.add_argument("--resume", action=argparse.BooleanOptionalAction, default=RESUME,
+                        help="ทำต่อจากการรันเดิมที่ถูกขัดจังหวะ (seed ว่าง = ใช้ seed เดิม) --no-resume = เริ่มสร้างใหม่ทั้งหมด")
+    args = parser.parse_args()
+
+    if args.serve:
+        if args.coordinator is None:
+            parser.error("--serve ต้องกำหนด --coordinator host:port")
+        os.makedirs(SYNTHETIC_OUTPUT_FOLDER, exist_ok=True)
+        status = run_coordinator(args.num_images, args.coordinator,
+                                 manifest_path=os.path.join(SYNTHETIC_OUTPUT_FOLDER, MERGED_MANIFEST_NAME))
+        raise SystemExit(0 if status["images_written"] == args.num_images else 1)
+
+    if args.merge:
+        report = merge_shard_manifests(SYNTHETIC_OUTPUT_FOLDER, os.path.join(SYNTHETIC_OUTPUT_FOLDER, MERGED_MANIFEST_NAME))
+        raise SystemExit(1 if report["missing_shards"] or report["gaps"] or report["duplicates"] else 0)
+
+    #  0. เตรียมภาพ: HEIC/PNG → JPG, หมุนตาม EXIF, ย่อภาพที่ใหญ่เกิน (ต้นฉบับเก็บไว้ใน originals/)
+    ingest_images(BACKGROUND_FOLDER, max_long_edge=MAX_LONG_EDGE, workers=INGEST_WORKERS)
+    ingest_images(RAW_IMAGES_FOLDER, max_long_edge=MAX_LONG_EDGE, workers=INGEST_WORKERS)
+
+    #  1. เปลี่ยนชื่อไฟล์ให้เป็นฟอร์แมต xxx_###.ext
+    rename_image_files(BACKGROUND_FOLDER, prefix="backgrounds")
+    rename_image_files(RAW_IMAGES_FOLDER, prefix="raw_image")
+
+    #  2. ลบพื้นหลังและสร้างฟีเจอร์จาก raw images
+    extract_features(
+        input_folder=RAW_IMAGES_FOLDER,
+        output_folder=FEATURE_OUTPUT_FOLDER,
+        workers=EXTRACT_WORKERS,
+        split_components=SPLIT_COMPONENTS,
+        min_component_area=MIN_COMPONENT_AREA
+    )
+
+    #  3. สร้าง synthetic dataset พร้อม annotation
+    generate_synthetic_dataset(
+        backgrounds_path=BACKGROUND_FOLDER,
+        features_path=FEATURE_OUTPUT_FOLDER,
+        output_path=SYNTHETIC_OUTPUT_FOLDER,
+        annotations_path=ANNOTATION_OUTPUT_FOLDER,
+        num_images=args.num_images,  # ปรับจำนวนตามต้องการ
+        workers=GENERATE_WORKERS,
+        seed=args.seed,
+        objects_per_image=OBJECTS_PER_IMAGE,
+        max_iou=MAX_OBJECT_IOU,
+        shard_index=args.shard_index,
+        num_shards=args.num_shards,
+        coordinator=args.coordinator,
+        resume=args.resume
+    )
+
+    print("\n เสร็จสมบูรณ์ ")
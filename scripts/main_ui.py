@@ -1,11 +1,13 @@
 import streamlit as st
 import os
 import random
-from PIL import Image
 from pathlib import Path
 from create_name_functional import rename_image_files
-from extract_features_functional import extract_features
+from ingest_functional import ingest_images, MAX_LONG_EDGE
+from extract_features_functional import extract_features, MIN_COMPONENT_AREA
+from matting_functional import MATTING_TIERS, MATTING_TIER
 from generate_synthetic_functional import generate_synthetic_dataset
+from image_cache_functional import load_thumbnail
 import io
 import contextlib
 import time
@@ -607,8 +609,8 @@ with col1:
     """, unsafe_allow_html=True)
     
     raw_files = st.file_uploader(
-        "เลือกไฟล์ภาพ (.jpg, .jpeg, .png)",
-        type=["jpg", "jpeg", "png"],
+        "เลือกไฟล์ภาพ (.jpg, .jpeg, .png, .heic)",
+        type=["jpg", "jpeg", "png", "heic"],
         accept_multiple_files=True,
         key="raw",
         help="อัปโหลดภาพวัตถุที่ต้องการลบพื้นหลัง"
@@ -637,7 +639,9 @@ with col1:
                 img_path = os.path.join(RAW_IMAGE_DIR, img_name)
                 with cols[i % 5]:
                     try:
-                        image = Image.open(img_path)
+                        image = load_thumbnail(img_path)
+                        if image is None:
+                            raise ValueError("อ่านไฟล์ภาพไม่ได้")
                         st.image(image, caption=img_name)
                     except Exception as e:
                         st.error(f"ไม่สามารถโหลดภาพ {img_name}: {str(e)}")
@@ -656,8 +660,8 @@ with col2:
     """, unsafe_allow_html=True)
     
     bg_files = st.file_uploader(
-        "เลือกไฟล์ภาพ (.jpg, .jpeg, .png)",
-        type=["jpg", "jpeg", "png"],
+        "เลือกไฟล์ภาพ (.jpg, .jpeg, .png, .heic)",
+        type=["jpg", "jpeg", "png", "heic"],
         accept_multiple_files=True,
         key="bg",
         help="อัปโหลดภาพพื้นหลังสำหรับสร้างภาพจำลอง"
@@ -686,7 +690,9 @@ with col2:
                 img_path = os.path.join(BG_IMAGE_DIR, img_name)
                 with cols[i % 5]:
                     try:
-                        image = Image.open(img_path)
+                        image = load_thumbnail(img_path)
+                        if image is None:
+                            raise ValueError("อ่านไฟล์ภาพไม่ได้")
                         st.image(image, caption=img_name)
                     except Exception as e:
                         st.error(f"ไม่สามารถโหลดภาพ {img_name}: {str(e)}")
@@ -697,6 +703,20 @@ with col2:
             </div>
             """, unsafe_allow_html=True)
 
+# เตรียมภาพที่อัปโหลด: HEIC/PNG → JPG, หมุนตาม EXIF และย่อภาพที่ใหญ่เกิน (ต้นฉบับเก็บไว้ใน originals/)
+st.markdown("### 📥 เตรียมภาพ (HEIC/PNG → JPG, หมุนตาม EXIF, จำกัดขนาด)")
+ingest_col1, ingest_col2 = st.columns(2)
+with ingest_col1:
+    max_long_edge = st.number_input("ด้านยาวสูงสุด (พิกเซล)", min_value=512, max_value=16384, value=MAX_LONG_EDGE, step=256, key="max_long_edge")
+with ingest_col2:
+    ingest_workers = st.number_input("จำนวน process ที่ใช้แปลงภาพ", min_value=1, max_value=os.cpu_count() or 1, value=min(4, os.cpu_count() or 1), step=1, key="ingest_workers")
+if st.button("📥 เตรียมภาพใน raw_images และ backgrounds", key="ingest_images"):
+    ingest_log = []
+    with st.spinner("⏳ กำลังเตรียมภาพ..."):
+        for folder in (RAW_IMAGE_DIR, BG_IMAGE_DIR):
+            ingest_images(folder, max_long_edge=int(max_long_edge), workers=int(ingest_workers), log_callback=ingest_log.append)
+    st.text_area("📄 Log การเตรียมภาพ", value="".join(ingest_log), height=150)
+
 # === STEP 2: Rename Files ===
 st.markdown("""
 <div class="step-header">
@@ -764,13 +784,21 @@ def stream_log(msg):
 col1, col2 = st.columns([2, 1])
 
 with col1:
+    extract_workers = st.number_input("จำนวน process ที่ใช้ลบพื้นหลัง", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1, key="extract_workers")
+    matting_tier = st.selectbox("คุณภาพ alpha matting (เร็ว → ละเอียด)", MATTING_TIERS, index=MATTING_TIERS.index(MATTING_TIER), key="matting_tier")
+    split_components = st.checkbox("แยกวัตถุหลายชิ้นในภาพเดียวเป็นหลายฟีเจอร์", value=False, key="split_components")
+    min_component_area = st.number_input("พื้นที่ขั้นต่ำของวัตถุ (พิกเซล)", min_value=1, value=MIN_COMPONENT_AREA, step=500, key="min_component_area", disabled=not split_components)
     if st.button("⚙️ แยกฟีเจอร์จาก raw_images → features", key="extract_features"):
         st.session_state["log_lines"] = ""
         with st.spinner("⏳ กำลังแยกฟีเจอร์จากภาพ... โปรดรอสักครู่"):
             extract_features(
                 input_folder=RAW_IMAGE_DIR,
                 output_folder=FEATURE_DIR,
-                log_callback=stream_log
+                log_callback=stream_log,
+                workers=int(extract_workers),
+                matting=matting_tier,
+                split_components=split_components,
+                min_component_area=int(min_component_area)
             )
         status_placeholder.markdown("""
         <div class="success-box">
@@ -788,7 +816,9 @@ with col2:
                 img_path = os.path.join(FEATURE_DIR, img_name)
                 with cols[i % 3]:
                     try:
-                        image = Image.open(img_path)
+                        image = load_thumbnail(img_path)
+                        if image is None:
+                            raise ValueError("อ่านไฟล์ภาพไม่ได้")
                         st.image(image, caption=img_name)
                     except Exception as e:
                         st.error(f"ไม่สามารถโหลดภาพ {img_name}: {str(e)}")
@@ -823,6 +853,51 @@ with col1:
         step=1,
         help="จำนวนภาพที่ต้องการสร้าง"
     )
+
+    num_workers = st.number_input(
+        "🧵 จำนวน worker (process)",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=1,
+        step=1,
+        help="จำนวน process ที่ใช้สร้างภาพพร้อมกัน"
+    )
+
+    seed_text = st.text_input(
+        "🎲 Seed (เว้นว่าง = สุ่มใหม่)",
+        value="",
+        help="ใช้ seed เดิมจะได้ภาพชุดเดิมทุกภาพ ไม่ว่าจะใช้กี่ worker"
+    )
+
+    weight_by_water_area = st.checkbox(
+        "🌊 เลือกพื้นหลังตามพื้นที่น้ำ",
+        value=False,
+        help="พื้นหลังที่มีน้ำมากถูกเลือกบ่อยกว่า (พื้นหลังที่วางฟีเจอร์ไม่ได้จะไม่ถูกเลือกอยู่แล้ว)"
+    )
+
+    objects_range = st.slider(
+        "🧮 จำนวนวัตถุต่อภาพ",
+        min_value=1,
+        max_value=10,
+        value=(1, 1),
+        help="สุ่มจำนวนวัตถุต่อภาพในช่วงนี้ annotation มีหนึ่งบรรทัดต่อวัตถุ"
+    )
+
+    max_object_iou = st.number_input(
+        "🔲 IoU สูงสุดระหว่างวัตถุ",
+        min_value=0.0,
+        max_value=1.0,
+        value=0.1,
+        step=0.05,
+        help="0 = วัตถุห้ามทับกันเลย ค่ามากขึ้นยอมให้วัตถุบังกันได้มากขึ้น"
+    )
+
+    resume_run = st.checkbox(
+        "▶️ ทำต่อจากการรันเดิม",
+        value=False,
+        help="ถ้าการสร้างครั้งก่อนถูกขัดจังหวะ จะข้ามภาพที่เสร็จแล้วและสร้างเฉพาะภาพที่ขาด (seed ว่าง = ใช้ seed เดิม) "
+             "ไม่เลือก = เริ่มสร้างชุดใหม่ทั้งหมด"
+    )
     
     fixed_image_size = "640x640"
     st.markdown(f"""
@@ -850,7 +925,13 @@ with col2:
                 output_path=SYN_IMAGE_DIR,
                 annotations_path=ANNOTATIONS_DIR,
                 num_images=num_images,
-                log_callback=log_syn
+                log_callback=log_syn,
+                workers=int(num_workers),
+                seed=int(seed_text) if seed_text.strip().isdigit() else None,
+                weight_by_water_area=weight_by_water_area,
+                objects_per_image=objects_range[0] if objects_range[0] == objects_range[1] else objects_range,
+                max_iou=float(max_object_iou),
+                resume=resume_run
             )
         st.markdown(f"""
         <div class="success-box">
@@ -886,7 +967,9 @@ with col3:
                 img_path = os.path.join(SYN_IMAGE_DIR, img_name)
                 with cols[i % 3]:
                     try:
-                        image = Image.open(img_path)
+                        image = load_thumbnail(img_path)
+                        if image is None:
+                            raise ValueError("อ่านไฟล์ภาพไม่ได้")
                         st.image(image, caption=img_name)
                     except Exception as e:
                         st.error(f"ไม่สามารถโหลดภาพ {img_name}: {str(e)}")
@@ -0,0 +1,198 @@
+# นำเข้า OpenCV library สำหรับย่อ/ขยายภาพ, erosion และ box filter
+import cv2
+# นำเข้า NumPy library สำหรับการคำนวณทางคณิตศาสตร์
+import numpy as np
+# นำเข้า PIL library สำหรับรับ/ส่งภาพกับ rembg
+from PIL import Image
+# นำเข้า closed-form matting และการประมาณสี foreground (ชุดเดียวกับที่ rembg ใช้)
+from pymatting import estimate_alpha_cf, estimate_foreground_ml, ichol
+
+# ระดับคุณภาพของ alpha matting (เรียงจากเร็วไปช้า)
+# - "none": ใช้ mask จากโมเดลเป็น alpha ตรงๆ
+# - "downscaled": matting บนภาพย่อ แล้วขยาย alpha กลับด้วย guided filter
+# - "band": matting เต็มความละเอียดเฉพาะ tile ที่อยู่บนแถบขอบของ mask
+# - "full": matting ทั้งภาพเหมือน rembg alpha_matting=True (ค่าเริ่มต้นเดิม)
+MATTING_TIERS = ("none", "downscaled", "band", "full")
+MATTING_TIER = "full"
+# threshold ของ trimap (ค่าเดียวกับที่ใช้กับ rembg เดิม)
+FOREGROUND_THRESHOLD = 240
+BACKGROUND_THRESHOLD = 10
+ERODE_SIZE = 10
+# ขนาดด้านยาวสูงสุดของภาพที่ใช้ทำ matting ใน tier "downscaled"
+MATTING_MAX_SIZE = 800
+# พารามิเตอร์ของ guided filter (รัศมีเป็นพิกเซลของภาพเต็ม และ epsilon ของค่า 0-1)
+GUIDED_FILTER_RADIUS = 8
+GUIDED_FILTER_EPS = 1e-3
+# จำนวน non-zero ต่อแถวที่จองไว้ให้ incomplete Cholesky (ค่าเริ่มต้นของ pymatting จองคงที่ ~4 GB ทุกครั้ง)
+ICHOL_NNZ_PER_ROW = 32
+ICHOL_MIN_NNZ = 1 << 20
+# ขนาด tile และขอบบริบทรอบ tile ของ tier "band"
+BAND_TILE_SIZE = 256
+BAND_TILE_MARGIN = 16
+
+def build_trimap(mask, foreground_threshold=FOREGROUND_THRESHOLD, background_threshold=BACKGROUND_THRESHOLD,
+                 erode_size=ERODE_SIZE):
+    """
+    สร้าง trimap จาก mask ของโมเดล (uint8): 255 = foreground, 0 = background, 128 = ไม่แน่ใจ
+    กัดขอบ (erode) ทั้ง foreground และ background ด้วย kernel ขนาด erode_size เหมือน rembg
+    """
+    is_foreground = (mask > foreground_threshold).view(np.uint8)
+    is_background = (mask < background_threshold).view(np.uint8)
+    if erode_size > 0:
+        kernel = np.ones((erode_size, erode_size), np.uint8)
+        # ขอบภาพนับเป็น background (foreground ที่ชิดขอบถูกกัด แต่ background ไม่ถูกกัด)
+        is_foreground = cv2.erode(is_foreground, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        is_background = cv2.erode(is_background, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=1)
+    trimap = np.full(mask.shape, 128, np.uint8)
+    trimap[is_foreground > 0] = 255
+    trimap[is_background > 0] = 0
+    return trimap
+
+def _sized_ichol(A):
+    """
+    preconditioner ของ closed-form matting ที่จองหน่วยความจำตามขนาดของปัญหา
+    ถ้าพื้นที่ไม่พอจะลองใหม่ด้วยค่าเริ่มต้นของ pymatting
+    """
+    try:
+        return ichol(A, max_nnz=max(ICHOL_MIN_NNZ, ICHOL_NNZ_PER_ROW * A.shape[0]))
+    except ValueError as e:
+        if "max_nnz" not in str(e):
+            raise
+        return ichol(A)
+
+def estimate_alpha(image, trimap):
+    """
+    closed-form matting (pymatting) ของภาพ float 0-1 กับ trimap float 0-1
+    """
+    return estimate_alpha_cf(image, trimap, preconditioner=_sized_ichol)
+
+def guided_filter(guide, src, radius=GUIDED_FILTER_RADIUS, eps=GUIDED_FILTER_EPS):
+    """
+    Guided filter แบบภาพนำทางสีเทา (He et al.) ใช้ box filter ของ OpenCV
+    ปรับ src (float 0-1) ให้ขอบตามขอบของ guide (float 0-1)
+    """
+    size = (2 * radius + 1, 2 * radius + 1)
+    mean = lambda x: cv2.boxFilter(x, cv2.CV_64F, size)
+    mean_guide, mean_src = mean(guide), mean(src)
+    cov = mean(guide * src) - mean_guide * mean_src
+    var = mean(guide * guide) - mean_guide * mean_guide
+    a = cov / (var + eps)
+    b = mean_src - a * mean_guide
+    return mean(a) * guide + mean(b)
+
+def _to_cutout(image, alpha, foreground=None):
+    """
+    รวมสี foreground (ค่าเริ่มต้น = สีของภาพ) กับ alpha (float 0-1) เป็น PIL Image แบบ RGBA
+    """
+    if foreground is None:
+        foreground = image
+    cutout = np.dstack((foreground, alpha[:, :, None]))
+    return Image.fromarray(np.clip(cutout * 255, 0, 255).astype(np.uint8))
+
+def _matte_full(image, trimap):
+    """
+    closed-form matting + ประมาณสี foreground ทั้งภาพ (เหมือน rembg)
+    """
+    alpha = estimate_alpha(image, trimap / 255.0)
+    return _to_cutout(image, alpha, estimate_foreground_ml(image, alpha))
+
+def _matte_downscaled(image, mask, max_size, foreground_threshold, background_threshold, erode_size):
+    """
+    matting บนภาพที่ย่อให้ด้านยาวไม่เกิน max_size แล้วขยาย alpha กลับ
+    และปรับขอบด้วย guided filter บนภาพเต็ม (ใช้สีของภาพเดิมเป็น foreground)
+    """
+    height, width = mask.shape
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return _matte_full(image, build_trimap(mask, foreground_threshold, background_threshold, erode_size))
+
+    small_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    small_image = cv2.resize(image, small_size, interpolation=cv2.INTER_AREA)
+    small_mask = cv2.resize(mask, small_size, interpolation=cv2.INTER_AREA)
+    small_trimap = build_trimap(small_mask, foreground_threshold, background_threshold,
+                                max(1, int(round(erode_size * scale))))
+    small_alpha = estimate_alpha(small_image, small_trimap / 255.0)
+
+    # ขยาย alpha กลับเป็นขนาดเต็ม แล้วให้ขอบตามรายละเอียดของภาพเต็มด้วย guided filter
+    alpha = cv2.resize(small_alpha, (width, height), interpolation=cv2.INTER_LINEAR)
+    gray = cv2.cvtColor(image.astype(np.float32), cv2.COLOR_RGB2GRAY).astype(np.float64)
+    alpha = np.clip(guided_filter(gray, alpha), 0, 1)
+    # บริเวณที่ trimap เต็มความละเอียดแน่ใจแล้ว ใช้ค่าจาก trimap
+    trimap = build_trimap(mask, foreground_threshold, background_threshold, erode_size)
+    alpha[trimap == 255] = 1
+    alpha[trimap == 0] = 0
+    return _to_cutout(image, alpha)
+
+def _tile_context(trimap, y0, x0, y1, x1, margin):
+    """
+    ขยาย tile [y0:y1, x0:x1] ด้วย margin และขยายต่อ (เท่าตัว) จนบริบทมีทั้ง foreground และ background
+    ที่แน่ใจ (closed-form matting ต้องมีทั้งสองส่วน) หรือจนเต็มภาพ คืนค่า (py0, px0, py1, px1)
+    """
+    height, width = trimap.shape
+    while True:
+        py0, px0 = max(y0 - margin, 0), max(x0 - margin, 0)
+        py1, px1 = min(y1 + margin, height), min(x1 + margin, width)
+        context = trimap[py0:py1, px0:px1]
+        if ((context == 255).any() and (context == 0).any()) or (py1 - py0, px1 - px0) == (height, width):
+            return py0, px0, py1, px1
+        margin *= 2
+
+def _matte_band(image, trimap, mask, tile_size, margin):
+    """
+    matting เต็มความละเอียดเฉพาะ tile ที่มีพิกเซลไม่แน่ใจ (แถบรอบขอบ mask)
+    แต่ละ tile ใช้พิกเซลรอบๆ อีก margin เป็นบริบท เวลาและหน่วยความจำจึงขึ้นกับความยาวขอบ ไม่ใช่ขนาดภาพ
+    tile ที่บริบทไม่มี foreground หรือ background ที่แน่ใจ (เช่นวัตถุชิดขอบภาพ) จะขยายบริบทจนมีทั้งสองส่วน
+    ถ้ายังคำนวณไม่ได้จะใช้ mask เป็น alpha เฉพาะ tile นั้น
+    """
+    height, width = trimap.shape
+    # บริบทของทุก tile ใช้ trimap เดิม (ไม่ใช่ alpha ที่ tile ก่อนหน้าเขียนกลับแล้ว)
+    known = trimap / 255.0
+    alpha = known.copy()
+    foreground = image.copy()
+    unknown = trimap == 128
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+            if not unknown[y0:y1, x0:x1].any():
+                continue
+            region = unknown[y0:y1, x0:x1]
+            # ขยาย tile ให้มีพิกเซลที่แน่ใจเป็นบริบท
+            py0, px0, py1, px1 = _tile_context(trimap, y0, x0, y1, x1, margin)
+            tile_image = image[py0:py1, px0:px1]
+            try:
+                tile_alpha = estimate_alpha(tile_image, known[py0:py1, px0:px1])
+            except ValueError:
+                alpha[y0:y1, x0:x1][region] = mask[y0:y1, x0:x1][region] / 255.0
+                continue
+            tile_foreground = estimate_foreground_ml(tile_image, tile_alpha)
+            # เขียนกลับเฉพาะพิกเซลไม่แน่ใจในส่วนในของ tile
+            inner = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+            alpha[y0:y1, x0:x1][region] = tile_alpha[inner][region]
+            foreground[y0:y1, x0:x1][region] = tile_foreground[inner][region]
+    return _to_cutout(image, alpha, foreground)
+
+def matting_cutout(image, mask, tier=MATTING_TIER, foreground_threshold=FOREGROUND_THRESHOLD,
+                   background_threshold=BACKGROUND_THRESHOLD, erode_size=ERODE_SIZE,
+                   max_size=MATTING_MAX_SIZE, tile_size=BAND_TILE_SIZE, tile_margin=BAND_TILE_MARGIN):
+    """
+    ตัดพื้นหลังจากภาพ (PIL) ด้วย mask ของโมเดล (PIL โหมด "L") ตามระดับคุณภาพ tier (ดู MATTING_TIERS)
+    คืนค่าเป็น PIL Image แบบ RGBA
+    ถ้า matting คำนวณไม่ได้ (เช่น trimap ไม่มีส่วนที่แน่ใจ) จะใช้ mask ตรงๆ เหมือน rembg
+    """
+    if tier not in MATTING_TIERS:
+        raise ValueError(f"ไม่รู้จักระดับ matting: {tier} (ใช้ได้: {', '.join(MATTING_TIERS)})")
+    image = image.convert("RGB")
+    if tier != "none":
+        rgb = np.asarray(image) / 255.0
+        mask_array = np.asarray(mask)
+        try:
+            if tier == "downscaled":
+                return _matte_downscaled(rgb, mask_array, max_size, foreground_threshold, background_threshold, erode_size)
+            trimap = build_trimap(mask_array, foreground_threshold, background_threshold, erode_size)
+            if tier == "band":
+                return _matte_band(rgb, trimap, mask_array, tile_size, tile_margin)
+            return _matte_full(rgb, trimap)
+        except ValueError:
+            pass
+    # ใช้ mask เป็น alpha ตรงๆ (สีนอก mask เป็นโปร่งใส)
+    return Image.composite(image, Image.new("RGBA", image.size, 0), mask)
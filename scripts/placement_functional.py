@@ -0,0 +1,163 @@
+# นำเข้า library สำหรับสุ่มค่า
+import random
+# นำเข้า OpenCV library สำหรับประมวลผลภาพ
+import cv2
+# นำเข้า NumPy library สำหรับการคำนวณทางคณิตศาสตร์
+import numpy as np
+
+# สัดส่วนพื้นที่น้ำขั้นต่ำใต้ฟีเจอร์ (ต้องมีน้ำอย่างน้อย 50% ของพื้นที่ที่วาง)
+MIN_WATER_COVERAGE = 0.5
+# ช่วงของ scale ที่สุ่มให้ฟีเจอร์ (40-80% ของขนาดเดิม)
+SCALE_RANGE = (0.4, 0.8)
+# ช่วงของมุมหมุนที่สุ่มให้ฟีเจอร์ (องศา)
+ANGLE_RANGE = (0, 360)
+
+def scaled_size(feature_shape, scale):
+    """
+    คำนวณขนาด (width, height) ของฟีเจอร์หลังปรับ scale
+    """
+    return int(feature_shape[1] * scale), int(feature_shape[0] * scale)
+
+def render_feature(feature, scale, angle):
+    """
+    ปรับขนาดฟีเจอร์ตาม scale แล้วหมุนรอบจุดกึ่งกลางตาม angle (องศา)
+    ขนาดผลลัพธ์เท่ากับ scaled_size และพื้นที่นอกฟีเจอร์เป็นสีโปร่งใส
+    """
+    new_fg_width, new_fg_height = scaled_size(feature.shape, scale)
+    # ปรับขนาดฟีเจอร์ตาม scale
+    feature_resized = cv2.resize(feature, (new_fg_width, new_fg_height), interpolation=cv2.INTER_AREA)
+    # สร้าง transformation matrix สำหรับหมุน โดยจุดศูนย์กลางการหมุนคือกลางภาพฟีเจอร์
+    M = cv2.getRotationMatrix2D((new_fg_width // 2, new_fg_height // 2), angle, 1)
+    # หมุนฟีเจอร์ borderValue=(0, 0, 0, 0) กำหนดสีขอบเป็นโปร่งใส
+    return cv2.warpAffine(feature_resized, M, (new_fg_width, new_fg_height), borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0, 0))
+
+def rendered_bbox(points, feature_shape, scale, angle):
+    """
+    คำนวณ bounding box (x, y, w, h) ของวัตถุหลัง render_feature จากจุดของ convex hull (พิกัดพิกเซลของฟีเจอร์)
+    ใช้ขนาดและ matrix การหมุนเดียวกับ render_feature จึงไม่ต้องสแกน alpha ของภาพที่หมุนแล้ว
+    กล่องที่ได้ครอบวัตถุทั้งหมดเสมอแต่ใหญ่กว่าการสแกน alpha ได้หลายพิกเซล (ประมาณขอบเขตของ interpolation ไว้กว้าง)
+    จึงใช้ตัดภาพให้เล็กลงก่อนสแกน alpha หา label ไม่ใช่ label โดยตรง
+    """
+    new_fg_width, new_fg_height = scaled_size(feature_shape, scale)
+    scale_x = new_fg_width / feature_shape[1]
+    scale_y = new_fg_height / feature_shape[0]
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    # INTER_AREA: พิกเซลหลัง resize ที่ทับพิกเซลของวัตถุ [p, p + 1) * scale มีค่า alpha
+    low = np.floor(points * (scale_x, scale_y))
+    high = np.ceil((points + 1) * (scale_x, scale_y)) - 1
+    # warpAffine แบบ bilinear: พิกเซลปลายทางมีค่าถ้าจุดที่ map กลับอยู่ห่างพิกเซลต้นทางน้อยกว่า 1
+    corners = np.concatenate([
+        np.column_stack((low[:, 0] - 1, low[:, 1] - 1)), np.column_stack((high[:, 0] + 1, low[:, 1] - 1)),
+        np.column_stack((low[:, 0] - 1, high[:, 1] + 1)), np.column_stack((high[:, 0] + 1, high[:, 1] + 1)),
+    ])
+    M = cv2.getRotationMatrix2D((new_fg_width // 2, new_fg_height // 2), angle, 1)
+    corners = corners @ M[:, :2].T + M[:, 2]
+    # พิกเซลที่จุดกึ่งกลางอยู่ภายในช่วง (min, max) แล้วจำกัดให้อยู่ใน canvas
+    x0, y0 = np.maximum(np.floor(corners.min(axis=0)).astype(int) + 1, 0)
+    x1, y1 = np.minimum(np.ceil(corners.max(axis=0)).astype(int), (new_fg_width, new_fg_height))
+    return int(x0), int(y0), max(int(x1 - x0), 1), max(int(y1 - y0), 1)
+
+def rescale_placement(feature_shape, canvas_size, scale, x, y, resolution):
+    """
+    แปลงตำแหน่งวางเมื่อ render ภาพที่ความละเอียด resolution เท่าของภาพพื้นหลังเดิม
+    canvas_size คือ (width, height) ของฟีเจอร์ที่วางที่ (x, y) เดิม จุดกึ่งกลางการหมุนของ canvas ถูกย้ายตาม resolution
+    คืนค่า (scale ใหม่, x ใหม่, y ใหม่)
+    """
+    new_scale = scale * resolution
+    new_width, new_height = scaled_size(feature_shape, new_scale)
+    center_x = (x + canvas_size[0] // 2) * resolution
+    center_y = (y + canvas_size[1] // 2) * resolution
+    return new_scale, int(round(center_x)) - new_width // 2, int(round(center_y)) - new_height // 2
+
+def compute_water_integral(water_mask):
+    """
+    สร้าง integral image (summed-area table) ของ water mask
+    ค่าที่ตำแหน่ง [y, x] คือจำนวนพิกเซลน้ำในสี่เหลี่ยม [0:y, 0:x]
+    """
+    # แปลง mask (0/255) เป็น 0/1 เพื่อไม่ให้ผลรวมล้น int32 บนภาพความละเอียดสูง
+    return cv2.integral((water_mask > 0).view(np.uint8), sdepth=cv2.CV_32S)
+
+def valid_position_map(water_mask, width, height, water_integral=None, min_coverage=MIN_WATER_COVERAGE):
+    """
+    ตรวจทุกตำแหน่งมุมซ้ายบน (y, x) ที่เป็นไปได้สำหรับฟีเจอร์ขนาด width x height ในครั้งเดียว
+    ตำแหน่งที่ใช้ได้ต้อง: อยู่บนพิกเซลน้ำ, ฟีเจอร์ไม่เกินขอบภาพ และมีน้ำใต้ฟีเจอร์ >= min_coverage
+    คืนค่าเป็น boolean array ขนาด (H - height + 1, W - width + 1) หรือ None ถ้าฟีเจอร์ใหญ่เกินภาพ
+    """
+    mask_height, mask_width = water_mask.shape[:2]
+    # ฟีเจอร์ใหญ่กว่าภาพ วางไม่ได้แน่นอน
+    if width <= 0 or height <= 0 or width > mask_width or height > mask_height:
+        return None
+    if water_integral is None:
+        water_integral = compute_water_integral(water_mask)
+
+    rows = mask_height - height + 1
+    cols = mask_width - width + 1
+    # ผลรวมของหน้าต่าง = S[y+h, x+w] - S[y, x+w] - S[y+h, x] + S[y, x] คำนวณทุกตำแหน่งพร้อมกัน
+    window_sum = water_integral[height:height + rows, width:width + cols].copy()
+    window_sum -= water_integral[0:rows, width:width + cols]
+    window_sum -= water_integral[height:height + rows, 0:cols]
+    window_sum += water_integral[0:rows, 0:cols]
+
+    # จำนวนพิกเซลน้ำขั้นต่ำ (เลขจำนวนเต็ม เพื่อเทียบได้โดยไม่ต้องแปลงเป็น float)
+    required = int(np.ceil(min_coverage * width * height))
+    valid = window_sum >= required
+    # มุมซ้ายบนต้องอยู่บนพิกเซลน้ำ (เหมือนการสุ่มจากพิกัดน้ำแบบเดิม)
+    valid &= water_mask[:rows, :cols] > 0
+    return valid
+
+def sample_valid_position(valid, rng=None):
+    """
+    สุ่มตำแหน่ง (x, y) แบบ uniform จากตำแหน่งที่ใช้ได้ใน valid โดยไม่สร้าง array พิกัดทั้งหมด
+    คืนค่า None ทันทีถ้าไม่มีตำแหน่งที่ใช้ได้
+    rng (optional) คือ np.random.Generator ถ้าไม่ส่งมาจะใช้ random ส่วนกลาง
+    """
+    if valid is None:
+        return None
+    # นับจำนวนตำแหน่งที่ใช้ได้ในแต่ละแถว
+    row_counts = np.count_nonzero(valid, axis=1)
+    cumulative = np.cumsum(row_counts)
+    total = int(cumulative[-1]) if len(cumulative) else 0
+    if total == 0:
+        return None
+
+    # สุ่มลำดับที่ k ของตำแหน่งที่ใช้ได้ แล้วหาว่าอยู่แถวไหน
+    k = int(rng.integers(total)) if rng is not None else random.randrange(total)
+    row = int(np.searchsorted(cumulative, k, side="right"))
+    k_in_row = k - (int(cumulative[row - 1]) if row > 0 else 0)
+    # หาคอลัมน์เฉพาะในแถวที่เลือก
+    col = int(np.flatnonzero(valid[row])[k_in_row])
+    return col, row
+
+def sample_water_position(water_mask, width, height, water_integral=None, min_coverage=MIN_WATER_COVERAGE, rng=None,
+                          image_size=None):
+    """
+    สุ่มตำแหน่งมุมซ้ายบน (x, y) สำหรับวางฟีเจอร์ขนาด width x height บนพื้นที่น้ำ
+    คืนค่า None ถ้าไม่มีตำแหน่งที่เหมาะสม
+
+    image_size (width, height) คือขนาดภาพพื้นหลังจริง ถ้า mask ถูกคำนวณที่ความละเอียดต่ำกว่า
+    (ดู detect_water_area(scale=...)) จะตรวจพื้นที่น้ำในพิกัดของ mask แล้วแปลงกลับเป็นพิกัดของภาพ
+    โดยสุ่มตำแหน่งภายในช่องของ mask ที่เลือก ผลลัพธ์คลาดจาก mask เต็มความละเอียดไม่เกินหนึ่งช่อง mask
+    """
+    mask_height, mask_width = water_mask.shape[:2]
+    if image_size is None or tuple(image_size) == (mask_width, mask_height):
+        valid = valid_position_map(water_mask, width, height, water_integral, min_coverage)
+        return sample_valid_position(valid, rng)
+
+    # อัตราส่วนพิกเซลภาพต่อหนึ่งช่องของ mask (แยกแต่ละแกนเพราะการปัดขนาด mask)
+    image_width, image_height = image_size
+    if width > image_width or height > image_height:
+        return None
+    cell_x, cell_y = image_width / mask_width, image_height / mask_height
+    # ขนาดของฟีเจอร์ในพิกัด mask
+    mask_fg_width = min(mask_width, max(1, int(round(width / cell_x))))
+    mask_fg_height = min(mask_height, max(1, int(round(height / cell_y))))
+    valid = valid_position_map(water_mask, mask_fg_width, mask_fg_height, water_integral, min_coverage)
+    position = sample_valid_position(valid, rng)
+    if position is None:
+        return None
+
+    # สุ่มตำแหน่งภายในช่องของ mask แล้วจำกัดไม่ให้ฟีเจอร์เกินขอบภาพ
+    offset_x, offset_y = rng.random(2) if rng is not None else (random.random(), random.random())
+    x = min(int((position[0] + offset_x) * cell_x), image_width - width)
+    y = min(int((position[1] + offset_y) * cell_y), image_height - height)
+    return x, y
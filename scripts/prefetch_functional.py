@@ -0,0 +1,100 @@
+# นำเข้า threading สำหรับ lock ของตัวนับสถิติ
+import threading
+# นำเข้า time สำหรับจับเวลาที่รอและเวลาโหลด
+import time
+# นำเข้า deque สำหรับคิวของงานที่โหลดล่วงหน้า
+from collections import deque
+# นำเข้า thread pool สำหรับโหลดภาพเบื้องหลัง
+from concurrent.futures import ThreadPoolExecutor
+
+# จำนวนลำดับที่โหลดล่วงหน้าได้สูงสุด (0 = ไม่โหลดล่วงหน้า)
+PREFETCH_DEPTH = 4
+# จำนวน thread ที่โหลดภาพพร้อมกัน (การถอดรหัสของ OpenCV ปล่อย GIL จึงทำงานขนานกับการสร้างภาพได้)
+PREFETCH_THREADS = 2
+
+# สถิติของการโหลดล่วงหน้า: จำนวนที่โหลด, เวลาโหลดรวม, จำนวนครั้ง/เวลาที่ผู้ใช้ต้องรอ และจำนวนที่โหลดไม่สำเร็จ
+_prefetch_state = {"prefetched": 0, "load_seconds": 0.0, "stalls": 0, "stall_seconds": 0.0, "errors": 0}
+# lock สำหรับอัปเดตสถิติจากหลาย thread
+_stats_lock = threading.Lock()
+# ค่าที่บอกว่า items หมดแล้ว
+_END = object()
+
+def _timed_load(load_fn, item):
+    """
+    เรียก load_fn(item) บน thread เบื้องหลังและจับเวลา (error ไม่ถูกส่งต่อ ผู้ใช้จะโหลดเองและเห็น error ตามปกติ)
+    """
+    start = time.perf_counter()
+    try:
+        load_fn(item)
+        failed = 0
+    except Exception:
+        failed = 1
+    with _stats_lock:
+        _prefetch_state["prefetched"] += 1
+        _prefetch_state["load_seconds"] += time.perf_counter() - start
+        _prefetch_state["errors"] += failed
+
+def prefetch_iter(items, load_fn, depth=PREFETCH_DEPTH, threads=PREFETCH_THREADS):
+    """
+    yield สมาชิกของ items ตามลำดับเดิม โดยเรียก load_fn(item) ล่วงหน้าบน thread pool ไม่เกิน depth ลำดับ
+    (เช่นถอดรหัสภาพเข้า cache) ก่อน yield แต่ละ item จะรอให้ load_fn ของ item นั้นเสร็จ
+    เวลาที่ต้องรอนับเป็น stall (ดู get_prefetch_stats) ถ้า stall บ่อยควรเพิ่ม depth หรือ threads
+    items เป็น iterable ไม่สิ้นสุดได้ depth <= 0 จะ yield ตามปกติโดยไม่โหลดล่วงหน้า
+    ถ้า items เกิด error จะ yield ลำดับที่ได้มาก่อนหน้าให้ครบแล้วจึงส่ง error นั้นต่อ
+    """
+    if depth <= 0:
+        yield from items
+        return
+    iterator = iter(items)
+    pending = deque()
+    # error จาก items เก็บไว้ส่งต่อหลัง yield ลำดับที่อยู่ในคิวแล้ว
+    failure = []
+    executor = ThreadPoolExecutor(max_workers=max(1, threads))
+
+    def fill():
+        # เติมคิวให้มีงานที่โหลดล่วงหน้าครบ depth ลำดับ (หรือจนหมด items)
+        while len(pending) < depth and not failure:
+            try:
+                item = next(iterator, _END)
+            except Exception as e:
+                failure.append(e)
+                return
+            if item is _END:
+                return
+            pending.append((item, executor.submit(_timed_load, load_fn, item)))
+
+    try:
+        fill()
+        while pending:
+            item, future = pending.popleft()
+            if not future.done():
+                # ยังโหลดไม่เสร็จ: ผู้ใช้ต้องรอ (stall)
+                start = time.perf_counter()
+                future.result()
+                with _stats_lock:
+                    _prefetch_state["stalls"] += 1
+                    _prefetch_state["stall_seconds"] += time.perf_counter() - start
+            # เริ่มโหลดลำดับถัดไปก่อน yield เพื่อให้โหลดซ้อนกับงานของผู้ใช้
+            fill()
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        # ผู้ใช้หยุดก่อนหมด: ยกเลิกงานที่ยังไม่เริ่ม ไม่รองานที่กำลังโหลด
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def get_prefetch_stats():
+    """
+    คืนค่าสถิติของการโหลดล่วงหน้า: prefetched, load_seconds, stalls, stall_seconds, errors
+    """
+    with _stats_lock:
+        return dict(_prefetch_state)
+
+def reset_prefetch_stats():
+    """
+    รีเซ็ตสถิติของการโหลดล่วงหน้า
+    """
+    with _stats_lock:
+        _prefetch_state.update(prefetched=0, load_seconds=0.0, stalls=0, stall_seconds=0.0, errors=0)
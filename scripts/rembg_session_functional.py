@@ -0,0 +1,74 @@
+# นำเข้า library สำหรับตรวจไฟล์โมเดล
+import os
+# นำเข้า threading สำหรับ lock ป้องกันการสร้าง session ซ้ำจากหลาย thread
+import threading
+# นำเข้า onnxruntime สำหรับกำหนดค่า inference session
+import onnxruntime as ort
+# นำเข้าคลาส session ของแต่ละโมเดลใน rembg
+from rembg.sessions import sessions_class
+
+# โมเดลเริ่มต้นของ rembg
+REMBG_MODEL = "u2net"
+# จำนวน thread ภายใน operator และระหว่าง operator ของ onnxruntime (0 = ให้ onnxruntime เลือกเอง)
+INTRA_OP_THREADS = 0
+INTER_OP_THREADS = 0
+
+# session ที่สร้างแล้วใน process นี้: (model, model_path, threads, providers) -> session
+# อยู่ระดับ module จึงคงอยู่ข้ามการกดปุ่มใน Streamlit (script ถูกรันใหม่แต่ module ไม่ถูก import ซ้ำ)
+_sessions = {}
+# lock สำหรับสร้าง session ครั้งเดียวแม้ถูกเรียกจากหลาย thread
+_sessions_lock = threading.Lock()
+
+def rembg_session_options(intra_op_threads=INTRA_OP_THREADS, inter_op_threads=INTER_OP_THREADS):
+    """
+    สร้าง ort.SessionOptions พร้อมจำนวน thread ที่กำหนด
+    """
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = int(intra_op_threads)
+    sess_opts.inter_op_num_threads = int(inter_op_threads)
+    return sess_opts
+
+def get_rembg_session(model_name=REMBG_MODEL, model_path=None, intra_op_threads=INTRA_OP_THREADS,
+                      inter_op_threads=INTER_OP_THREADS, providers=None):
+    """
+    คืนค่า rembg session ของโมเดล (สร้างครั้งแรกครั้งเดียวแล้วใช้ซ้ำทุกภาพ)
+    การโหลดโมเดลและ optimize graph ของ onnxruntime จึงเกิดครั้งเดียวต่อ process
+
+    - model_name: ชื่อโมเดลของ rembg เช่น "u2net", "u2netp", "isnet-general-use"
+      หรือ "u2net_custom" เมื่อใช้ไฟล์ .onnx ของตัวเอง (ไม่ต้องดาวน์โหลด)
+    - model_path: path ของไฟล์ .onnx สำหรับโมเดลแบบ *_custom
+    - intra_op_threads, inter_op_threads: จำนวน thread ของ onnxruntime
+    - providers: รายการ execution provider เช่น ["CPUExecutionProvider"] (None = ทุกตัวที่มี)
+    ค่าที่ไม่ถูกต้อง (ไม่มีไฟล์โมเดล, จำนวน thread ติดลบ, provider ที่ไม่มีในเครื่อง) จะ raise ValueError
+    ก่อนโหลดโมเดล
+    """
+    if model_name.endswith("_custom") and not model_path:
+        raise ValueError(f"โมเดล {model_name} ต้องกำหนด model_path")
+    if model_path:
+        if not os.path.isfile(model_path):
+            raise ValueError(f"ไม่พบไฟล์โมเดล: {model_path}")
+        # path เดียวกันที่เขียนต่างกัน (relative/absolute) ใช้ session เดียวกัน
+        model_path = os.path.abspath(model_path)
+    if int(intra_op_threads) < 0 or int(inter_op_threads) < 0:
+        raise ValueError(f"จำนวน thread ต้องไม่ติดลบ (intra {intra_op_threads}, inter {inter_op_threads})")
+    missing = [provider for provider in providers or () if provider not in ort.get_available_providers()]
+    if missing:
+        raise ValueError(f"ไม่มี execution provider: {missing} (ที่มี: {ort.get_available_providers()})")
+    key = (model_name, model_path, int(intra_op_threads), int(inter_op_threads), tuple(providers or ()))
+    with _sessions_lock:
+        if key not in _sessions:
+            # หาคลาส session ตามชื่อโมเดล
+            session_class = next((sc for sc in sessions_class if sc.name() == model_name), None)
+            if session_class is None:
+                raise ValueError(f"ไม่รู้จักโมเดล rembg: {model_name}")
+            sess_opts = rembg_session_options(intra_op_threads, inter_op_threads)
+            kwargs = {"model_path": model_path} if model_path else {}
+            _sessions[key] = session_class(model_name, sess_opts, providers=providers, **kwargs)
+        return _sessions[key]
+
+def clear_rembg_sessions():
+    """
+    ลบ session ทั้งหมดที่สร้างไว้ (เช่น เมื่อเปลี่ยนไฟล์โมเดล)
+    """
+    with _sessions_lock:
+        _sessions.clear()
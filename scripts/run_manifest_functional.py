@@ -0,0 +1,137 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า json สำหรับบันทึก manifest ทีละบรรทัด (JSON Lines)
+import json
+# นำเข้า threading สำหรับ lock เมื่อบันทึกจากหลาย thread
+import threading
+# นำเข้า time สำหรับรอบการ fsync ตามเวลา
+import time
+
+# ชื่อไฟล์ run manifest ในโฟลเดอร์ output (ไฟล์ซ่อนแบบเดียวกับ .background_index.json จึงไม่ปนกับภาพของ dataset
+# หลายเครื่องใช้ชื่อที่มี shard/worker ต่อท้าย ดู run_manifest_name)
+RUN_MANIFEST_NAME = ".run_manifest.jsonl"
+# fsync ทุกๆ กี่ record หรือทุกกี่วินาที (อย่างใดอย่างหนึ่งถึงก่อน) ข้อมูลที่หายเมื่อเครื่องดับมีไม่เกินหนึ่งรอบ
+FSYNC_BATCH = 64
+FSYNC_INTERVAL = 5.0
+# marker ท้ายไฟล์ JPEG (EOI) ใช้ตรวจว่าไฟล์ภาพถูกเขียนครบ
+JPEG_EOI = b"\xff\xd9"
+
+def run_manifest_name(shard_index=0, num_shards=1, worker=None):
+    """
+    ชื่อไฟล์ run manifest ที่ไม่ชนกันเมื่อนำผลของหลายเครื่องมารวมโฟลเดอร์เดียว
+    """
+    if worker is not None:
+        return f".run_manifest-{worker}.jsonl"
+    if num_shards > 1:
+        return f".run_manifest-{shard_index:05d}-of-{num_shards:05d}.jsonl"
+    return RUN_MANIFEST_NAME
+
+def load_run_manifest(path):
+    """
+    อ่าน run manifest: คืนค่า (header, dict ของ index -> record)
+    บรรทัดสุดท้ายที่เขียนไม่ครบ (เครื่องดับระหว่างเขียน) จะถูกข้าม record ของ index เดียวกันใช้บรรทัดหลังสุด
+    คืนค่า (None, {}) ถ้ายังไม่มีไฟล์
+    """
+    header, records = None, {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "index" in entry:
+                    records[entry["index"]] = entry
+                elif header is None:
+                    header = entry
+    except FileNotFoundError:
+        pass
+    return header, records
+
+def is_complete_jpeg(path, size=None):
+    """
+    ตรวจว่าไฟล์ JPEG มีขนาดตามที่บันทึกไว้ (ถ้ากำหนด) และลงท้ายด้วย EOI marker
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if size is not None and f.tell() != size:
+                return False
+            if f.tell() < len(JPEG_EOI):
+                return False
+            f.seek(-len(JPEG_EOI), os.SEEK_END)
+            return f.read() == JPEG_EOI
+    except OSError:
+        return False
+
+def verify_file_record(record, output_path, annotations_path):
+    """
+    ตรวจว่าไฟล์ของ record (โหมดไฟล์แยก) ยังอยู่ครบ: ภาพ JPEG สมบูรณ์และ annotation ขนาดตรงกับที่บันทึก
+    """
+    files = record.get("files", {})
+    try:
+        if os.path.getsize(os.path.join(annotations_path, files["annotation"])) != files["annotation_size"]:
+            return False
+    except (OSError, KeyError):
+        return False
+    return is_complete_jpeg(os.path.join(output_path, files["image"]), files.get("image_size"))
+
+class RunManifest:
+    """
+    run manifest แบบ append-only (JSON Lines): บรรทัดแรกเป็น header ของการรัน (seed, fingerprint, ...)
+    บรรทัดถัดไปเป็น record หนึ่งบรรทัดต่อภาพที่เขียนเสร็จ (ไฟล์ผลลัพธ์และพารามิเตอร์ที่สุ่มได้)
+    fsync เป็นชุด (ทุก fsync_batch record หรือ fsync_interval วินาที) เพื่อไม่ให้ fsync ทุกภาพ
+    - keep: record เดิมที่ตรวจแล้วว่ายังใช้ได้ (ทำต่อจากการรันเดิม) ถ้า header ต่างจากไฟล์เดิมจะเริ่มไฟล์ใหม่
+    ทุกเมธอดปลอดภัยเมื่อเรียกจากหลาย thread
+    """
+
+    def __init__(self, path, header, keep=None, fsync_batch=FSYNC_BATCH, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.indices = set(keep or ())
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        if keep:
+            # ทำต่อ: เขียนต่อท้ายไฟล์เดิม (record เดิมที่ไม่ผ่านการตรวจจะถูกเขียนทับด้วย record ใหม่ของ index เดียวกัน)
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(json.dumps(header) + "\n")
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def record(self, index, files, metadata=None, boxes=None):
+        """
+        บันทึกว่าภาพลำดับที่ index เขียนเสร็จแล้ว พร้อมไฟล์ผลลัพธ์ (files) และพารามิเตอร์ที่สุ่มได้
+        """
+        entry = {"index": index, "files": files, "metadata": metadata, "boxes": boxes}
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.indices.add(index)
+            self._pending += 1
+            if self._pending >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def close(self):
+        """
+        fsync record ที่ค้างแล้วปิดไฟล์
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,190 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า io สำหรับส่ง bytes เข้า tarfile
+import io
+# นำเข้า json สำหรับไฟล์ index ของ shard
+import json
+# นำเข้า tarfile สำหรับเขียน/อ่าน shard แบบ tar
+import tarfile
+# นำเข้า threading สำหรับ lock เมื่อเขียนจากหลาย thread
+import threading
+# นำเข้า re สำหรับแยกลำดับของ shard จากชื่อไฟล์
+import re
+
+# ขนาดสูงสุดเริ่มต้นของแต่ละ shard (ไบต์) = 1 GB
+SHARD_MAX_BYTES = 1 << 30
+# นามสกุลของไฟล์ index ที่อยู่คู่กับแต่ละ shard
+SHARD_INDEX_SUFFIX = ".idx.json"
+
+class ShardWriter:
+    """
+    เขียน sample ลงไฟล์ tar หลายไฟล์ (shard) แบบ WebDataset: แต่ละ sample มี key เดียวกัน
+    และมีหลายไฟล์ย่อยตามนามสกุล เช่น synthetic_image_001.jpg + synthetic_image_001.txt
+    เมื่อ shard ปัจจุบันใหญ่เกิน max_shard_bytes จะปิดแล้วเริ่ม shard ใหม่
+    ทุก shard มีไฟล์ index (.idx.json) เก็บ offset/ขนาดของแต่ละไฟล์ย่อยสำหรับอ่านแบบสุ่ม
+    """
+
+    def __init__(self, shard_dir, prefix="shard", max_shard_bytes=SHARD_MAX_BYTES, first_shard=0):
+        self.shard_dir = shard_dir
+        self.prefix = prefix
+        # ลำดับของ shard แรก (ทำต่อจากการรันเดิมโดยไม่เขียนทับ shard ที่มีอยู่ ดู recover_shards)
+        self.first_shard = first_shard
+        self.max_shard_bytes = max_shard_bytes
+        self.shard_paths = []
+        self._tar = None
+        self._index = {}
+        self._lock = threading.Lock()
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def _open_next_shard(self):
+        # ปิด shard เดิมแล้วเปิด shard ถัดไป
+        self._close_shard()
+        path = os.path.join(self.shard_dir, f"{self.prefix}-{self.first_shard + len(self.shard_paths):06d}.tar")
+        self.shard_paths.append(path)
+        self._tar = tarfile.open(path, "w")
+        self._index = {}
+
+    def _close_shard(self):
+        # ปิด shard ปัจจุบันและเขียนไฟล์ index ของ shard นั้น
+        if self._tar is None:
+            return
+        self._tar.close()
+        with open(self.shard_paths[-1] + SHARD_INDEX_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        self._tar = None
+
+    def add(self, key, members):
+        """
+        เพิ่มหนึ่ง sample: members คือ dict ของ นามสกุล -> bytes เช่น {"jpg": ..., "txt": ...}
+        """
+        sample_bytes = sum(len(data) for data in members.values())
+        with self._lock:
+            if self._tar is None or (self._index and self._tar.offset + sample_bytes > self.max_shard_bytes):
+                self._open_next_shard()
+            entry = {}
+            for ext, data in members.items():
+                info = tarfile.TarInfo(f"{key}.{ext}")
+                info.size = len(data)
+                self._tar.addfile(info, io.BytesIO(data))
+                # ข้อมูลไฟล์อยู่ก่อนตำแหน่งปัจจุบันของ tar เท่ากับขนาดข้อมูลที่ปัดเป็นบล็อก 512 ไบต์
+                padded_size = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                entry[ext] = [self._tar.offset - padded_size, info.size]
+            self._index[key] = entry
+
+    def close(self):
+        """
+        ปิด shard สุดท้ายและเขียน index ให้ครบ
+        """
+        with self._lock:
+            self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def list_shards(shard_dir):
+    """
+    คืนค่ารายการ path ของ shard ทั้งหมดในโฟลเดอร์ (เรียงตามชื่อ)
+    """
+    return [os.path.join(shard_dir, f) for f in sorted(os.listdir(shard_dir)) if f.endswith(".tar")]
+
+def recover_shards(shard_dir, prefix="shard"):
+    """
+    เตรียมทำต่อจากการรันเดิมที่ถูกขัดจังหวะ: ลบ shard ของ prefix ที่ไม่มี index (ยังเขียนไม่เสร็จตอนหยุด)
+    คืนค่า (set ของ key ที่อยู่ใน shard ที่สมบูรณ์, ลำดับของ shard ถัดไปสำหรับ ShardWriter first_shard)
+    """
+    pattern = re.compile(rf"^{re.escape(prefix)}-(\d{{6}})\.tar$")
+    keys, next_shard = set(), 0
+    if not os.path.isdir(shard_dir):
+        return keys, next_shard
+    for filename in sorted(os.listdir(shard_dir)):
+        match = pattern.match(filename)
+        if match is None:
+            continue
+        shard_path = os.path.join(shard_dir, filename)
+        if not os.path.exists(shard_path + SHARD_INDEX_SUFFIX):
+            os.remove(shard_path)
+            continue
+        keys.update(load_shard_index(shard_path))
+        next_shard = max(next_shard, int(match.group(1)) + 1)
+    return keys, next_shard
+
+def remove_shards(shard_dir, prefix="shard"):
+    """
+    ลบ shard ของ prefix และไฟล์ index ทั้งหมด (ใช้เมื่อเริ่มสร้างใหม่ ไม่ให้ shard ของการรันก่อนปนกับ shard ใหม่)
+    คืนค่าจำนวน shard ที่ลบ
+    """
+    pattern = re.compile(rf"^{re.escape(prefix)}-(\d{{6}})\.tar({re.escape(SHARD_INDEX_SUFFIX)})?$")
+    removed = 0
+    if not os.path.isdir(shard_dir):
+        return removed
+    for filename in os.listdir(shard_dir):
+        match = pattern.match(filename)
+        if match is None:
+            continue
+        os.remove(os.path.join(shard_dir, filename))
+        removed += match.group(2) is None
+    return removed
+
+def iter_shard_samples(shard_dir):
+    """
+    อ่าน sample จากทุก shard ตามลำดับแบบ streaming
+    yield (key, members) โดย members คือ dict ของ นามสกุล -> bytes
+    """
+    for shard_path in list_shards(shard_dir):
+        key, members = None, {}
+        with tarfile.open(shard_path, "r|") as tar:
+            for info in tar:
+                if not info.isfile():
+                    continue
+                member_key, ext = info.name.rsplit(".", 1)
+                # ไฟล์ของ sample เดียวกันอยู่ติดกัน เมื่อ key เปลี่ยนแสดงว่า sample ก่อนหน้าครบแล้ว
+                if key is not None and member_key != key:
+                    yield key, members
+                    members = {}
+                key = member_key
+                members[ext] = tar.extractfile(info).read()
+        if key is not None:
+            yield key, members
+
+def load_shard_index(shard_path):
+    """
+    โหลด index ของ shard: dict ของ key -> {นามสกุล: [offset, size]}
+    """
+    with open(shard_path + SHARD_INDEX_SUFFIX, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def read_shard_sample(shard_path, key, index=None):
+    """
+    อ่าน sample เดียวแบบสุ่มจาก shard โดยใช้ offset จาก index (ไม่ต้องไล่อ่าน tar ทั้งไฟล์)
+    คืนค่า members dict ของ นามสกุล -> bytes
+    """
+    if index is None:
+        index = load_shard_index(shard_path)
+    members = {}
+    with open(shard_path, "rb") as f:
+        for ext, (offset, size) in index[key].items():
+            f.seek(offset)
+            members[ext] = f.read(size)
+    return members
+
+def export_shards_to_yolo(shard_dir, output_path, annotations_path, log_callback=None):
+    """
+    แตก shard ออกเป็นโครงสร้างไฟล์แบบ YOLO เดิม: ภาพ .jpg ใน output_path และ .txt ใน annotations_path
+    """
+    os.makedirs(output_path, exist_ok=True)
+    os.makedirs(annotations_path, exist_ok=True)
+    count = 0
+    for key, members in iter_shard_samples(shard_dir):
+        for ext, data in members.items():
+            folder = annotations_path if ext == "txt" else output_path
+            with open(os.path.join(folder, f"{key}.{ext}"), "wb") as f:
+                f.write(data)
+        count += 1
+    msg = f"✅ export จาก shard แล้ว {count} ภาพ\n"
+    if log_callback: log_callback(msg)
+    else: print(msg)
+    return count
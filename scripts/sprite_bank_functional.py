@@ -0,0 +1,135 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า hashlib สำหรับสร้าง key ของ sprite bank
+import hashlib
+# นำเข้า OpenCV library สำหรับประมวลผลภาพ
+import cv2
+# นำเข้า NumPy library สำหรับการคำนวณทางคณิตศาสตร์
+import numpy as np
+# นำเข้าฟังก์ชันคำนวณ hash ของไฟล์
+from water_mask_functional import file_content_hash
+# นำเข้าฟังก์ชันปรับขนาด/หมุนฟีเจอร์ และช่วง scale/มุม ที่ใช้ตอนสร้างภาพ
+from placement_functional import render_feature, scaled_size, SCALE_RANGE, ANGLE_RANGE
+
+# ระยะห่างของ scale ใน grid (ยิ่งเล็กยิ่งหลากหลาย แต่ atlas ใหญ่ขึ้นและสร้างนานขึ้น)
+SPRITE_SCALE_STEP = 0.05
+# ระยะห่างของมุมหมุนใน grid (องศา)
+SPRITE_ANGLE_STEP = 15
+# ชื่อโฟลเดอร์เก็บ sprite bank (สร้างไว้ในโฟลเดอร์ features)
+SPRITE_BANK_DIRNAME = ".sprite_bank"
+
+# โครงสร้างของแต่ละ entry ใน atlas:
+# scale/angle = ค่าบน grid, width/height = ขนาด canvas หลังหมุน (ใช้ตรวจพื้นที่น้ำ)
+# bbox_x/bbox_y/bbox_w/bbox_h = bounding box จริงจาก alpha ภายใน canvas, offset = ตำแหน่งไบต์ใน atlas
+SPRITE_INDEX_DTYPE = np.dtype([
+    ("scale", np.float32), ("angle", np.float32),
+    ("width", np.int32), ("height", np.int32),
+    ("bbox_x", np.int32), ("bbox_y", np.int32), ("bbox_w", np.int32), ("bbox_h", np.int32),
+    ("offset", np.int64),
+])
+
+# sprite bank ที่โหลดแล้วใน process นี้: path ของ index -> bank
+_loaded_banks = {}
+
+def sprite_grid(scale_step=SPRITE_SCALE_STEP, angle_step=SPRITE_ANGLE_STEP, scale_range=SCALE_RANGE):
+    """
+    สร้าง grid ของ scale และมุมที่จะ pre-render
+    คืนค่า (scales, angles) เป็น NumPy array
+    """
+    scales = np.round(np.arange(scale_range[0], scale_range[1] + 1e-9, scale_step), 6)
+    angles = np.arange(ANGLE_RANGE[0], ANGLE_RANGE[1], angle_step, dtype=np.float64)
+    return scales, angles
+
+def sprite_bank_paths(feature_path, bank_dir, scale_step=SPRITE_SCALE_STEP, angle_step=SPRITE_ANGLE_STEP):
+    """
+    คืนค่า path ของไฟล์ atlas และ index ของฟีเจอร์นี้
+    ชื่อไฟล์ผูกกับ hash ของฟีเจอร์และ grid ถ้าฟีเจอร์หรือ grid เปลี่ยนจะสร้าง bank ใหม่
+    """
+    grid = f"{SCALE_RANGE}|{scale_step}|{angle_step}"
+    grid_hash = hashlib.sha1(grid.encode("utf-8")).hexdigest()[:8]
+    stem = os.path.splitext(os.path.basename(feature_path))[0]
+    base = os.path.join(bank_dir, f"{stem}_{file_content_hash(feature_path)[:16]}_{grid_hash}")
+    return f"{base}.atlas.npy", f"{base}.index.npy"
+
+def build_sprite_bank(feature_path, bank_dir, scale_step=SPRITE_SCALE_STEP, angle_step=SPRITE_ANGLE_STEP):
+    """
+    Pre-render ฟีเจอร์หนึ่งภาพทุก scale และมุมบน grid แล้วบันทึกเป็น atlas
+    เก็บเฉพาะส่วนที่ตัดตาม bounding box ของ alpha เพื่อให้ atlas มีขนาดเล็ก
+    ถ้ามี bank ของฟีเจอร์นี้อยู่แล้วจะไม่สร้างใหม่
+    คืนค่า (atlas_path, index_path) หรือ None ถ้าอ่านฟีเจอร์ไม่ได้
+    """
+    atlas_path, index_path = sprite_bank_paths(feature_path, bank_dir, scale_step, angle_step)
+    if os.path.exists(atlas_path) and os.path.exists(index_path):
+        return atlas_path, index_path
+
+    feature = cv2.imread(feature_path, cv2.IMREAD_UNCHANGED)
+    if feature is None or feature.ndim != 3 or feature.shape[2] != 4:
+        return None
+
+    scales, angles = sprite_grid(scale_step, angle_step)
+    index = np.zeros(len(scales) * len(angles), dtype=SPRITE_INDEX_DTYPE)
+    crops = []
+    offset = 0
+    for si, scale in enumerate(scales):
+        for ai, angle in enumerate(angles):
+            sprite = render_feature(feature, scale, angle)
+            # หา bounding box ของส่วนที่มองเห็น (alpha > 0)
+            coords = cv2.findNonZero(sprite[:, :, 3])
+            if coords is None:
+                # sprite ว่าง เก็บเป็นพิกเซลโปร่งใส 1 พิกเซล
+                bx, by, bw, bh = 0, 0, 1, 1
+                crop = np.zeros((1, 1, 4), np.uint8)
+            else:
+                bx, by, bw, bh = cv2.boundingRect(coords)
+                crop = sprite[by:by + bh, bx:bx + bw]
+            width, height = scaled_size(feature.shape, scale)
+            index[si * len(angles) + ai] = (scale, angle, width, height, bx, by, bw, bh, offset)
+            crops.append(np.ascontiguousarray(crop).reshape(-1))
+            offset += crop.size
+
+    # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ) เพื่อให้หลาย process สร้างพร้อมกันได้
+    os.makedirs(bank_dir, exist_ok=True)
+    for path, array in ((atlas_path, np.concatenate(crops)), (index_path, index)):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(temp_path, path)
+    return atlas_path, index_path
+
+def load_sprite_bank(feature_path, bank_dir, scale_step=SPRITE_SCALE_STEP, angle_step=SPRITE_ANGLE_STEP):
+    """
+    โหลด sprite bank ของฟีเจอร์ (สร้างก่อนถ้ายังไม่มี)
+    atlas ถูกโหลดแบบ memory-mapped จึงใช้หน่วยความจำเฉพาะ sprite ที่ถูกอ่านจริง
+    คืนค่า dict ของ bank หรือ None ถ้าสร้างไม่ได้
+    """
+    paths = build_sprite_bank(feature_path, bank_dir, scale_step, angle_step)
+    if paths is None:
+        return None
+    atlas_path, index_path = paths
+    if index_path not in _loaded_banks:
+        scales, angles = sprite_grid(scale_step, angle_step)
+        _loaded_banks[index_path] = {
+            "atlas": np.load(atlas_path, mmap_mode="r"),
+            "index": np.load(index_path),
+            "scales": scales,
+            "angles": angles,
+        }
+    return _loaded_banks[index_path]
+
+def nearest_sprite_entry(bank, scale, angle):
+    """
+    หา entry ของ sprite ที่ scale และมุมใกล้เคียงที่สุดบน grid
+    """
+    scales, angles = bank["scales"], bank["angles"]
+    si = int(np.abs(scales - scale).argmin())
+    angle_step = angles[1] - angles[0] if len(angles) > 1 else 360
+    ai = int(round((angle % 360) / angle_step)) % len(angles)
+    return bank["index"][si * len(angles) + ai]
+
+def sprite_pixels(bank, entry):
+    """
+    คืนค่าพิกเซล RGBA ของ sprite (เฉพาะส่วนที่ตัดตาม bounding box) เป็น view อ่านอย่างเดียวจาก atlas
+    """
+    start = int(entry["offset"])
+    height, width = int(entry["bbox_h"]), int(entry["bbox_w"])
+    return bank["atlas"][start:start + height * width * 4].reshape(height, width, 4)
@@ -0,0 +1,92 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า json สำหรับข้อมูลของการรันที่เก็บคู่กับตาราง
+import json
+# นำเข้า glob สำหรับค้นหาตารางของทุกเครื่องในโฟลเดอร์
+import glob
+# นำเข้า NumPy library สำหรับตารางแบบ structured array
+import numpy as np
+
+# ชื่อไฟล์ตารางพารามิเตอร์ในโฟลเดอร์ output (หลายเครื่องใช้ชื่อที่มี shard/worker ต่อท้าย ดู virtual_dataset_name)
+VIRTUAL_DATASET_NAME = "virtual_dataset.npz"
+# หนึ่งแถวต่อวัตถุ: ลำดับภาพ, ลำดับพื้นหลัง/ฟีเจอร์ใน info, scale, มุม และตำแหน่ง canvas (ก่อนเลื่อนตาม bbox)
+PLACEMENT_DTYPE = np.dtype([
+    ("index", "<u4"), ("background", "<u4"), ("feature", "<u4"),
+    ("scale", "<f8"), ("angle", "<f8"), ("x", "<i4"), ("y", "<i4"),
+])
+# หนึ่งแถวต่อกล่องใน annotation (หน่วยพิกเซลของภาพเต็ม) อ่าน label ได้โดยไม่ต้อง render
+BOX_DTYPE = np.dtype([
+    ("index", "<u4"), ("class_id", "<u4"), ("x", "<i4"), ("y", "<i4"), ("width", "<i4"), ("height", "<i4"),
+])
+
+def virtual_dataset_name(shard_index=0, num_shards=1, worker=None):
+    """
+    ชื่อไฟล์ตารางที่ไม่ชนกันเมื่อนำผลของหลายเครื่องมารวมโฟลเดอร์เดียว (ตั้งชื่อแบบเดียวกับ run_manifest_name)
+    """
+    if worker is not None:
+        return f"virtual_dataset-{worker}.npz"
+    if num_shards > 1:
+        return f"virtual_dataset-{shard_index:05d}-of-{num_shards:05d}.npz"
+    return VIRTUAL_DATASET_NAME
+
+def placement_tables(records, backgrounds, features):
+    """
+    สร้างตาราง (placements, boxes) จาก record ของ run manifest (index -> record ที่มี metadata["placements"])
+    backgrounds, features: list ของ path ตามลำดับใน info (พื้นหลัง/ฟีเจอร์เก็บเป็นลำดับแทนชื่อไฟล์)
+    """
+    background_ids = {os.path.basename(path): b for b, path in enumerate(backgrounds)}
+    feature_ids = {os.path.basename(path): f for f, path in enumerate(features)}
+    placements, boxes = [], []
+    for index in sorted(records):
+        metadata, record_boxes = records[index]["metadata"], records[index]["boxes"]
+        b = background_ids[os.path.basename(metadata["background"])]
+        for params in metadata["placements"]:
+            placements.append((index, b, feature_ids[os.path.basename(params["feature"])],
+                               params["scale"], params["angle"], params["x"], params["y"]))
+        boxes.extend((index, *box) for box in record_boxes)
+    return np.array(placements, PLACEMENT_DTYPE), np.array(boxes, BOX_DTYPE)
+
+def write_virtual_dataset(path, placements, boxes, info):
+    """
+    บันทึกตาราง placements/boxes พร้อม info (seed, ชื่อไฟล์ input และพารามิเตอร์ของตัวสร้างภาพ) เป็น .npz แบบ atomic
+    """
+    # บันทึกแบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+    temp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(temp_path, placements=placements, boxes=boxes, info=np.array(json.dumps(info)))
+    os.replace(temp_path, path)
+    return path
+
+def load_virtual_dataset(paths):
+    """
+    โหลดตารางจาก path หรือ list ของ path/โฟลเดอร์ (รวมตารางของทุกเครื่องที่มาจากการรันเดียวกัน)
+    คืนค่า (placements, boxes, info) เรียงตามลำดับภาพ ตารางจากการรันต่างกัน (fingerprint ไม่ตรง) จะ raise ValueError
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "virtual_dataset*.npz"))))
+        else:
+            files.append(path)
+    if not files:
+        raise ValueError("ไม่พบตาราง virtual dataset")
+
+    placements, boxes, info = [], [], None
+    seen = np.zeros(0, np.uint32)
+    for path in files:
+        with np.load(path) as data:
+            file_info = json.loads(str(data["info"]))
+            if info is not None and file_info["fingerprint"] != info["fingerprint"]:
+                raise ValueError(f"ตารางมาจากการรันคนละชุด (seed/input/พารามิเตอร์ต่างกัน): {path}")
+            info = file_info
+            # ภาพที่มีในตารางก่อนหน้าแล้ว (เช่นชุดงานที่ coordinator แจกซ้ำ) ใช้ของตารางแรก
+            file_placements, file_boxes = data["placements"], data["boxes"]
+            placements.append(file_placements[~np.isin(file_placements["index"], seen)])
+            boxes.append(file_boxes[~np.isin(file_boxes["index"], seen)])
+            seen = np.union1d(seen, file_placements["index"])
+    # เรียงตามลำดับภาพ (stable จึงคงลำดับการวางวัตถุในภาพเดียวกัน)
+    placements, boxes = np.concatenate(placements), np.concatenate(boxes)
+    placements = placements[np.argsort(placements["index"], kind="stable")]
+    boxes = boxes[np.argsort(boxes["index"], kind="stable")]
+    return placements, boxes, info
@@ -0,0 +1,166 @@
+# นำเข้า library สำหรับจัดการไฟล์และโฟลเดอร์
+import os
+# นำเข้า hashlib สำหรับสร้าง hash ของเนื้อหาไฟล์
+import hashlib
+# นำเข้า OrderedDict สำหรับทำ LRU cache ในหน่วยความจำ
+from collections import OrderedDict
+# นำเข้า threading สำหรับ lock ของ cache เมื่อโหลด mask ล่วงหน้าจากหลาย thread
+import threading
+# นำเข้า OpenCV library สำหรับประมวลผลภาพ
+import cv2
+# นำเข้า NumPy library สำหรับการคำนวณทางคณิตศาสตร์
+import numpy as np
+
+# ขอบล่างของสี HSV ที่ถือว่าเป็นน้ำ (สีดำเข้มถึงน้ำเงินเข้ม ค่าทดลองจากภาพจริง)
+LOWER_BOUND = np.array([0, 0, 0])
+# ขอบบนของสี HSV ที่ถือว่าเป็นน้ำ
+UPPER_BOUND = np.array([110, 255, 220])
+# ขนาด kernel สำหรับ morphological operations
+KERNEL_SIZE = 5
+# สัดส่วนความละเอียดของ mask เทียบกับภาพพื้นหลัง (1.0 = เต็มความละเอียด, 0.25 = 1/4 ต่อด้าน)
+MASK_SCALE = 1.0
+# จำนวน mask สูงสุดที่เก็บไว้ในหน่วยความจำ (LRU)
+MASK_CACHE_SIZE = 16
+# ชื่อโฟลเดอร์ cache บนดิสก์ (สร้างไว้ในโฟลเดอร์ backgrounds)
+MASK_CACHE_DIRNAME = ".water_mask_cache"
+
+# LRU cache ของ mask ในหน่วยความจำ: key -> mask
+_mask_cache = OrderedDict()
+# lock สำหรับใช้ cache ของ mask จากหลาย thread
+_mask_lock = threading.Lock()
+# cache ของ hash ไฟล์: (path, size, mtime) -> hash เพื่อไม่ต้องอ่านไฟล์ซ้ำทุกครั้ง
+_file_hash_cache = {}
+
+def mask_shape(image_shape, scale=MASK_SCALE):
+    """
+    คำนวณขนาด (height, width) ของ mask ที่ความละเอียด scale (อย่างน้อย 1 พิกเซลต่อด้าน)
+    """
+    if scale >= 1:
+        return image_shape[0], image_shape[1]
+    return max(1, int(round(image_shape[0] * scale))), max(1, int(round(image_shape[1] * scale)))
+
+def detect_water_area(image, lower_bound=LOWER_BOUND, upper_bound=UPPER_BOUND, kernel_size=KERNEL_SIZE, scale=MASK_SCALE):
+    """
+    ตรวจจับพื้นที่น้ำในภาพโดยใช้สี HSV และฟิลเตอร์ทาง Morphological
+    คืนค่าเป็น mask (พื้นที่ที่ถือว่าเป็นน้ำ)
+    ถ้า scale < 1 จะย่อภาพก่อน (ขนาดดู mask_shape) และย่อ kernel ตามสัดส่วนเดียวกัน
+    mask ที่ได้จึงมีขนาดเล็กกว่าภาพ ใช้ร่วมกับ sample_water_position(image_size=...) เพื่อแปลงพิกัดกลับ
+    """
+    if scale < 1:
+        # ย่อภาพก่อนคำนวณ HSV/morphology (INTER_LINEAR เร็วกว่า INTER_AREA หลายเท่า และละเอียดพอสำหรับ mask หยาบ)
+        height, width = mask_shape(image.shape, scale)
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+        kernel_size = max(1, int(round(kernel_size * scale)))
+    # แปลงภาพจาก BGR เป็น HSV color space
+    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    # สร้าง mask โดยหาพิกเซลที่อยู่ในช่วงสีที่กำหนด
+    mask = cv2.inRange(hsv_image, lower_bound, upper_bound)
+
+    # ใช้ Morphological Filter เพื่อขจัด noise
+    # สร้าง kernel ขนาด kernel_size x kernel_size สำหรับ morphological operations
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    # ใช้ MORPH_CLOSE เพื่อปิดช่องว่างเล็กๆ ในพื้นที่น้ำ
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    # ใช้ MORPH_OPEN เพื่อลบ noise เล็กๆ ออกจากพื้นที่น้ำ
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    # ส่งคืน mask ที่แสดงพื้นที่น้ำ
+    return mask
+
+def file_content_hash(path):
+    """
+    คำนวณ SHA-1 ของเนื้อหาไฟล์ (จำผลไว้ตาม path + ขนาด + เวลาแก้ไข)
+    """
+    stat = os.stat(path)
+    stat_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if stat_key not in _file_hash_cache:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            # อ่านทีละ 1 MB เพื่อไม่ให้ใช้หน่วยความจำมาก
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _file_hash_cache[stat_key] = digest.hexdigest()
+    return _file_hash_cache[stat_key]
+
+def water_mask_params_hash(lower_bound=LOWER_BOUND, upper_bound=UPPER_BOUND, kernel_size=KERNEL_SIZE, scale=MASK_SCALE):
+    """
+    hash ของพารามิเตอร์ที่ใช้สร้าง mask (ช่วงสี HSV + ขนาด kernel + ความละเอียดของ mask)
+    """
+    params = f"{np.asarray(lower_bound).tolist()}|{np.asarray(upper_bound).tolist()}|{kernel_size}"
+    # mask เต็มความละเอียดใช้ key เดิม เพื่อให้ cache ที่มีอยู่แล้วยังใช้ได้
+    if scale < 1:
+        params += f"|{scale}"
+    return hashlib.sha1(params.encode("utf-8")).hexdigest()[:12]
+
+def water_mask_key(bg_path, lower_bound=LOWER_BOUND, upper_bound=UPPER_BOUND, kernel_size=KERNEL_SIZE, scale=MASK_SCALE):
+    """
+    สร้าง key ของ mask จาก hash ของไฟล์พื้นหลัง + ช่วงสี HSV + ขนาด kernel + ความละเอียดของ mask
+    ถ้าเปลี่ยน threshold ใดๆ key จะเปลี่ยน ทำให้ mask เก่าใช้ไม่ได้อัตโนมัติ
+    """
+    return f"{file_content_hash(bg_path)}_{water_mask_params_hash(lower_bound, upper_bound, kernel_size, scale)}"
+
+def _remember_mask(key, mask):
+    """
+    เก็บ mask ลง LRU cache ในหน่วยความจำ และลบรายการที่ใช้ล่าสุดนานที่สุดเมื่อเต็ม
+    """
+    with _mask_lock:
+        _mask_cache[key] = mask
+        _mask_cache.move_to_end(key)
+        while len(_mask_cache) > MASK_CACHE_SIZE:
+            _mask_cache.popitem(last=False)
+
+def get_water_mask(bg_path, background=None, cache_dir=None,
+                   lower_bound=LOWER_BOUND, upper_bound=UPPER_BOUND, kernel_size=KERNEL_SIZE, scale=MASK_SCALE):
+    """
+    คืนค่า water mask ของภาพพื้นหลัง (ที่ความละเอียด scale) โดยดูจาก cache ก่อน:
+    1. LRU ในหน่วยความจำ
+    2. ไฟล์ .npy บนดิสก์ใน cache_dir (โหลดแบบ memory-mapped อ่านอย่างเดียว)
+    3. ถ้าไม่มีจึงคำนวณด้วย detect_water_area แล้วบันทึกลง cache ทั้งสองชั้น
+    ถ้า cache_dir เป็น None จะใช้เฉพาะ cache ในหน่วยความจำ
+    """
+    key = water_mask_key(bg_path, lower_bound, upper_bound, kernel_size, scale)
+
+    # 1. ดูใน cache หน่วยความจำ
+    with _mask_lock:
+        if key in _mask_cache:
+            _mask_cache.move_to_end(key)
+            return _mask_cache[key]
+
+    # 2. ดูใน cache บนดิสก์
+    cache_path = os.path.join(cache_dir, f"{key}.npy") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            mask = np.load(cache_path, mmap_mode="r")
+            _remember_mask(key, mask)
+            return mask
+        except (OSError, ValueError):
+            # ไฟล์เสียหาย (เช่น เขียนไม่ครบ) ให้คำนวณใหม่
+            pass
+
+    # 3. คำนวณ mask ใหม่
+    if background is None:
+        background = cv2.imread(bg_path)
+        if background is None:
+            return None
+    mask = detect_water_area(background, lower_bound, upper_bound, kernel_size, scale)
+    # ป้องกันไม่ให้ผู้เรียกแก้ไข mask ที่แชร์กันใน cache
+    mask.flags.writeable = False
+
+    # บันทึกลงดิสก์แบบ atomic (เขียนไฟล์ชั่วคราวแล้วค่อยเปลี่ยนชื่อ)
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, mask, allow_pickle=False)
+        os.replace(temp_path, cache_path)
+
+    _remember_mask(key, mask)
+    return mask
+
+def clear_mask_cache():
+    """
+    ล้าง cache ของ mask และ hash ในหน่วยความจำ (ไม่ลบไฟล์บนดิสก์)
+    """
+    with _mask_lock:
+        _mask_cache.clear()
+    _file_hash_cache.clear()
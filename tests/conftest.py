@@ -0,0 +1,36 @@
+# ให้ test import โมดูลในโฟลเดอร์ scripts ได้เหมือนตอนรันสคริปต์จากในโฟลเดอร์นั้น
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+
+def write_synthetic_assets(root, backgrounds=3, features=2, bg_size=(240, 320), seed=0):
+    # พื้นหลัง .jpg สีสว่างที่มีบริเวณน้ำสีเข้มตรงกลาง และฟีเจอร์ .png วงรีบน canvas โปร่งใส
+    rng = np.random.default_rng(seed)
+    backgrounds_path, features_path = os.path.join(root, "backgrounds"), os.path.join(root, "features")
+    os.makedirs(backgrounds_path)
+    os.makedirs(features_path)
+    height, width = bg_size
+    for b in range(backgrounds):
+        background = np.full((height, width, 3), 245, np.uint8)
+        axes = (int(width * rng.uniform(0.3, 0.4)), int(height * rng.uniform(0.3, 0.4)))
+        cv2.ellipse(background, (width // 2, height // 2), axes, float(rng.uniform(0, 30)), 0, 360, (70, 60, 20), -1)
+        cv2.imwrite(os.path.join(backgrounds_path, f"background_{b + 1:03d}.jpg"), background)
+    for f in range(features):
+        feature = np.zeros((40, 60, 4), np.uint8)
+        feature[:, :, :3] = rng.integers(0, 256, 3)
+        alpha = np.zeros((40, 60), np.uint8)
+        cv2.ellipse(alpha, (30, 20), (24 - 4 * f, 14), 0, 0, 360, 255, -1)
+        feature[:, :, 3] = alpha
+        cv2.imwrite(os.path.join(features_path, f"feature_{f + 1:03d}.png"), feature)
+    return backgrounds_path, features_path
+
+
+@pytest.fixture
+def synthetic_assets(tmp_path):
+    return write_synthetic_assets(str(tmp_path))
@@ -0,0 +1,52 @@
+import threading
+
+from async_writer_functional import AsyncSampleWriter
+
+
+def test_submit_blocks_when_queue_is_full():
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def write(i):
+        started.release()
+        release.wait(5)
+        return f"✅ {i}\n"
+
+    writer = AsyncSampleWriter(write, threads=1, max_pending=2)
+    writer.submit(1)
+    writer.submit(2)
+    assert started.acquire(timeout=5)
+    # งานค้างครบ max_pending แล้ว: submit งานที่สามต้องรอจนกว่างานแรกจะเสร็จ
+    third = threading.Thread(target=writer.submit, args=(3,))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive()
+    release.set()
+    third.join(5)
+    assert not third.is_alive()
+    assert writer.close() == ["✅ 1\n", "✅ 2\n", "✅ 3\n"]
+
+
+def write_or_fail(i):
+    if i == 2:
+        raise OSError("disk full")
+    return f"✅ {i}\n"
+
+
+def test_write_error_is_reported_by_drain():
+    # threads=0 เขียนทันทีใน thread ที่เรียก submit จึงดึงข้อความได้ทันที
+    writer = AsyncSampleWriter(write_or_fail, threads=0)
+    writer.submit(1)
+    writer.submit(2)
+    assert writer.drain() == ["✅ 1\n", "❌ Error while writing: disk full\n"]
+    # error ไม่หยุดงานถัดไป
+    writer.submit(3)
+    assert writer.close() == ["✅ 3\n"]
+
+
+def test_write_error_is_reported_by_close():
+    with AsyncSampleWriter(write_or_fail, threads=2, max_pending=1) as writer:
+        for i in (1, 2, 3):
+            writer.submit(i)
+        messages = writer.close()
+    assert messages == ["✅ 1\n", "❌ Error while writing: disk full\n", "✅ 3\n"]
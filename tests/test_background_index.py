@@ -0,0 +1,86 @@
+import os
+
+import cv2
+import numpy as np
+
+from background_index_functional import (
+    water_rectangles, compute_background_entry, max_feature_scale, build_placement_plan, sample_placement,
+)
+from placement_functional import sample_water_position, scaled_size, SCALE_RANGE
+from water_mask_functional import get_water_mask
+from generate_synthetic_functional import generate_synthetic_dataset
+
+
+def write_strip_assets(root):
+    # พื้นหลังที่มีน้ำเป็นแนวแคบตามแนวนอน และฟีเจอร์ยาว (กว้างกว่าแนวน้ำมากเมื่อหมุน)
+    backgrounds_path, features_path = os.path.join(root, "backgrounds"), os.path.join(root, "features")
+    os.makedirs(backgrounds_path)
+    os.makedirs(features_path)
+    for b, (top, height) in enumerate([(100, 36), (20, 44), (150, 40)]):
+        background = np.full((240, 640, 3), 245, np.uint8)
+        background[top:top + height, 40:600] = (70, 60, 20)
+        cv2.imwrite(os.path.join(backgrounds_path, f"background_{b + 1:03d}.jpg"), background)
+    feature = np.zeros((40, 300, 4), np.uint8)
+    feature[:, :, :3] = (0, 0, 200)
+    feature[8:32, 10:290, 3] = 255
+    cv2.imwrite(os.path.join(features_path, "feature_001.png"), feature)
+    return backgrounds_path, features_path
+
+
+def test_water_rectangles_of_strip():
+    mask = np.zeros((60, 160), np.uint8)
+    mask[20:30, 10:150] = 255
+    mask[0:40, 0:5] = 255
+    rectangles = water_rectangles(mask)
+    # แนวนอน 10 x 140 และแนวตั้ง 40 x 5 ไม่มีคู่ไหนครอบอีกคู่
+    assert [10, 140] in rectangles and [40, 5] in rectangles
+    assert all(not (h2 >= h1 and w2 >= w1) for (h1, w1) in rectangles for (h2, w2) in rectangles if [h1, w1] != [h2, w2])
+    assert water_rectangles(np.zeros((8, 8), np.uint8)) == []
+
+
+def test_every_feasible_scale_places_on_strip(tmp_path):
+    backgrounds_path, features_path = write_strip_assets(str(tmp_path))
+    feature = cv2.imread(os.path.join(features_path, "feature_001.png"), cv2.IMREAD_UNCHANGED)
+    rng = np.random.default_rng(0)
+    for name in sorted(os.listdir(backgrounds_path)):
+        bg_path = os.path.join(backgrounds_path, name)
+        entry = compute_background_entry(bg_path)
+        limit = max_feature_scale(entry, feature.shape[1], feature.shape[0])
+        # ฟีเจอร์ยาววางตามแนวน้ำได้เกินครึ่งของช่วง scale (กล่องจัตุรัสจำกัดไว้ที่ความสูงของแนวน้ำ)
+        assert limit > np.mean(SCALE_RANGE)
+        background = cv2.imread(bg_path)
+        water_mask = get_water_mask(bg_path, background)
+        for scale in np.linspace(SCALE_RANGE[0], min(limit, SCALE_RANGE[1]), 25):
+            width, height = scaled_size(feature.shape, scale)
+            position = sample_water_position(water_mask, width, height, rng=rng,
+                                             image_size=(background.shape[1], background.shape[0]))
+            assert position is not None, (name, scale)
+
+
+def test_placement_plan_scales_always_place(tmp_path):
+    backgrounds_path, features_path = write_strip_assets(str(tmp_path))
+    backgrounds = [os.path.join(backgrounds_path, name) for name in sorted(os.listdir(backgrounds_path))]
+    index = {os.path.basename(path): compute_background_entry(path) for path in backgrounds}
+    plan = build_placement_plan(backgrounds, [(300, 40)], index)
+    rng = np.random.default_rng(1)
+    masks = [get_water_mask(path, cv2.imread(path)) for path in backgrounds]
+    for _ in range(200):
+        b, f, (low, high) = sample_placement(plan, rng)
+        width, height = scaled_size((40, 300), rng.uniform(low, high))
+        assert sample_water_position(masks[b], width, height, rng=rng, image_size=(640, 240)) is not None
+
+
+def test_every_index_produces_an_image(tmp_path):
+    # ไม่ใช้ feature index: ตรวจน้ำใต้ canvas ของฟีเจอร์ยาวเต็มภาพ (crop ของ feature index เป็นจัตุรัสที่หมุนได้ทุกมุม)
+    backgrounds_path, features_path = write_strip_assets(str(tmp_path))
+    output, annotations = str(tmp_path / "out"), str(tmp_path / "ann")
+    messages = []
+    generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, 40, seed=4,
+                               use_feature_index=False, log_callback=messages.append)
+    # ใช้ตารางจาก background index จริง (ไม่ได้ถอยไปสุ่มแบบไม่มีตาราง)
+    assert not any("⚠️" in msg or "❌" in msg for msg in messages)
+    labels = sorted(os.listdir(annotations))
+    assert labels == [f"synthetic_image_{i:03d}.txt" for i in range(1, 41)]
+    for name in labels:
+        with open(os.path.join(annotations, name), encoding="utf-8") as f:
+            assert len(f.read().splitlines()) == 1
@@ -0,0 +1,57 @@
+import coordinator_functional
+from coordinator_functional import GenerationCoordinator, CoordinatorClient, start_coordinator, CHUNK_ATTEMPTS
+
+
+def test_failed_indices_are_leased_again():
+    coordinator = GenerationCoordinator(6, chunk_size=3)
+    first = coordinator.lease("a")
+    assert first["indices"] == [1, 2, 3]
+    # ภาพที่ 2 เขียนไม่สำเร็จ: ต้องถูกแจกใหม่ก่อนชุดอื่น ไม่ใช่หายไปจากการรัน
+    assert coordinator.complete("a", first["chunk"], [1, 3])
+    retry = coordinator.lease("b")
+    assert retry["indices"] == [2]
+    coordinator.complete("b", retry["chunk"], [2])
+    rest = coordinator.lease("b")
+    coordinator.complete("b", rest["chunk"], rest["indices"])
+    assert coordinator.lease("a") == {"done": True}
+    manifest = coordinator.manifest()
+    assert manifest["gaps"] == [] and manifest["completed"] == 6
+    assert manifest["samples"]["synthetic_image_002"] == "b"
+
+
+def test_index_that_keeps_failing_becomes_gap():
+    coordinator = GenerationCoordinator(2, chunk_size=2)
+    for _ in range(CHUNK_ATTEMPTS):
+        response = coordinator.lease("a")
+        coordinator.complete("a", response["chunk"], [i for i in response["indices"] if i != 2])
+    # แจกซ้ำครบจำนวนครั้งแล้ว: งานจบพร้อม gap แทนที่จะวนไม่รู้จบ
+    assert coordinator.lease("a") == {"done": True}
+    assert coordinator.wait_finished(0)
+    assert coordinator.manifest()["gaps"] == [2]
+
+
+def test_expired_lease_is_reassigned_to_other_client(monkeypatch):
+    monkeypatch.setattr(coordinator_functional, "WAIT_INTERVAL", 0.05)
+    server, coordinator = start_coordinator(10, chunk_size=3, lease_timeout=0.3)
+    try:
+        address = "%s:%d" % server.server_address[:2]
+        # worker ที่ตายหลังรับงาน: ขอชุดงานแล้วไม่ต่ออายุ lease และไม่แจ้งผล
+        dead = CoordinatorClient(address, worker="dead")
+        abandoned = dead.request({"op": "lease", "worker": dead.worker})["indices"]
+        alive = CoordinatorClient(address, worker="alive")
+        produced = []
+        for chunk_id, chunk in alive.iter_chunks():
+            produced.extend(chunk)
+            alive.complete(chunk_id, chunk)
+        assert coordinator.wait_finished(5)
+        # ทุกภาพถูกสร้างครั้งเดียว รวมถึงชุดที่ถูกทิ้งไว้
+        assert sorted(produced) == list(range(1, 11))
+        assert set(abandoned) <= set(produced)
+        status = coordinator.status()
+        assert status["reassigned"] == 1 and status["images_written"] == 10
+        assert status["workers"].keys() == {"alive"}
+        manifest = coordinator.manifest()
+        assert manifest["gaps"] == [] and set(manifest["samples"].values()) == {"alive"}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,97 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+import extract_features_functional
+from extract_features_functional import extract_features, load_extract_manifest, split_alpha_components, POST_PROCESS_MARGIN
+
+
+def save_raw(path, color):
+    Image.new("RGB", (60, 40), color).save(path)
+
+
+def stub_cutout(monkeypatch):
+    # แทนการลบพื้นหลังด้วยโมเดล: ฟีเจอร์คือภาพเดิมแบบทึบทั้งภาพ และจดชื่อภาพที่ถูกประมวลผล
+    calls = []
+
+    def extract(input_path, **kwargs):
+        calls.append(os.path.basename(input_path))
+        buffer = io.BytesIO()
+        with Image.open(input_path) as image:
+            image.convert("RGBA").save(buffer, format="PNG")
+        return [buffer.getvalue()], None
+
+    monkeypatch.setattr(extract_features_functional, "init_extract_worker", lambda *args: None)
+    monkeypatch.setattr(extract_features_functional, "extract_single_feature", extract)
+    return calls
+
+
+def feature_color(output, name):
+    with Image.open(os.path.join(output, name)) as image:
+        return image.convert("RGB").getpixel((30, 20))
+
+
+def test_incremental_run_skips_unchanged_and_keeps_ids(tmp_path, monkeypatch):
+    calls = stub_cutout(monkeypatch)
+    raw, output = tmp_path / "raw", str(tmp_path / "features")
+    raw.mkdir()
+    save_raw(raw / "a.jpg", (200, 0, 0))
+    save_raw(raw / "b.jpg", (0, 200, 0))
+    save_raw(raw / "c.jpg", (0, 0, 200))
+    messages = []
+    extract_features(str(raw), output, log_callback=messages.append)
+    assert calls == ["a.jpg", "b.jpg", "c.jpg"]
+    first = {name: entry["features"] for name, entry in load_extract_manifest(output).items()}
+    assert first == {"a.jpg": ["feature_001.png"], "b.jpg": ["feature_002.png"], "c.jpg": ["feature_003.png"]}
+    unchanged_mtime = os.path.getmtime(os.path.join(output, "feature_001.png"))
+
+    # รอบสอง: b เปลี่ยนเนื้อภาพ c ถูกลบ d เป็นภาพใหม่ และ a เปลี่ยนชื่อเป็น a2 (เนื้อเดิม)
+    calls.clear()
+    save_raw(raw / "b.jpg", (0, 120, 120))
+    os.remove(raw / "c.jpg")
+    save_raw(raw / "d.jpg", (90, 90, 0))
+    os.rename(raw / "a.jpg", raw / "a2.jpg")
+    messages.clear()
+    extract_features(str(raw), output, log_callback=messages.append)
+    assert calls == ["b.jpg", "d.jpg"]
+    assert any("ข้ามภาพที่ประมวลผลแล้ว 1 ภาพ" in msg for msg in messages)
+    manifest = load_extract_manifest(output)
+    # ฟีเจอร์เดิมคงชื่อเดิม (รวมภาพที่เปลี่ยนชื่อและภาพที่เปลี่ยนเนื้อ) และไม่ถูกเขียนใหม่ถ้าไม่เปลี่ยน
+    assert manifest["a2.jpg"]["features"] == ["feature_001.png"]
+    assert os.path.getmtime(os.path.join(output, "feature_001.png")) == unchanged_mtime
+    assert manifest["b.jpg"]["features"] == ["feature_002.png"]
+    assert feature_color(output, "feature_002.png")[1] < 160
+    # ฟีเจอร์ของภาพที่ถูกลบหายไป ภาพใหม่ได้ชื่อที่ไม่ชนกับฟีเจอร์ที่ยังอยู่
+    assert sorted(manifest) == ["a2.jpg", "b.jpg", "d.jpg"]
+    assert any("Removed: feature_003.png" in msg for msg in messages)
+    features = sorted(f for f in os.listdir(output) if f.endswith(".png"))
+    assert features == sorted(f for entry in manifest.values() for f in entry["features"])
+    (new_feature,) = manifest["d.jpg"]["features"]
+    assert feature_color(output, new_feature)[2] < 40 and feature_color(output, new_feature)[0] > 60
+
+    # รอบสาม: ไม่มีอะไรเปลี่ยน ไม่มีภาพที่ต้องลบพื้นหลัง
+    calls.clear()
+    extract_features(str(raw), output, log_callback=lambda m: None)
+    assert calls == []
+    assert load_extract_manifest(output) == manifest
+
+
+def test_split_alpha_components_crops_each_blob():
+    # วัตถุสองชิ้นแยกกัน และจุดเล็กกว่า min_area ที่อยู่ในระยะขอบของ crop วัตถุชิ้นหนึ่ง
+    rgba = np.zeros((200, 300, 4), np.uint8)
+    rgba[:, :, :3] = 128
+    rgba[30:90, 20:80, 3] = 255    # 60 x 60 = 3600 พิกเซล
+    rgba[10:60, 150:250, 3] = 255  # 100 x 50 = 5000 พิกเซล
+    rgba[62:66, 252:256, 3] = 255  # 16 พิกเซล
+    crops = split_alpha_components(Image.fromarray(rgba, "RGBA"), min_area=2500)
+    assert len(crops) == 2
+    m = POST_PROCESS_MARGIN
+    # เรียงจากบนลงล่าง: วัตถุที่ top = 10 ก่อน crop เผื่อขอบ m พิกเซล
+    assert crops[0].size == (100 + 2 * m, 50 + 2 * m)
+    assert crops[1].size == (60 + 2 * m, 60 + 2 * m)
+    assert crops[0].getchannel("A").getbbox() == (m, m, m + 100, m + 50)
+    assert crops[1].getchannel("A").getbbox() == (m, m, m + 60, m + 60)
+    # จุดเล็กที่ตกอยู่ใน crop ของวัตถุแรกถูกลบออก
+    assert int(np.asarray(crops[0].getchannel("A")).sum()) == 255 * 5000
@@ -0,0 +1,84 @@
+import re
+
+import cv2
+import numpy as np
+import pytest
+
+from image_cache_functional import (
+    load_image, load_thumbnail, set_image_cache_budget, get_image_cache_stats, clear_image_cache, IMAGE_CACHE_BUDGET,
+)
+from generate_synthetic_functional import generate_synthetic_dataset
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_image_cache()
+    yield
+    set_image_cache_budget(IMAGE_CACHE_BUDGET)
+    clear_image_cache()
+
+
+def write_images(tmp_path, count, size=(40, 50)):
+    # ภาพ .png ขนาดเท่ากันทุกภาพ (ถอดรหัสแล้ว 40 x 50 x 3 = 6000 ไบต์)
+    paths = []
+    for i in range(count):
+        path = str(tmp_path / f"image_{i}.png")
+        cv2.imwrite(path, np.full((*size, 3), i * 40, np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    paths = write_images(tmp_path, 4)
+    set_image_cache_budget(3 * 6000)
+    for path in paths[:3]:
+        load_image(path)
+    # ใช้ภาพแรกอีกครั้ง ภาพที่สองจึงเป็นภาพที่ไม่ได้ใช้นานที่สุดและถูกไล่ออกเมื่อเพิ่มภาพที่สี่
+    load_image(paths[0])
+    load_image(paths[3])
+    stats = get_image_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 1)
+    assert stats["entries"] == 3 and stats["bytes"] == 3 * 6000
+    load_image(paths[0])
+    load_image(paths[1])
+    assert get_image_cache_stats()["hits"] == 2
+    # ลดงบลงจะไล่ภาพเก่าออกทันที และภาพที่ใหญ่กว่างบไม่ถูกเก็บ
+    set_image_cache_budget(5000)
+    assert get_image_cache_stats()["entries"] == 0
+    assert load_image(paths[0]) is not None and get_image_cache_stats()["bytes"] == 0
+
+
+def test_cached_images_are_read_only(tmp_path):
+    (path,) = write_images(tmp_path, 1)
+    image = load_image(path)
+    assert load_image(path) is image
+    with pytest.raises(ValueError):
+        image[0, 0] = 0
+    assert load_image(str(tmp_path / "missing.png")) is None
+
+
+def test_thumbnail_uses_separate_cache(tmp_path):
+    (path,) = write_images(tmp_path, 1, size=(600, 900))
+    thumbnail = load_thumbnail(path, max_side=300)
+    assert thumbnail.shape == (200, 300, 3) and not thumbnail.flags.writeable
+    assert load_thumbnail(path, max_side=300) is thumbnail
+    # gallery ไม่ใช้งบของ cache ภาพเต็มที่ตัวสร้างภาพใช้
+    stats = get_image_cache_stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (0, 0, 0)
+
+
+def test_counters_reset_per_run(synthetic_assets, tmp_path):
+    backgrounds_path, features_path = synthetic_assets
+
+    def run(name):
+        messages = []
+        generate_synthetic_dataset(backgrounds_path, features_path, str(tmp_path / name), str(tmp_path / f"{name}_ann"),
+                                   6, seed=2, resume=False, log_callback=messages.append)
+        (hits, misses), = re.findall(r"image cache: hit (\d+) / miss (\d+)", "".join(messages))
+        return int(hits), int(misses)
+
+    first = run("first")
+    second = run("second")
+    # รอบสองใช้ภาพที่อยู่ใน cache แล้วทั้งหมด และตัวนับเริ่มจากศูนย์ (ไม่สะสมจากรอบแรก)
+    assert first[1] > 0 and second[1] == 0
+    assert second[0] == sum(first)
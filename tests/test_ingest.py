@@ -0,0 +1,70 @@
+import os
+
+from PIL import Image
+
+import ingest_functional
+from ingest_functional import ingest_images, ORIGINALS_DIRNAME
+
+
+def save_image(path, size=(120, 80), orientation=None, format=None):
+    # ภาพสีครึ่งซ้ายแดงครึ่งขวาน้ำเงิน (ใช้ตรวจทิศทางหลังหมุนตาม EXIF)
+    image = Image.new("RGB", size, (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, size[0] // 2, size[1]))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    image.save(path, format, exif=exif)
+
+
+def test_uppercase_jpg_in_place_is_kept(tmp_path):
+    # ภาพ .JPG ที่ต้องย่อถูกเขียนทับไฟล์เดิม ต้องไม่ถูกลบทิ้งหลังแทนที่ (keep_originals=False แบบ HEICtoJPG.py)
+    path = tmp_path / "IMG_001.JPG"
+    save_image(path, size=(400, 300))
+    assert ingest_images(str(tmp_path), max_long_edge=200, keep_originals=False, log_callback=lambda m: None) == 1
+    assert os.listdir(tmp_path) == ["IMG_001.JPG"]
+    with Image.open(path) as image:
+        assert image.size == (200, 150)
+
+
+def test_jpg_takes_precedence_over_same_stem(tmp_path, monkeypatch):
+    # a.heic (เนื้อไฟล์เป็น PNG ให้ Pillow เปิดได้โดยไม่ต้องมี pillow_heif) ชื่อปลายทางชนกับ a.jpg จึงถูกข้าม
+    monkeypatch.setattr(ingest_functional, "HEIF_SUPPORTED", True)
+    save_image(tmp_path / "a.jpg")
+    save_image(tmp_path / "a.heic", size=(60, 40), format="PNG")
+    before = (tmp_path / "a.jpg").read_bytes()
+    messages = []
+    assert ingest_images(str(tmp_path), keep_originals=False, log_callback=messages.append) == 0
+    assert any("duplicate name" in msg and "a.heic" in msg for msg in messages)
+    assert sorted(os.listdir(tmp_path)) == ["a.heic", "a.jpg"]
+    assert (tmp_path / "a.jpg").read_bytes() == before
+
+
+def test_keep_originals_moves_source(tmp_path):
+    save_image(tmp_path / "b.png", format="PNG")
+    assert ingest_images(str(tmp_path), keep_originals=True, log_callback=lambda m: None) == 1
+    assert sorted(os.listdir(tmp_path)) == ["b.jpg", ORIGINALS_DIRNAME]
+    assert os.listdir(tmp_path / ORIGINALS_DIRNAME) == ["b.png"]
+
+
+def test_without_keep_originals_source_is_removed(tmp_path):
+    save_image(tmp_path / "b.png", format="PNG")
+    assert ingest_images(str(tmp_path), keep_originals=False, log_callback=lambda m: None) == 1
+    assert os.listdir(tmp_path) == ["b.jpg"]
+
+
+def test_exif_rotation_and_resize_to_output_folder(tmp_path):
+    # orientation 6 = หมุน 90 องศาตามเข็ม: ภาพ 400x300 กลายเป็นแนวตั้ง แล้วย่อด้านยาวเหลือ 200
+    source, output = tmp_path / "raw", tmp_path / "out"
+    source.mkdir()
+    save_image(source / "c.jpg", size=(400, 300), orientation=6)
+    original = (source / "c.jpg").read_bytes()
+    assert ingest_images(str(source), str(output), max_long_edge=200, log_callback=lambda m: None) == 1
+    with Image.open(output / "c.jpg") as image:
+        assert image.size == (150, 200)
+        assert image.getexif().get(0x0112, 1) == 1
+        # ครึ่งซ้ายสีแดงเดิมหมุนไปอยู่ด้านบน
+        top, bottom = image.getpixel((75, 20)), image.getpixel((75, 180))
+        assert top[0] > 200 and top[2] < 60 and bottom[2] > 200 and bottom[0] < 60
+    # โฟลเดอร์ปลายทางแยก: ไม่แก้ไขต้นฉบับ และรันซ้ำจะข้ามภาพที่แปลงแล้ว
+    assert (source / "c.jpg").read_bytes() == original
+    assert ingest_images(str(source), str(output), max_long_edge=200, log_callback=lambda m: None) == 0
@@ -0,0 +1,53 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+import generate_synthetic_functional
+from generate_synthetic_functional import (
+    generate_synthetic_dataset, iter_synthetic_samples, encode_synthetic_sample, sample_key,
+)
+from run_manifest_functional import load_run_manifest, RUN_MANIFEST_NAME
+
+
+def as_json(value):
+    # รูปแบบเดียวกับที่ run manifest บันทึก (tuple เป็น list, ค่า NumPy เป็นข้อความ)
+    return json.loads(json.dumps(value, default=str))
+
+
+def test_indices_subset_is_lazy_and_matches_writer(synthetic_assets, tmp_path, monkeypatch):
+    backgrounds_path, features_path = synthetic_assets
+    options = dict(seed=13, objects_per_image=(1, 2), log_callback=lambda m: None)
+    output, annotations = str(tmp_path / "out"), str(tmp_path / "ann")
+    generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, 8, **options)
+    _, records = load_run_manifest(os.path.join(output, RUN_MANIFEST_NAME))
+
+    composed = []
+    compose = generate_synthetic_functional.compose_synthetic_image
+
+    def counting_compose(i, *args, **kwargs):
+        composed.append(i)
+        return compose(i, *args, **kwargs)
+
+    monkeypatch.setattr(generate_synthetic_functional, "compose_synthetic_image", counting_compose)
+    samples = iter_synthetic_samples(backgrounds_path, features_path, indices=[6, 2, 7], **options)
+    # ยังไม่สร้างภาพจนกว่าจะขอ และสร้างทีละภาพตามที่ขอ
+    assert composed == []
+    first = next(samples)
+    assert composed == [6]
+    received = [first, *samples]
+    assert composed == [6, 2, 7]
+
+    for image, boxes, metadata in received:
+        index = metadata["index"]
+        # metadata และ boxes ตรงกับที่ขั้นเขียนไฟล์ได้รับ (บันทึกใน run manifest)
+        assert as_json(metadata) == records[index]["metadata"]
+        assert as_json(boxes) == records[index]["boxes"]
+        # ภาพเดียวกับไฟล์ที่เขียนหลังเข้ารหัส JPEG
+        key, members = encode_synthetic_sample(image, boxes, metadata)
+        assert key == sample_key(index)
+        written = cv2.imread(os.path.join(output, f"{key}.jpg"))
+        assert np.array_equal(cv2.imdecode(np.frombuffer(members["jpg"], np.uint8), cv2.IMREAD_COLOR), written)
+        with open(os.path.join(annotations, f"{key}.txt"), "rb") as f:
+            assert members["txt"] == f.read()
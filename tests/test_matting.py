@@ -0,0 +1,31 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+from matting_functional import matting_cutout
+
+
+def make_border_object(size=(240, 320)):
+    # วัตถุขอบนุ่มที่ชิดขอบซ้ายของภาพ (บาง tile มีแต่ขอบนุ่ม ไม่มี foreground/background ที่แน่ใจ)
+    rng = np.random.default_rng(0)
+    height, width = size
+    image = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    mask = np.zeros(size, np.uint8)
+    cv2.ellipse(mask, (width // 8, height // 2), (width // 4, height // 4), 0, 0, 360, 255, -1)
+    mask = cv2.GaussianBlur(mask, (31, 31), 0)
+    return Image.fromarray(image), Image.fromarray(mask)
+
+
+def alpha_of(cutout):
+    return np.asarray(cutout)[:, :, 3].astype(np.float64)
+
+
+def test_band_tier_mattes_object_touching_border():
+    image, mask = make_border_object()
+    options = {"tile_size": 64, "tile_margin": 8}
+    none = alpha_of(matting_cutout(image, mask, "none", **options))
+    band = alpha_of(matting_cutout(image, mask, "band", **options))
+    full = alpha_of(matting_cutout(image, mask, "full", **options))
+    # band ต้องทำ matting จริง (ไม่ตกไปใช้ mask ทั้งภาพ) และใกล้เคียง full มากกว่า none
+    assert np.abs(band - none).mean() > 0.1
+    assert np.abs(band - full).mean() < 0.25 * np.abs(none - full).mean()
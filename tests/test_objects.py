@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from generate_synthetic_functional import visible_box, box_iou, sample_object_count, placed_object
+
+
+def square(size, x, y, alpha=255):
+    # วัตถุสี่เหลี่ยมทึบขนาด size x size ที่ตำแหน่ง (x, y)
+    sprite = np.zeros((size, size, 4), np.uint8)
+    sprite[:, :, 3] = alpha
+    return placed_object(sprite, x, y)
+
+
+def test_visible_box_partly_hidden():
+    # วัตถุที่วางทีหลังบังครึ่งขวา: เหลือเฉพาะครึ่งซ้าย
+    objects = [square(20, 0, 0), square(20, 10, 0)]
+    assert visible_box(objects, 0) == (0, 0, 10, 20)
+    # วัตถุบนสุดไม่มีอะไรบัง
+    assert visible_box(objects, 1) == (10, 0, 20, 20)
+
+
+def test_visible_box_fully_hidden():
+    objects = [square(10, 5, 5), square(30, 0, 0)]
+    assert visible_box(objects, 0) is None
+
+
+def test_visible_box_semi_transparent_and_separate():
+    # วัตถุโปร่งแสงครึ่งหนึ่งยังมองเห็นวัตถุข้างล่าง และวัตถุที่ไม่ทับกันไม่เปลี่ยนกล่อง
+    objects = [square(20, 0, 0), square(20, 0, 0, alpha=128), square(10, 50, 50)]
+    assert visible_box(objects, 0) == (0, 0, 20, 20)
+    assert visible_box(objects, 1) == (0, 0, 20, 20)
+
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (20, 20, 5, 5)) == 0.0
+    # ทับกัน 5x10 = 50 จาก union 150
+    assert box_iou((0, 0, 10, 10), (5, 0, 10, 10)) == pytest.approx(50 / 150)
+    # แตะขอบกันไม่นับเป็นการทับ และกล่องขนาดศูนย์ไม่หารด้วยศูนย์
+    assert box_iou((0, 0, 10, 10), (10, 0, 10, 10)) == 0.0
+    assert box_iou((0, 0, 0, 0), (0, 0, 0, 0)) == 0.0
+
+
+def test_sample_object_count_forms():
+    rng = np.random.default_rng(0)
+    state = rng.bit_generator.state
+    # int: ไม่ใช้ rng เลย (ภาพแบบวัตถุเดียวได้ผลเดิมทุกบิต)
+    assert sample_object_count(3, rng) == 3
+    assert rng.bit_generator.state == state
+    counts = [sample_object_count((2, 4), rng) for _ in range(500)]
+    assert set(counts) == {2, 3, 4}
+    counts = np.array([sample_object_count({1: 0.8, 5: 0.2, 9: 0.0}, rng) for _ in range(2000)])
+    assert set(counts) == {1, 5}
+    assert abs((counts == 5).mean() - 0.2) < 0.05
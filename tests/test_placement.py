@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+
+from placement_functional import render_feature, rendered_bbox
+from generate_synthetic_functional import render_placement, placed_object, get_true_bbox_from_alpha
+
+
+def make_feature(size=(120, 160)):
+    # ฟีเจอร์วงรีขอบนุ่มบน canvas โปร่งใส พร้อม hull ของพิกเซลที่มองเห็น
+    feature = np.zeros((size[0], size[1], 4), np.uint8)
+    feature[:, :, :3] = 200
+    alpha = np.zeros(size, np.uint8)
+    cv2.ellipse(alpha, (size[1] // 2, size[0] // 2), (size[1] // 3, size[0] // 4), 20, 0, 360, 255, -1)
+    feature[:, :, 3] = cv2.GaussianBlur(alpha, (9, 9), 0)
+    hull = cv2.convexHull(cv2.findNonZero(feature[:, :, 3])).reshape(-1, 2)
+    return feature, hull
+
+
+def sample_params(count=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(rng.uniform(0.3, 1.5), rng.uniform(0, 360)) for _ in range(count)]
+
+
+def test_rendered_bbox_contains_alpha_bbox():
+    # กล่องจาก hull ใช้ตัดภาพ จึงต้องครอบวัตถุทั้งหมดเสมอ (ใหญ่กว่าได้)
+    feature, hull = make_feature()
+    for scale, angle in sample_params():
+        ax, ay, aw, ah = get_true_bbox_from_alpha(render_feature(feature, scale, angle))
+        hx, hy, hw, hh = rendered_bbox(hull, feature.shape, scale, angle)
+        assert hx <= ax and hy <= ay and hx + hw >= ax + aw and hy + hh >= ay + ah, (scale, angle)
+
+
+def test_placed_object_box_matches_alpha_scan():
+    # label ของวัตถุที่ตัดตาม hull ต้องเท่ากับการสแกน alpha ของภาพที่ render เต็ม canvas
+    feature, hull = make_feature()
+    for scale, angle in sample_params():
+        sprite, x, y = render_placement(feature, scale, angle, 100, 50, hull=hull)
+        ax, ay, aw, ah = get_true_bbox_from_alpha(render_feature(feature, scale, angle))
+        assert placed_object(sprite, x, y)["box"] == (100 + ax, 50 + ay, aw, ah), (scale, angle)
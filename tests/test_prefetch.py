@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from prefetch_functional import prefetch_iter, get_prefetch_stats, reset_prefetch_stats
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    reset_prefetch_stats()
+    yield
+    reset_prefetch_stats()
+
+
+def test_order_is_preserved():
+    # งานที่มาก่อนโหลดช้ากว่างานหลัง แต่ต้องได้ลำดับเดิม
+    loaded = []
+
+    def load(i):
+        time.sleep(0.02 * (i % 3 == 0))
+        loaded.append(i)
+
+    assert list(prefetch_iter(range(12), load, depth=4, threads=3)) == list(range(12))
+    assert sorted(loaded) == list(range(12))
+    assert get_prefetch_stats()["prefetched"] == 12
+    # depth = 0 ไม่โหลดล่วงหน้าเลย
+    assert list(prefetch_iter(range(3), load, depth=0)) == [0, 1, 2]
+    assert get_prefetch_stats()["prefetched"] == 12
+
+
+def test_producer_exception_propagates():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("broken source")
+
+    received = []
+    with pytest.raises(RuntimeError, match="broken source"):
+        for item in prefetch_iter(items(), lambda i: None, depth=4):
+            received.append(item)
+    # ลำดับที่ได้มาก่อน error ไม่หายไป
+    assert received == [1, 2]
+
+
+def test_load_errors_are_counted_not_raised():
+    def load(i):
+        if i == 1:
+            raise ValueError("bad image")
+
+    assert list(prefetch_iter(range(3), load, depth=2)) == [0, 1, 2]
+    assert get_prefetch_stats()["errors"] == 1
+
+
+def test_stall_counters():
+    # โหลดช้ากว่าผู้ใช้: ทุกลำดับต้องรอ
+    list(prefetch_iter(range(4), lambda i: time.sleep(0.05), depth=2, threads=1))
+    stats = get_prefetch_stats()
+    assert stats["stalls"] == 4 and stats["stall_seconds"] >= 0.1
+    # ผู้ใช้ช้ากว่าการโหลด: ลำดับหลังจากลำดับแรกไม่ต้องรอ
+    reset_prefetch_stats()
+    for i in prefetch_iter(range(4), lambda i: None, depth=2, threads=1):
+        time.sleep(0.05)
+    stats = get_prefetch_stats()
+    assert stats["stalls"] <= 1 and stats["prefetched"] == 4
@@ -0,0 +1,53 @@
+import pytest
+
+# ต้องมี onnx (สร้างโมเดลทดสอบ), onnxruntime และ rembg
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("rembg")
+from onnx import helper, TensorProto
+
+from rembg_session_functional import get_rembg_session, clear_rembg_sessions
+
+
+@pytest.fixture
+def tiny_model(tmp_path, monkeypatch):
+    # rembg รุ่นใหม่รับ model_path เฉพาะในโฟลเดอร์โมเดลของตัวเอง จึงชี้ U2NET_HOME มาที่โฟลเดอร์ชั่วคราว
+    monkeypatch.setenv("U2NET_HOME", str(tmp_path))
+    # โมเดล ONNX เล็กที่สุด (Identity) รับ/คืนภาพขนาดเดียวกับ u2net แทนการดาวน์โหลดโมเดลจริง
+    shape = [1, 3, 320, 320]
+    graph = helper.make_graph(
+        [helper.make_node("Identity", ["input.1"], ["output"])], "tiny",
+        [helper.make_tensor_value_info("input.1", TensorProto.FLOAT, shape)],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, shape)],
+    )
+    # IR version ต่ำพอให้ onnxruntime รุ่นเก่ากว่า onnx โหลดได้
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8)
+    path = tmp_path / "tiny.onnx"
+    onnx.save(model, str(path))
+    clear_rembg_sessions()
+    yield str(path)
+    clear_rembg_sessions()
+
+
+def test_same_options_reuse_cached_session(tiny_model):
+    options = {"model_path": tiny_model, "intra_op_threads": 1, "providers": ["CPUExecutionProvider"]}
+    first = get_rembg_session("u2net_custom", **options)
+    assert get_rembg_session("u2net_custom", **options) is first
+
+
+def test_different_thread_counts_create_distinct_sessions(tiny_model):
+    one = get_rembg_session("u2net_custom", model_path=tiny_model, intra_op_threads=1)
+    two = get_rembg_session("u2net_custom", model_path=tiny_model, intra_op_threads=2)
+    assert one is not two
+    assert get_rembg_session("u2net_custom", model_path=tiny_model, intra_op_threads=2) is two
+
+
+def test_invalid_options_fail_before_loading(tiny_model, tmp_path):
+    with pytest.raises(ValueError):
+        get_rembg_session("u2net_custom")
+    with pytest.raises(ValueError):
+        get_rembg_session("u2net_custom", model_path=str(tmp_path / "missing.onnx"))
+    with pytest.raises(ValueError):
+        get_rembg_session("u2net_custom", model_path=tiny_model, intra_op_threads=-1)
+    with pytest.raises(ValueError):
+        get_rembg_session("u2net_custom", model_path=tiny_model, providers=["NoSuchExecutionProvider"])
@@ -0,0 +1,78 @@
+import os
+
+from run_manifest_functional import RunManifest, load_run_manifest, verify_file_record, RUN_MANIFEST_NAME
+from generate_synthetic_functional import generate_synthetic_dataset
+
+
+def test_run_manifest_round_trip_and_torn_last_line(tmp_path):
+    path = str(tmp_path / RUN_MANIFEST_NAME)
+    header = {"seed": 7, "fingerprint": "abc"}
+    with RunManifest(path, header, fsync_batch=2) as manifest:
+        for index in (1, 2, 3):
+            manifest.record(index, {"image": f"{index}.jpg"}, {"index": index}, [[0, 1, 2, 3, 4]])
+        # record ใหม่ของ index เดิมแทนที่ record เก่า
+        manifest.record(2, {"image": "2-again.jpg"})
+    # จำลองเครื่องดับระหว่างเขียนบรรทัดสุดท้าย
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 4, "files": {"ima')
+    loaded_header, records = load_run_manifest(path)
+    assert loaded_header == header
+    assert sorted(records) == [1, 2, 3]
+    assert records[2]["files"] == {"image": "2-again.jpg"}
+    assert records[3]["boxes"] == [[0, 1, 2, 3, 4]]
+
+
+def test_run_manifest_keep_appends(tmp_path):
+    path = str(tmp_path / RUN_MANIFEST_NAME)
+    with RunManifest(path, {"seed": 1}) as manifest:
+        manifest.record(1, {})
+    with RunManifest(path, {"seed": 1}, keep={1}) as manifest:
+        assert manifest.indices == {1}
+        manifest.record(2, {})
+    header, records = load_run_manifest(path)
+    assert header == {"seed": 1} and sorted(records) == [1, 2]
+    assert load_run_manifest(str(tmp_path / "missing.jsonl")) == (None, {})
+
+
+def test_verify_file_record_rejects_truncated_jpeg(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"\xff\xd8" + b"\x00" * 100 + b"\xff\xd9")
+    (tmp_path / "a.txt").write_text("0 0.5 0.5 0.1 0.1\n")
+    record = {"files": {"image": "a.jpg", "image_size": 104, "annotation": "a.txt", "annotation_size": 18}}
+    assert verify_file_record(record, str(tmp_path), str(tmp_path))
+    with open(tmp_path / "a.jpg", "r+b") as f:
+        f.truncate(60)
+    assert not verify_file_record(record, str(tmp_path), str(tmp_path))
+    # ขนาดตรงแต่ไม่มี EOI (เขียนไม่ครบแต่จองพื้นที่ไว้แล้ว)
+    (tmp_path / "a.jpg").write_bytes(b"\xff\xd8" + b"\x00" * 102)
+    assert not verify_file_record(record, str(tmp_path), str(tmp_path))
+
+
+def test_resume_skips_completed_and_extends_count(synthetic_assets, tmp_path):
+    backgrounds_path, features_path = synthetic_assets
+    output, annotations = str(tmp_path / "out"), str(tmp_path / "ann")
+
+    def run(num_images, **kwargs):
+        messages = []
+        generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, num_images,
+                                   log_callback=messages.append, **kwargs)
+        return "".join(messages)
+
+    run(6, seed=3)
+    reference = {name: open(os.path.join(output, name), "rb").read() for name in os.listdir(output)}
+    # ลบภาพหนึ่งภาพและทำให้อีกภาพเขียนไม่ครบ แล้วทำต่อด้วยจำนวนภาพที่เพิ่มขึ้น (seed เดิมจาก manifest)
+    os.remove(os.path.join(output, "synthetic_image_002.jpg"))
+    with open(os.path.join(output, "synthetic_image_005.jpg"), "r+b") as f:
+        f.truncate(100)
+    before = {name: os.path.getmtime(os.path.join(output, name)) for name in ("synthetic_image_001.jpg", "synthetic_image_003.jpg")}
+    log = run(9, resume=True)
+    assert "ข้าม 4 ภาพ" in log and "seed เดิม" in log
+    for name, data in reference.items():
+        if name.endswith(".jpg"):
+            assert open(os.path.join(output, name), "rb").read() == data, name
+    assert {name: os.path.getmtime(os.path.join(output, name)) for name in before} == before
+    assert sorted(name for name in os.listdir(output) if name.endswith(".jpg")) == [
+        f"synthetic_image_{i:03d}.jpg" for i in range(1, 10)]
+    _, records = load_run_manifest(os.path.join(output, RUN_MANIFEST_NAME))
+    assert sorted(records) == list(range(1, 10))
+    # รันซ้ำเมื่อเสร็จหมดแล้ว: ไม่มีภาพให้สร้างและแจ้งใน log
+    assert "ไม่มีภาพที่ต้องสร้าง" in run(9, resume=True)
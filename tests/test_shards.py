@@ -0,0 +1,70 @@
+import os
+
+from shard_functional import (
+    ShardWriter, recover_shards, iter_shard_samples, read_shard_sample, load_shard_index, list_shards,
+    export_shards_to_yolo, SHARD_INDEX_SUFFIX,
+)
+from generate_synthetic_functional import generate_synthetic_dataset
+
+
+def make_samples(count):
+    # ภาพขนาดต่างกัน (ขนาดไม่ลงตัวกับบล็อก 512 ไบต์ของ tar) พร้อม label
+    return {f"synthetic_image_{i:03d}": {"jpg": bytes([i]) * (300 + 97 * i), "txt": f"0 0.5 0.5 0.{i} 0.1\n".encode()}
+            for i in range(1, 11)}
+
+
+def write_shards(shard_dir, samples, max_shard_bytes=2048):
+    with ShardWriter(str(shard_dir), max_shard_bytes=max_shard_bytes) as writer:
+        for key, members in samples.items():
+            writer.add(key, members)
+    return writer.shard_paths
+
+
+def test_index_offsets_read_back(tmp_path):
+    samples = make_samples(10)
+    shard_paths = write_shards(tmp_path, samples)
+    assert len(shard_paths) > 1
+    found = {}
+    for shard_path in shard_paths:
+        index = load_shard_index(shard_path)
+        for key in index:
+            found[key] = read_shard_sample(shard_path, key, index)
+    assert found == samples
+    # การอ่านแบบ streaming ได้ sample เดียวกันตามลำดับที่เขียน
+    assert dict(iter_shard_samples(str(tmp_path))) == samples
+
+
+def test_recover_shards_drops_truncated_shard(tmp_path):
+    samples = make_samples(10)
+    shard_paths = write_shards(tmp_path, samples)
+    # จำลองการหยุดระหว่างเขียน shard สุดท้าย: tar ถูกตัดและยังไม่มี index
+    last = shard_paths[-1]
+    lost = set(load_shard_index(last))
+    os.remove(last + SHARD_INDEX_SUFFIX)
+    with open(last, "r+b") as f:
+        f.truncate(os.path.getsize(last) // 2)
+    keys, next_shard = recover_shards(str(tmp_path))
+    assert keys == set(samples) - lost
+    assert next_shard == len(shard_paths) - 1
+    assert list_shards(str(tmp_path)) == shard_paths[:-1]
+
+
+def test_export_shards_to_yolo(tmp_path):
+    samples = make_samples(10)
+    write_shards(tmp_path / "shards", samples)
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    assert export_shards_to_yolo(str(tmp_path / "shards"), str(images), str(labels), log_callback=lambda m: None) == 10
+    for key, members in samples.items():
+        assert (images / f"{key}.jpg").read_bytes() == members["jpg"]
+        assert (labels / f"{key}.txt").read_bytes() == members["txt"]
+
+
+def test_fresh_run_removes_old_shards(synthetic_assets, tmp_path):
+    # รันใหม่ด้วย seed อื่นและจำนวนภาพน้อยกว่า ต้องไม่เหลือ shard ของการรันก่อน
+    backgrounds_path, features_path = synthetic_assets
+    output, annotations = str(tmp_path / "out"), str(tmp_path / "ann")
+    options = {"output_format": "shards", "shard_max_bytes": 4096, "log_callback": lambda m: None}
+    generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, 12, seed=1, **options)
+    assert len(list_shards(output)) > 1
+    generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, 3, seed=2, **options)
+    assert [key for key, _ in iter_shard_samples(output)] == [f"synthetic_image_{i:03d}" for i in range(1, 4)]
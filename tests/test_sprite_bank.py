@@ -0,0 +1,86 @@
+import os
+
+import cv2
+import numpy as np
+
+from sprite_bank_functional import (
+    build_sprite_bank, load_sprite_bank, nearest_sprite_entry, sprite_pixels, sprite_grid,
+    SPRITE_INDEX_DTYPE, SPRITE_SCALE_STEP,
+)
+from placement_functional import render_feature
+
+
+def write_feature(path):
+    # วงรีทึบบน canvas โปร่งใส (พื้นที่ alpha แปรตาม scale ยกกำลังสอง ไม่ขึ้นกับมุม)
+    feature = np.zeros((80, 120, 4), np.uint8)
+    feature[:, :, :3] = (30, 160, 220)
+    alpha = np.zeros((80, 120), np.uint8)
+    cv2.ellipse(alpha, (60, 40), (50, 25), 0, 0, 360, 255, -1)
+    feature[:, :, 3] = alpha
+    cv2.imwrite(str(path), feature)
+    return feature
+
+
+def test_nearest_entry_picks_nearest_cell_with_angle_wrap():
+    scales, angles = sprite_grid()
+    index = np.zeros(len(scales) * len(angles), SPRITE_INDEX_DTYPE)
+    index["scale"] = np.repeat(scales, len(angles))
+    index["angle"] = np.tile(angles, len(scales))
+    bank = {"scales": scales, "angles": angles, "index": index}
+
+    def nearest(scale, angle):
+        entry = nearest_sprite_entry(bank, scale, angle)
+        return round(float(entry["scale"]), 4), float(entry["angle"])
+
+    assert nearest(0.52, 8) == (0.5, 15.0)
+    assert nearest(0.53, 7) == (0.55, 0.0)
+    # มุมใกล้ 360 และมุมติดลบวนกลับไปที่ 0
+    assert nearest(0.6, 355) == (0.6, 0.0)
+    assert nearest(0.6, -7) == (0.6, 0.0)
+    assert nearest(0.6, 346) == (0.6, 345.0)
+    assert nearest(0.6, 725) == (0.6, 0.0)
+    # scale นอกช่วงใช้ขอบของ grid
+    assert nearest(0.1, 90) == (round(float(scales[0]), 4), 90.0)
+    assert nearest(2.0, 90) == (round(float(scales[-1]), 4), 90.0)
+
+
+def test_sprite_pixels_match_direct_render(tmp_path):
+    feature_path = tmp_path / "feature_001.png"
+    feature = write_feature(feature_path)
+    bank_dir = str(tmp_path / ".sprite_bank")
+    bank = load_sprite_bank(str(feature_path), bank_dir)
+    scales, angles = bank["scales"], bank["angles"]
+    for si, ai in [(0, 0), (3, 5), (len(scales) - 1, len(angles) - 1)]:
+        entry = bank["index"][si * len(angles) + ai]
+        # ค่าบน grid: sprite คือส่วนที่ตัดตาม bbox ของภาพที่ render ตรงทุกบิต
+        direct = render_feature(feature, scales[si], angles[ai])
+        x, y, w, h = (int(entry[k]) for k in ("bbox_x", "bbox_y", "bbox_w", "bbox_h"))
+        assert (int(entry["width"]), int(entry["height"])) == (direct.shape[1], direct.shape[0])
+        assert np.array_equal(sprite_pixels(bank, entry), direct[y:y + h, x:x + w])
+
+    # ค่าที่ไม่อยู่บน grid: พื้นที่วัตถุต่างจากการ render ตรงไม่เกินที่ปัด scale ได้ครึ่งช่อง
+    rng = np.random.default_rng(0)
+    for scale, angle in zip(rng.uniform(0.4, 0.8, 20), rng.uniform(0, 360, 20)):
+        sprite = sprite_pixels(bank, nearest_sprite_entry(bank, scale, angle))
+        area = np.count_nonzero(sprite[:, :, 3])
+        direct_area = np.count_nonzero(render_feature(feature, scale, angle)[:, :, 3])
+        tolerance = ((scale + SPRITE_SCALE_STEP / 2) / scale) ** 2
+        assert direct_area / tolerance * 0.97 <= area <= direct_area * tolerance * 1.03, (scale, angle)
+
+
+def test_rebuilt_and_loaded_bank_match(tmp_path):
+    feature_path = tmp_path / "feature_001.png"
+    write_feature(feature_path)
+    bank_dir = str(tmp_path / ".sprite_bank")
+    atlas_path, index_path = build_sprite_bank(str(feature_path), bank_dir)
+    first = np.load(atlas_path).copy(), np.load(index_path).copy()
+    # โหลดจากไฟล์ (memory-mapped) ได้พิกเซลเดียวกับที่สร้าง
+    bank = load_sprite_bank(str(feature_path), bank_dir)
+    assert np.array_equal(np.asarray(bank["atlas"]), first[0]) and np.array_equal(bank["index"], first[1])
+    # สร้างใหม่หลังลบไฟล์ได้ผลเดิมทุกบิต
+    os.remove(atlas_path)
+    os.remove(index_path)
+    assert build_sprite_bank(str(feature_path), bank_dir) == (atlas_path, index_path)
+    assert np.array_equal(np.load(atlas_path), first[0]) and np.array_equal(np.load(index_path), first[1])
+    scales, angles = sprite_grid()
+    assert len(first[1]) == len(scales) * len(angles)
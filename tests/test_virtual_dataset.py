@@ -0,0 +1,35 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from generate_synthetic_functional import (
+    generate_synthetic_dataset, VirtualDataset, encode_synthetic_sample, yolo_annotation_line,
+)
+
+
+@pytest.mark.parametrize("use_sprite_bank", [False, True])
+def test_render_matches_written_files(synthetic_assets, tmp_path, use_sprite_bank):
+    # รันเดียวกัน (seed และพารามิเตอร์เดียวกัน) แบบเขียนไฟล์และแบบ virtual แล้วเทียบภาพที่ render กับไฟล์ที่เขียน
+    backgrounds_path, features_path = synthetic_assets
+    options = dict(seed=21, objects_per_image=(1, 3), use_sprite_bank=use_sprite_bank, log_callback=lambda m: None)
+    output, annotations = str(tmp_path / "out"), str(tmp_path / "ann")
+    generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, 8, **options)
+    virtual = str(tmp_path / "virtual")
+    generate_synthetic_dataset(backgrounds_path, features_path, virtual, virtual, 8, output_format="virtual", **options)
+
+    dataset = VirtualDataset(virtual, backgrounds_path, features_path)
+    assert list(dataset.indices) == list(range(1, 9))
+    for index in dataset.indices:
+        image, boxes, metadata = dataset.render(int(index), resolution=1)
+        key, members = encode_synthetic_sample(image, boxes, metadata)
+        written = cv2.imread(os.path.join(output, f"{key}.jpg"))
+        decoded = cv2.imdecode(np.frombuffer(members["jpg"], np.uint8), cv2.IMREAD_COLOR)
+        assert np.abs(decoded.astype(np.int16) - written).max() == 0, key
+        # label จากตาราง (ไม่ render) ตรงกับไฟล์ annotation ที่เขียน
+        with open(os.path.join(annotations, f"{key}.txt"), encoding="utf-8") as f:
+            expected = f.read()
+        labels = dataset.labels(int(index))
+        assert labels == boxes
+        assert "".join(yolo_annotation_line(*box, metadata["width"], metadata["height"]) for box in labels) == expected
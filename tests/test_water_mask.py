@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+
+from water_mask_functional import detect_water_area
+from placement_functional import sample_water_position, compute_water_integral, MIN_WATER_COVERAGE
+
+# ขนาดพื้นหลัง/ฟีเจอร์ของ test และความละเอียดของ mask ที่ใช้วาง
+BG_SIZE = (600, 800)
+FG_SIZE = (80, 80)
+MASK_SCALE = 0.25
+
+
+def make_water_background(bg_size=BG_SIZE, seed=1):
+    # พื้นสว่าง (ไม่ใช่น้ำ) มีบริเวณน้ำสีเข้มเป็นวงรีหลายวง + noise
+    rng = np.random.default_rng(seed)
+    background = np.full((bg_size[0], bg_size[1], 3), 245, np.uint8)
+    for _ in range(8):
+        center = (int(rng.integers(bg_size[1])), int(rng.integers(bg_size[0])))
+        axes = (int(rng.integers(bg_size[1] // 10, bg_size[1] // 4)), int(rng.integers(bg_size[0] // 10, bg_size[0] // 4)))
+        cv2.ellipse(background, center, axes, float(rng.uniform(0, 180)), 0, 360, (70, 60, 20), -1)
+    noise = rng.integers(-8, 9, background.shape)
+    return np.clip(background.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def full_resolution_coverages(seed, samples=300):
+    # สัดส่วนน้ำบน mask เต็มความละเอียด ใต้ฟีเจอร์ที่วางตามตำแหน่งที่สุ่มจาก mask ความละเอียดต่ำ
+    background = make_water_background(seed=seed)
+    full_integral = compute_water_integral(detect_water_area(background))
+    mask = detect_water_area(background, scale=MASK_SCALE)
+    integral = compute_water_integral(mask)
+    height, width = FG_SIZE
+    rng = np.random.default_rng(seed)
+    coverages = []
+    for _ in range(samples):
+        position = sample_water_position(mask, width, height, integral, rng=rng, image_size=(BG_SIZE[1], BG_SIZE[0]))
+        assert position is not None
+        x, y = position
+        water = full_integral[y + height, x + width] - full_integral[y, x + width] - full_integral[y + height, x] + full_integral[y, x]
+        coverages.append(water / (width * height))
+    return np.array(coverages)
+
+
+def test_low_resolution_mask_placement_error_is_bounded():
+    # ตำแหน่งคลาดได้ไม่เกินหนึ่งช่องของ mask ต่อแกน สัดส่วนน้ำจึงลดได้ไม่เกิน cell/width + cell/height
+    cell = 1 / MASK_SCALE
+    bound = MIN_WATER_COVERAGE - (cell / FG_SIZE[1] + cell / FG_SIZE[0])
+    for seed in range(3):
+        coverages = full_resolution_coverages(seed)
+        assert coverages.min() >= bound
+        # ส่วนใหญ่ยังผ่านเกณฑ์เดิมบน mask เต็มความละเอียด
+        assert np.mean(coverages >= MIN_WATER_COVERAGE) >= 0.95
@@ -0,0 +1,22 @@
+import os
+
+from generate_synthetic_functional import generate_synthetic_dataset
+
+
+def read_tree(*paths):
+    # ชื่อไฟล์ -> เนื้อไฟล์ ของทุกไฟล์ภาพและ annotation
+    return {name: open(os.path.join(path, name), "rb").read()
+            for path in paths for name in sorted(os.listdir(path)) if name.endswith((".jpg", ".txt"))}
+
+
+def test_workers_produce_identical_output(synthetic_assets, tmp_path):
+    # seed ต่อภาพมาจาก base seed และลำดับภาพ จึงต้องได้ไฟล์เดียวกันทุกบิตไม่ว่าจะใช้กี่ process
+    backgrounds_path, features_path = synthetic_assets
+    outputs = {}
+    for workers in (1, 2):
+        output, annotations = str(tmp_path / f"out{workers}"), str(tmp_path / f"ann{workers}")
+        generate_synthetic_dataset(backgrounds_path, features_path, output, annotations, 10, seed=11,
+                                   workers=workers, objects_per_image=(1, 3), log_callback=lambda m: None)
+        outputs[workers] = read_tree(output, annotations)
+    assert len(outputs[1]) == 20
+    assert outputs[1] == outputs[2]